@@ -4,10 +4,11 @@ from typing import List
 
 from sqlalchemy import and_, join, select
 
+from cache.typeahead import typeahead
 from orm.author import Author, AuthorFollower
 from orm.shout import Shout, ShoutAuthor, ShoutTopic
 from orm.topic import Topic, TopicFollower
-from services.db import local_session
+from services.db import fetch_scalars, run_in_db_pool
 from services.redis import redis
 from utils.encoders import CustomJSONEncoder
 from utils.logger import root_logger as logger
@@ -30,12 +31,16 @@ CACHE_KEYS = {
     "AUTHOR_ID": "author:id:{}",
     "AUTHOR_USER": "author:user:{}",
     "SHOUTS": "shouts:{}",
+    "SHOUT_CARD": "shout:card:{}",
 }
 
+SHOUT_CARD_TTL = 3600  # 1 час, карточка сбрасывается при изменении публикации
+
 
 # Cache topic data
 async def cache_topic(topic: dict):
     payload = json.dumps(topic, cls=CustomJSONEncoder)
+    typeahead.update_topic(topic)
     await asyncio.gather(
         redis_operation("SET", f"topic:id:{topic['id']}", payload),
         redis_operation("SET", f"topic:slug:{topic['slug']}", payload),
@@ -45,6 +50,7 @@ async def cache_topic(topic: dict):
 # Cache author data
 async def cache_author(author: dict):
     payload = json.dumps(author, cls=CustomJSONEncoder)
+    typeahead.update_author(author)
     await asyncio.gather(
         redis_operation("SET", f"author:user:{author['user'].strip()}", str(author["id"])),
         redis_operation("SET", f"author:id:{author['id']}", payload),
@@ -83,7 +89,7 @@ async def get_cached_author(author_id: int, get_with_stat):
         return json.loads(result)
     # Load from database if not found in cache
     q = select(Author).where(Author.id == author_id)
-    authors = get_with_stat(q)
+    authors = await run_in_db_pool(get_with_stat, q)
     if authors:
         author = authors[0]
         await cache_author(author.dict())
@@ -108,12 +114,10 @@ async def get_cached_topic(topic_id: int):
         return json.loads(cached_topic)
 
     # If not in cache, fetch from the database
-    with local_session() as session:
-        topic = session.execute(select(Topic).where(Topic.id == topic_id)).scalar_one_or_none()
-        if topic:
-            topic_dict = topic.dict()
-            await redis_operation("SET", topic_key, json.dumps(topic_dict, cls=CustomJSONEncoder))
-            return topic_dict
+    for topic in await fetch_scalars(select(Topic).where(Topic.id == topic_id)):
+        topic_dict = topic.dict()
+        await redis_operation("SET", topic_key, json.dumps(topic_dict, cls=CustomJSONEncoder))
+        return topic_dict
 
     return None
 
@@ -126,7 +130,7 @@ async def get_cached_topic_by_slug(slug: str, get_with_stat):
         return json.loads(result)
     # Load from database if not found in cache
     topic_query = select(Topic).where(Topic.slug == slug)
-    topics = get_with_stat(topic_query)
+    topics = await run_in_db_pool(get_with_stat, topic_query)
     if topics:
         topic_dict = topics[0].dict()
         await cache_topic(topic_dict)
@@ -144,15 +148,49 @@ async def get_cached_authors_by_ids(author_ids: List[int]) -> List[dict]:
     missing_indices = [index for index, author in enumerate(authors) if author is None]
     if missing_indices:
         missing_ids = [author_ids[index] for index in missing_indices]
-        with local_session() as session:
-            query = select(Author).where(Author.id.in_(missing_ids))
-            missing_authors = session.execute(query).scalars().all()
-            await asyncio.gather(*(cache_author(author.dict()) for author in missing_authors))
-            for index, author in zip(missing_indices, missing_authors):
-                authors[index] = author.dict()
+        missing_authors = {
+            author.id: author.dict() for author in await fetch_scalars(select(Author).where(Author.id.in_(missing_ids)))
+        }
+        await asyncio.gather(*(cache_author(author) for author in missing_authors.values()))
+        for index, author_id in zip(missing_indices, missing_ids):
+            authors[index] = missing_authors.get(author_id)
     return authors
 
 
+async def get_cached_shout_cards(shout_ids: List[int], load_cards) -> List[dict]:
+    """
+    Карточки публикаций (для выдачи поиска) одним MGET.
+
+    Args:
+        shout_ids: ID публикаций, порядок сохраняется
+        load_cards: функция загрузки недостающих карточек из БД, возвращает {id: карточка}
+
+    Returns:
+        List[dict]: карточки, None для неопубликованных и удалённых
+    """
+    if not shout_ids:
+        return []
+    keys = [CACHE_KEYS["SHOUT_CARD"].format(shout_id) for shout_id in shout_ids]
+    results = await redis.execute("MGET", *keys) or [None] * len(keys)
+    cards = [json.loads(result) if result else None for result in results]
+    missing_ids = [shout_id for shout_id, card in zip(shout_ids, cards) if card is None]
+    if missing_ids:
+        loaded = load_cards(missing_ids)
+        await asyncio.gather(
+            *(
+                redis_operation(
+                    "SETEX",
+                    CACHE_KEYS["SHOUT_CARD"].format(shout_id),
+                    value=json.dumps(card, cls=CustomJSONEncoder),
+                    ttl=SHOUT_CARD_TTL,
+                )
+                for shout_id, card in loaded.items()
+            )
+        )
+        cards = [card if card is not None else loaded.get(shout_id) for shout_id, card in zip(shout_ids, cards)]
+    return cards
+
+
 async def get_cached_topic_followers(topic_id: int):
     """
     Получает подписчиков темы по ID, используя кеш Redis.
@@ -172,19 +210,16 @@ async def get_cached_topic_followers(topic_id: int):
             logger.debug(f"Found {len(followers_ids)} cached followers for topic #{topic_id}")
             return await get_cached_authors_by_ids(followers_ids)
 
-        with local_session() as session:
-            followers_ids = [
-                f[0]
-                for f in session.query(Author.id)
-                .join(TopicFollower, TopicFollower.follower == Author.id)
-                .filter(TopicFollower.topic == topic_id)
-                .all()
-            ]
+        followers_ids = await fetch_scalars(
+            select(Author.id)
+            .join(TopicFollower, TopicFollower.follower == Author.id)
+            .where(TopicFollower.topic == topic_id)
+        )
 
-            await redis_operation("SETEX", cache_key, value=json.dumps(followers_ids), ttl=CACHE_TTL)
-            followers = await get_cached_authors_by_ids(followers_ids)
-            logger.debug(f"Cached {len(followers)} followers for topic #{topic_id}")
-            return followers
+        await redis_operation("SETEX", cache_key, value=json.dumps(followers_ids), ttl=CACHE_TTL)
+        followers = await get_cached_authors_by_ids(followers_ids)
+        logger.debug(f"Cached {len(followers)} followers for topic #{topic_id}")
+        return followers
 
     except Exception as e:
         logger.error(f"Error getting followers for topic #{topic_id}: {str(e)}")
@@ -202,17 +237,14 @@ async def get_cached_author_followers(author_id: int):
         return followers
 
     # Query database if cache is empty
-    with local_session() as session:
-        followers_ids = [
-            f[0]
-            for f in session.query(Author.id)
-            .join(AuthorFollower, AuthorFollower.follower == Author.id)
-            .filter(AuthorFollower.author == author_id, Author.id != author_id)
-            .all()
-        ]
-        await redis_operation("SET", f"author:followers:{author_id}", json.dumps(followers_ids))
-        followers = await get_cached_authors_by_ids(followers_ids)
-        return followers
+    followers_ids = await fetch_scalars(
+        select(Author.id)
+        .join(AuthorFollower, AuthorFollower.follower == Author.id)
+        .where(AuthorFollower.author == author_id, Author.id != author_id)
+    )
+    await redis_operation("SET", f"author:followers:{author_id}", json.dumps(followers_ids))
+    followers = await get_cached_authors_by_ids(followers_ids)
+    return followers
 
 
 # Get cached follower authors
@@ -223,16 +255,12 @@ async def get_cached_follower_authors(author_id: int):
         authors_ids = json.loads(cached)
     else:
         # Query authors from database
-        with local_session() as session:
-            authors_ids = [
-                a[0]
-                for a in session.execute(
-                    select(Author.id)
-                    .select_from(join(Author, AuthorFollower, Author.id == AuthorFollower.author))
-                    .where(AuthorFollower.follower == author_id)
-                ).all()
-            ]
-            await redis_operation("SET", f"author:follows-authors:{author_id}", json.dumps(authors_ids))
+        authors_ids = await fetch_scalars(
+            select(Author.id)
+            .select_from(join(Author, AuthorFollower, Author.id == AuthorFollower.author))
+            .where(AuthorFollower.follower == author_id)
+        )
+        await redis_operation("SET", f"author:follows-authors:{author_id}", json.dumps(authors_ids))
 
     authors = await get_cached_authors_by_ids(authors_ids)
     return authors
@@ -246,15 +274,12 @@ async def get_cached_follower_topics(author_id: int):
         topics_ids = json.loads(cached)
     else:
         # Load topics from database and cache them
-        with local_session() as session:
-            topics_ids = [
-                t[0]
-                for t in session.query(Topic.id)
-                .join(TopicFollower, TopicFollower.topic == Topic.id)
-                .where(TopicFollower.follower == author_id)
-                .all()
-            ]
-            await redis_operation("SET", f"author:follows-topics:{author_id}", json.dumps(topics_ids))
+        topics_ids = await fetch_scalars(
+            select(Topic.id)
+            .join(TopicFollower, TopicFollower.topic == Topic.id)
+            .where(TopicFollower.follower == author_id)
+        )
+        await redis_operation("SET", f"author:follows-topics:{author_id}", json.dumps(topics_ids))
 
     topics = []
     for topic_id in topics_ids:
@@ -289,7 +314,7 @@ async def get_cached_author_by_user_id(user_id: str, get_with_stat):
 
     # If data is not found in cache, query the database
     author_query = select(Author).where(Author.user == user_id)
-    authors = get_with_stat(author_query)
+    authors = await run_in_db_pool(get_with_stat, author_query)
     if authors:
         # Cache the retrieved author data
         author = authors[0]
@@ -322,16 +347,15 @@ async def get_cached_topic_authors(topic_id: int):
         authors_ids = json.loads(cached_authors_ids)
     else:
         # If cache is empty, get data from the database
-        with local_session() as session:
-            query = (
-                select(ShoutAuthor.author)
-                .select_from(join(ShoutTopic, Shout, ShoutTopic.shout == Shout.id))
-                .join(ShoutAuthor, ShoutAuthor.shout == Shout.id)
-                .where(and_(ShoutTopic.topic == topic_id, Shout.published_at.is_not(None), Shout.deleted_at.is_(None)))
-            )
-            authors_ids = [author_id for (author_id,) in session.execute(query).all()]
-            # Cache the retrieved author IDs
-            await redis_operation("SET", rkey, json.dumps(authors_ids))
+        query = (
+            select(ShoutAuthor.author)
+            .select_from(join(ShoutTopic, Shout, ShoutTopic.shout == Shout.id))
+            .join(ShoutAuthor, ShoutAuthor.shout == Shout.id)
+            .where(and_(ShoutTopic.topic == topic_id, Shout.published_at.is_not(None), Shout.deleted_at.is_(None)))
+        )
+        authors_ids = await fetch_scalars(query)
+        # Cache the retrieved author IDs
+        await redis_operation("SET", rkey, json.dumps(authors_ids))
 
     # Retrieve full author details from cached IDs
     if authors_ids:
@@ -429,6 +453,7 @@ async def invalidate_shout_related_cache(shout: Shout, author_id: int):
     cache_keys.update(f"topic_shouts_{t.id}" for t in shout.topics)
 
     await invalidate_shouts_cache(list(cache_keys))
+    await redis_operation("DEL", CACHE_KEYS["SHOUT_CARD"].format(shout.id))
 
 
 async def redis_operation(operation: str, key: str, value=None, ttl=None):
@@ -488,7 +513,7 @@ async def cache_by_id(entity, entity_id: int, cache_method):
     from resolvers.stat import get_with_stat
 
     caching_query = select(entity).filter(entity.id == entity_id)
-    result = get_with_stat(caching_query)
+    result = await run_in_db_pool(get_with_stat, caching_query)
     if not result or not result[0]:
         logger.warning(f"{entity.__name__} with id {entity_id} not found")
         return
@@ -0,0 +1,83 @@
+from typing import Dict, List
+
+from sqlalchemy import and_, select
+
+from orm.rating import RATING_REACTIONS
+from orm.reaction import Reaction
+from services.db import local_session
+from services.redis import redis
+from utils.logger import root_logger as logger
+
+RATES_TTL = 60 * 60 * 24  # сутки, после истечения индекс загружается заново
+RATES_KEY = "author:rates:{}"
+LOADED_FIELD = "loaded"
+
+
+def rate_field(shout_id: int, reply_to: int | None = None) -> str:
+    """Поле хэша: оценка публикации или оценка комментария."""
+    return f"comment:{reply_to}" if reply_to else f"shout:{shout_id}"
+
+
+def load_author_rates(author_id: int) -> Dict[str, str]:
+    """
+    Загружает из базы все действующие LIKE/DISLIKE автора.
+
+    :param author_id: Идентификатор автора.
+    :return: Словарь {поле хэша: вид реакции}.
+    """
+    q = select(Reaction.shout, Reaction.reply_to, Reaction.kind).where(
+        and_(
+            Reaction.created_by == author_id,
+            Reaction.deleted_at.is_(None),
+            Reaction.kind.in_(RATING_REACTIONS),
+        )
+    )
+    with local_session() as session:
+        rows = session.execute(q.order_by(Reaction.created_at)).all()
+    # более поздняя оценка перекрывает раннюю
+    return {rate_field(shout_id, reply_to): kind for shout_id, reply_to, kind in rows}
+
+
+async def store_author_rates(author_id: int, rates: Dict[str, str]):
+    """Сохраняет индекс оценок автора в Redis вместе с отметкой о загрузке."""
+    key = RATES_KEY.format(author_id)
+    flattened = [LOADED_FIELD, "1"]
+    for field, kind in rates.items():
+        flattened.extend([field, kind])
+    await redis.execute("HSET", key, *flattened)
+    await redis.execute("EXPIRE", key, RATES_TTL)
+
+
+async def get_cached_my_rates(author_id: int, fields: List[str]) -> List[str | None]:
+    """
+    Возвращает оценки автора для страницы сущностей одним HMGET.
+
+    Индекс заполняется лениво при первом обращении, без Redis ответ строится из базы.
+
+    :param author_id: Идентификатор автора.
+    :param fields: Поля хэша, см. rate_field.
+    :return: Виды реакций в порядке fields, None если оценки нет.
+    """
+    if not fields:
+        return []
+    key = RATES_KEY.format(author_id)
+    if await redis.execute("HEXISTS", key, LOADED_FIELD):
+        result = await redis.execute("HMGET", key, *fields)
+        if isinstance(result, list):
+            return result
+    rates = load_author_rates(author_id)
+    await store_author_rates(author_id, rates)
+    logger.debug(f"rates index for author#{author_id} loaded: {len(rates)}")
+    return [rates.get(field) for field in fields]
+
+
+async def cache_my_rate(author_id: int, shout_id: int, reply_to: int | None, kind: str):
+    """Обновляет индекс после новой оценки, если индекс уже загружен."""
+    key = RATES_KEY.format(author_id)
+    if await redis.execute("HEXISTS", key, LOADED_FIELD):
+        await redis.execute("HSET", key, rate_field(shout_id, reply_to), kind)
+
+
+async def uncache_my_rate(author_id: int, shout_id: int, reply_to: int | None):
+    """Убирает оценку из индекса после удаления реакции."""
+    await redis.execute("HDEL", RATES_KEY.format(author_id), rate_field(shout_id, reply_to))
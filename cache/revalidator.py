@@ -2,6 +2,7 @@ import asyncio
 
 from cache.cache import cache_author, cache_topic, get_cached_author, get_cached_topic
 from resolvers.stat import get_with_stat
+from services.db import primary_only
 from utils.logger import root_logger as logger
 
 
@@ -29,7 +30,17 @@ class CacheRevalidationManager:
             logger.error(f"An error occurred in the revalidation worker: {e}")
 
     async def process_revalidation(self):
-        """Обновление кэша для всех сущностей, требующих ревалидации."""
+        """
+        Обновление кэша для всех сущностей, требующих ревалидации.
+        Сущности отмечаются после мутаций, поэтому читаются из основной БД.
+        """
+        token = primary_only.set(True)
+        try:
+            await self.revalidate_marked()
+        finally:
+            primary_only.reset(token)
+
+    async def revalidate_marked(self):
         async with self.lock:
             # Ревалидация кэша авторов
             for author_id in self.items_to_revalidate["authors"]:
@@ -1,11 +1,13 @@
 from sqlalchemy import event
 
 from cache.revalidator import revalidation_manager
-from orm.author import Author, AuthorFollower
+from orm.author import Author, AuthorFollower, AuthorRating
 from orm.reaction import Reaction, ReactionKind
 from orm.shout import Shout, ShoutAuthor, ShoutReactionsFollower
 from orm.topic import Topic, TopicFollower
 from services.db import local_session
+from services.karma import after_author_rating_handler, after_reaction_karma_handler
+from services.search import after_shout_search_handler
 from utils.logger import root_logger as logger
 
 
@@ -128,4 +130,16 @@ def events_register():
     event.listen(Reaction, "after_update", after_reaction_handler)
     event.listen(Reaction, "after_delete", after_reaction_handler)
 
+    # проекция author_karma
+    event.listen(Reaction, "after_insert", lambda *args: after_reaction_karma_handler(*args, sign=1))
+    event.listen(Reaction, "after_update", after_reaction_karma_handler)
+    event.listen(Reaction, "after_delete", lambda *args: after_reaction_karma_handler(*args, sign=-1))
+    event.listen(AuthorRating, "after_insert", lambda *args: after_author_rating_handler(*args, sign=1))
+    event.listen(AuthorRating, "after_update", after_author_rating_handler)
+    event.listen(AuthorRating, "after_delete", lambda *args: after_author_rating_handler(*args, sign=-1))
+
+    # встроенный полнотекстовый поиск
+    event.listen(Shout, "after_insert", lambda *args: after_shout_search_handler(*args, is_insert=True))
+    event.listen(Shout, "after_update", after_shout_search_handler)
+
     logger.info("Event handlers registered successfully.")
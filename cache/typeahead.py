@@ -0,0 +1,174 @@
+import asyncio
+import heapq
+import re
+from bisect import bisect_left, insort
+from typing import Dict, List, Tuple
+
+from sqlalchemy import func, select
+
+from orm.author import Author, AuthorFollower
+from orm.topic import Topic, TopicFollower
+from services.db import local_session
+from utils.logger import root_logger as logger
+
+TYPEAHEAD_REFRESH_INTERVAL = 600  # полная перезагрузка раз в 10 минут
+TYPEAHEAD_LIMIT = 10
+
+
+def typeahead_tokens(*values) -> set:
+    """Ключи для поиска по префиксу: строка целиком и отдельные слова, в нижнем регистре."""
+    tokens = set()
+    for value in values:
+        if not value:
+            continue
+        value = value.lower().replace("ё", "е").strip()
+        tokens.add(value)
+        tokens.update(re.findall(r"\w+", value))
+    return tokens
+
+
+class TypeaheadIndex:
+    """
+    Индекс автодополнения в памяти процесса: отсортированный массив (ключ, id)
+    и карточки сущностей, бинарный поиск по префиксу и отбор top-K по числу подписчиков.
+    """
+
+    def __init__(self, fields: Tuple[str, ...]):
+        self.fields = fields
+        self.entries: List[Tuple[str, int]] = []
+        self.items: Dict[int, dict] = {}
+        self.tokens: Dict[int, set] = {}
+
+    def item_tokens(self, item: dict) -> set:
+        return typeahead_tokens(*(item.get(field) for field in self.fields))
+
+    def rebuild(self, items: List[dict]):
+        tokens = {item["id"]: self.item_tokens(item) for item in items}
+        entries = sorted((token, item_id) for item_id, item_tokens in tokens.items() for token in item_tokens)
+        # замена целиком, чтобы поиск не видел частично собранный индекс
+        self.items, self.tokens, self.entries = {item["id"]: item for item in items}, tokens, entries
+
+    def upsert(self, item: dict):
+        self.remove(item["id"])
+        tokens = self.item_tokens(item)
+        for token in tokens:
+            insort(self.entries, (token, item["id"]))
+        self.items[item["id"]] = item
+        self.tokens[item["id"]] = tokens
+
+    def remove(self, item_id: int):
+        for token in self.tokens.pop(item_id, ()):
+            i = bisect_left(self.entries, (token, item_id))
+            if i < len(self.entries) and self.entries[i] == (token, item_id):
+                del self.entries[i]
+        self.items.pop(item_id, None)
+
+    def search(self, prefix: str, limit: int = TYPEAHEAD_LIMIT) -> List[dict]:
+        prefix = prefix.lower().replace("ё", "е").strip()
+        if not prefix:
+            return []
+        found = set()
+        i = bisect_left(self.entries, (prefix, 0))
+        while i < len(self.entries) and self.entries[i][0].startswith(prefix):
+            found.add(self.entries[i][1])
+            i += 1
+        return heapq.nlargest(
+            limit, (self.items[item_id] for item_id in found), key=lambda item: item["stat"]["followers"]
+        )
+
+
+def typeahead_author(author: dict) -> dict:
+    followers = (author.get("stat") or {}).get("followers") or 0
+    fields = ("id", "user", "slug", "name", "pic")
+    return {**{field: author.get(field) for field in fields}, "stat": {"followers": followers}}
+
+
+def typeahead_topic(topic: dict) -> dict:
+    followers = (topic.get("stat") or {}).get("followers") or 0
+    return {**{field: topic.get(field) for field in ("id", "slug", "title", "pic")}, "stat": {"followers": followers}}
+
+
+def load_typeahead_items():
+    """Авторы и темы с числом подписчиков для полной перезагрузки индексов."""
+    authors_followers = (
+        select(AuthorFollower.author, func.count(AuthorFollower.follower).label("followers"))
+        .group_by(AuthorFollower.author)
+        .subquery()
+    )
+    topics_followers = (
+        select(TopicFollower.topic, func.count(TopicFollower.follower).label("followers"))
+        .group_by(TopicFollower.topic)
+        .subquery()
+    )
+    with local_session() as session:
+        authors = session.execute(
+            select(Author.id, Author.user, Author.slug, Author.name, Author.pic, authors_followers.c.followers)
+            .outerjoin(authors_followers, authors_followers.c.author == Author.id)
+            .where(Author.deleted_at.is_(None))
+        ).all()
+        topics = session.execute(
+            select(Topic.id, Topic.slug, Topic.title, Topic.pic, topics_followers.c.followers).outerjoin(
+                topics_followers, topics_followers.c.topic == Topic.id
+            )
+        ).all()
+    return (
+        [typeahead_author({**row._asdict(), "stat": {"followers": row.followers}}) for row in authors],
+        [typeahead_topic({**row._asdict(), "stat": {"followers": row.followers}}) for row in topics],
+    )
+
+
+class TypeaheadManager:
+    def __init__(self, interval=TYPEAHEAD_REFRESH_INTERVAL):
+        """Индексы авторов и тем, обновляются из кэша сразу и перезагружаются из БД каждые interval секунд."""
+        self.interval = interval
+        self.authors = TypeaheadIndex(("name", "slug"))
+        self.topics = TypeaheadIndex(("title", "slug"))
+        self.running = True
+
+    async def start(self):
+        await self.refresh()
+        self.task = asyncio.create_task(self.worker())
+
+    async def worker(self):
+        try:
+            while self.running:
+                await asyncio.sleep(self.interval)
+                await self.refresh()
+        except asyncio.CancelledError:
+            logger.info("Typeahead worker was stopped.")
+
+    async def refresh(self):
+        try:
+            authors, topics = await asyncio.to_thread(load_typeahead_items)
+            self.authors.rebuild(authors)
+            self.topics.rebuild(topics)
+            logger.info(f"Typeahead index: {len(authors)} authors, {len(topics)} topics")
+        except Exception as e:
+            logger.error(f"Typeahead index refresh failed: {e}")
+
+    def update_author(self, author: dict):
+        if author.get("deleted_at"):
+            self.authors.remove(author["id"])
+            return
+        item = typeahead_author(author)
+        if "stat" not in author and author["id"] in self.authors.items:
+            item["stat"] = self.authors.items[author["id"]]["stat"]
+        self.authors.upsert(item)
+
+    def update_topic(self, topic: dict):
+        item = typeahead_topic(topic)
+        if "stat" not in topic and topic["id"] in self.topics.items:
+            item["stat"] = self.topics.items[topic["id"]]["stat"]
+        self.topics.upsert(item)
+
+    async def stop(self):
+        self.running = False
+        if hasattr(self, "task"):
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+
+typeahead = TypeaheadManager()
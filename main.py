@@ -6,21 +6,37 @@ from os.path import exists
 
 from ariadne import load_schema_from_path, make_executable_schema
 from ariadne.asgi import GraphQL
+from ariadne.asgi.handlers import GraphQLHTTPHandler
 from starlette.applications import Starlette
 from starlette.middleware.cors import CORSMiddleware
 from starlette.requests import Request
-from starlette.responses import JSONResponse, Response
+from starlette.responses import JSONResponse, PlainTextResponse, Response
 from starlette.routing import Route
 
 from cache.precache import precache_data
 from cache.revalidator import revalidation_manager
+from cache.typeahead import typeahead
+from resolvers.reaction import reaction_coalescer
+from services.db import export_db_pool_metrics, replica_router
 from services.exception import ExceptionHandlerMiddleware
+from services.http import http_client
+from services.outbox import outbox_dispatcher
+from services.profiler import (
+    RequestProfile,
+    is_admin_request,
+    profiler_middleware,
+    queries_handler,
+    query_profiler,
+    request_profile,
+)
 from services.redis import redis
+from services.retention import notification_retention
 from services.schema import create_all_tables, resolvers
 from services.search import search_service
+from services.tracking import track_handler, view_tracker
 from services.viewed import ViewedStorage
 from services.webhook import WebhookEndpoint, create_webhook_endpoint
-from settings import DEV_SERVER_PID_FILE_NAME, MODE
+from settings import DEV_SERVER_PID_FILE_NAME, MODE, QUERY_PROFILER
 
 import_module("resolvers")
 schema = make_executable_schema(load_schema_from_path("schema/"), resolvers)
@@ -39,22 +55,44 @@ async def lifespan(_app):
     try:
         create_all_tables()
         await asyncio.gather(
+            http_client.start(),
             redis.connect(),
             precache_data(),
             ViewedStorage.init(),
             create_webhook_endpoint(),
-            search_service.info(),
+            search_service.start(),
             start(),
             revalidation_manager.start(),
+            notification_retention.start(),
+            outbox_dispatcher.start(),
+            typeahead.start(),
+            replica_router.start(),
         )
         yield
     finally:
-        tasks = [redis.disconnect(), ViewedStorage.stop(), revalidation_manager.stop()]
+        tasks = [
+            redis.disconnect(),
+            ViewedStorage.stop(),
+            revalidation_manager.stop(),
+            notification_retention.stop(),
+            reaction_coalescer.stop(),
+            outbox_dispatcher.stop(),
+            search_service.stop(),
+            typeahead.stop(),
+            view_tracker.stop(),
+            replica_router.stop(),
+        ]
         await asyncio.gather(*tasks, return_exceptions=True)
+        # клиент закрывается последним: диспетчер outbox использует его до остановки
+        await http_client.stop()
 
 
 # Создаем экземпляр GraphQL
-graphql_app = GraphQL(schema, debug=True)
+graphql_app = GraphQL(
+    schema,
+    debug=True,
+    http_handler=GraphQLHTTPHandler(middleware=[profiler_middleware] if QUERY_PROFILER else []),
+)
 
 
 # Оборачиваем GraphQL-обработчик для лучшей обработки ошибок
@@ -62,6 +100,8 @@ async def graphql_handler(request: Request):
     if request.method not in ["GET", "POST"]:
         return JSONResponse({"error": "Method Not Allowed"}, status_code=405)
 
+    profile = RequestProfile()
+    token = request_profile.set(profile)
     try:
         result = await graphql_app.handle_request(request)
         if isinstance(result, Response):
@@ -72,6 +112,17 @@ async def graphql_handler(request: Request):
     except Exception as e:
         print(f"GraphQL error: {str(e)}")
         return JSONResponse({"error": str(e)}, status_code=500)
+    finally:
+        request_profile.reset(token)
+        query_profiler.finish_request(profile)
+
+
+async def metrics_handler(request: Request):
+    # метрики раскрывают внутренние хосты и нагрузку, доступ как у /admin/queries
+    if not is_admin_request(request):
+        return JSONResponse({"error": "Forbidden"}, status_code=403)
+    metrics = http_client.export_metrics() + export_db_pool_metrics()
+    return PlainTextResponse(metrics, media_type="text/plain; version=0.0.4")
 
 
 # Обновляем маршрут в Starlette
@@ -79,6 +130,9 @@ app = Starlette(
     routes=[
         Route("/", graphql_handler, methods=["GET", "POST"]),
         Route("/new-author", WebhookEndpoint),
+        Route("/track", track_handler, methods=["POST"]),
+        Route("/metrics", metrics_handler),
+        Route("/admin/queries", queries_handler, methods=["GET", "DELETE"]),
     ],
     lifespan=lifespan,
     debug=True,
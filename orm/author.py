@@ -16,6 +16,24 @@ class AuthorRating(Base):
     plus = Column(Boolean)
 
 
+class AuthorKarma(Base):
+    """
+    Проекция рейтинга автора, обновляется инкрементально (см. services/karma.py).
+
+    rating = rating_shouts + rating_comments + rating_direct
+    """
+
+    __tablename__ = "author_karma"
+
+    id = None  # type: ignore
+    author = Column(ForeignKey("author.id"), primary_key=True)
+    rating = Column(Integer, nullable=False, default=0, index=True)
+    rating_shouts = Column(Integer, nullable=False, default=0, comment="Likes minus dislikes on shouts")
+    rating_comments = Column(Integer, nullable=False, default=0, comment="Likes minus dislikes on comments")
+    rating_direct = Column(Integer, nullable=False, default=0, comment="Direct ratings by rate_author")
+    updated_at = Column(Integer, nullable=False, default=lambda: int(time.time()))
+
+
 class AuthorFollower(Base):
     __tablename__ = "author_follower"
 
@@ -1,7 +1,7 @@
 import enum
 import time
 
-from sqlalchemy import JSON, Column, ForeignKey, Integer, String
+from sqlalchemy import JSON, Column, ForeignKey, Index, Integer, String
 from sqlalchemy.orm import relationship
 
 from orm.author import Author
@@ -43,13 +43,22 @@ class Notification(Base):
     __tablename__ = "notification"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    created_at = Column(Integer, server_default=str(int(time.time())))
+    created_at = Column(Integer, nullable=False, default=lambda: int(time.time()), index=True)
     entity = Column(String, nullable=False)
     action = Column(String, nullable=False)
     payload = Column(JSON, nullable=True)
 
+    # извлекаются из payload при записи, чтобы фильтровать без разбора JSON
+    author = Column(Integer, nullable=True, index=True, comment="Author who caused the event")
+    thread = Column(String, nullable=True, index=True, comment="Notifications thread id")
+
     seen = relationship(Author, secondary="notification_seen")
 
+    __table_args__ = (
+        Index("idx_notification_thread_created_at", "thread", "created_at"),
+        {"extend_existing": True},
+    )
+
     def set_entity(self, entity: NotificationEntity):
         self.entity = entity.value
 
@@ -61,3 +70,69 @@ class Notification(Base):
 
     def get_action(self) -> NotificationAction:
         return NotificationAction.from_string(self.action)
+
+
+class NotificationArchive(Base):
+    """
+    Архив уведомлений старше срока хранения.
+
+    Строки переносятся сюда фоновым заданием из services.retention,
+    основная таблица notification остаётся компактной.
+    """
+
+    __tablename__ = "notification_archive"
+
+    id = Column(Integer, primary_key=True)
+    created_at = Column(Integer, nullable=False, index=True)
+    entity = Column(String, nullable=False)
+    action = Column(String, nullable=False)
+    payload = Column(JSON, nullable=True)
+    author = Column(Integer, nullable=True, index=True)
+    thread = Column(String, nullable=True, index=True)
+    archived_at = Column(Integer, nullable=False, default=lambda: int(time.time()))
+
+
+def shout_thread(shout_id, reply_id=None) -> str:
+    """Тред публикации shout-<id>, тред ответов на комментарий shout-<id>::<reply_to>."""
+    return f"shout-{shout_id}::{reply_id}" if reply_id else f"shout-{shout_id}"
+
+
+def notification_thread(entity: str, payload) -> str | None:
+    """
+    Вычисляет идентификатор треда уведомления по его сущности и payload.
+
+    Совпадает с группировкой в resolvers.notifier: публикация и реакции на неё
+    делят тред shout-<id>, ответы на комментарий получают суффикс ::<reply_to>.
+    """
+    if not isinstance(payload, dict):
+        return None
+    if entity == NotificationEntity.SHOUT.value:
+        shout_id = payload.get("id")
+        return shout_thread(shout_id) if shout_id else None
+    if entity == NotificationEntity.REACTION.value:
+        shout_id = payload.get("shout")
+        if not shout_id:
+            return None
+        reply_id = payload.get("reply_to")
+        if reply_id and str(payload.get("kind", "")).lower() == "comment":
+            return shout_thread(shout_id, reply_id)
+        return shout_thread(shout_id)
+    if entity.startswith(NotificationEntity.FOLLOWER.value):
+        return "followers"
+    return None
+
+
+def notification_author(entity: str, payload) -> int | None:
+    """Возвращает id автора-инициатора события из payload."""
+    if not isinstance(payload, dict):
+        return None
+    if entity.startswith(NotificationEntity.FOLLOWER.value):
+        author_id = payload.get("id")
+    else:
+        author_id = payload.get("created_by")
+    if isinstance(author_id, dict):
+        author_id = author_id.get("id")
+    try:
+        return int(author_id) if author_id else None
+    except (TypeError, ValueError):
+        return None
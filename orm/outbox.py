@@ -0,0 +1,38 @@
+import enum
+import time
+
+from sqlalchemy import JSON, Column, Index, Integer, String
+
+from services.db import Base
+
+
+class OutboxKind(enum.Enum):
+    ADD_USER_ROLE = "add_user_role"
+
+    @classmethod
+    def from_string(cls, value):
+        return cls(value)
+
+
+class Outbox(Base):
+    """
+    Отложенные побочные эффекты, записываемые в той же транзакции, что и изменение данных.
+
+    Обрабатываются фоновым диспетчером из services/outbox.py.
+    """
+
+    __tablename__ = "outbox"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String, nullable=False)
+    payload = Column(JSON, nullable=True)
+    created_at = Column(Integer, nullable=False, default=lambda: int(time.time()))
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(Integer, nullable=False, default=lambda: int(time.time()))
+    processed_at = Column(Integer, nullable=True)
+    last_error = Column(String, nullable=True)
+
+    __table_args__ = (
+        Index("idx_outbox_pending", "processed_at", "next_attempt_at"),
+        {"extend_existing": True},
+    )
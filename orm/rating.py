@@ -14,17 +14,14 @@ PROOF_REACTIONS = [ReactionKind.PROOF.value, ReactionKind.DISPROOF.value]
 RATING_REACTIONS = [ReactionKind.LIKE.value, ReactionKind.DISLIKE.value]
 
 
+POSITIVE_REACTIONS = [ReactionKind.ACCEPT.value, ReactionKind.LIKE.value, ReactionKind.PROOF.value]
+
+NEGATIVE_REACTIONS = [ReactionKind.DISLIKE.value, ReactionKind.DISPROOF.value, ReactionKind.REJECT.value]
+
+
 def is_negative(x):
-    return x in [
-        ReactionKind.DISLIKE.value,
-        ReactionKind.DISPROOF.value,
-        ReactionKind.REJECT.value,
-    ]
+    return x in NEGATIVE_REACTIONS
 
 
 def is_positive(x):
-    return x in [
-        ReactionKind.ACCEPT.value,
-        ReactionKind.LIKE.value,
-        ReactionKind.PROOF.value,
-    ]
+    return x in POSITIVE_REACTIONS
@@ -11,12 +11,13 @@ from cache.cache import (
     get_cached_follower_authors,
     get_cached_follower_topics,
 )
+from cache.typeahead import typeahead
 from orm.author import Author
 from orm.shout import ShoutAuthor, ShoutTopic
 from orm.topic import Topic
 from resolvers.stat import get_with_stat
 from services.auth import login_required
-from services.db import local_session
+from services.db import local_session, run_in_db_pool
 from services.schema import mutation, query
 from utils.logger import root_logger as logger
 
@@ -69,7 +70,7 @@ async def get_author(_, _info, slug="", author_id=0):
         if not author_dict or not author_dict.get("stat"):
             # update stat from db
             author_query = select(Author).filter(Author.id == author_id)
-            result = get_with_stat(author_query)
+            result = await run_in_db_pool(get_with_stat, author_query)
             if result:
                 author_with_stat = result[0]
                 if isinstance(author_with_stat, Author):
@@ -85,6 +86,12 @@ async def get_author(_, _info, slug="", author_id=0):
     return author_dict
 
 
+@query.field("search_authors")
+def search_authors(_, _info, what: str, limit=10):
+    """Автодополнение авторов по префиксу имени или slug, самые популярные первыми."""
+    return typeahead.authors.search(what, min(limit or 10, 50))
+
+
 @query.field("get_author_id")
 async def get_author_id(_, _info, user: str):
     user_id = user.strip()
@@ -96,7 +103,7 @@ async def get_author_id(_, _info, user: str):
             return author
 
         author_query = select(Author).filter(Author.user == user_id)
-        result = get_with_stat(author_query)
+        result = await run_in_db_pool(get_with_stat, author_query)
         if result:
             author_with_stat = result[0]
             if isinstance(author_with_stat, Author):
@@ -148,11 +155,11 @@ async def load_authors_by(_, _info, by, limit, offset):
 
     # order
     order = by.get("order")
-    if order in ["shouts", "followers"]:
+    if order in ["shouts", "followers", "rating"]:
         authors_query = authors_query.order_by(desc(text(f"{order}_stat")))
 
     # group by
-    authors = get_with_stat(authors_query)
+    authors = await run_in_db_pool(get_with_stat, authors_query)
     return authors or []
 
 
@@ -15,7 +15,7 @@ from services.schema import mutation, query
 
 @query.field("load_shouts_bookmarked")
 @login_required
-def load_shouts_bookmarked(_, info, options):
+async def load_shouts_bookmarked(_, info, options):
     """
     Load bookmarked shouts for the authenticated user.
 
@@ -40,7 +40,7 @@ def load_shouts_bookmarked(_, info, options):
         )
     )
     q, limit, offset = apply_options(q, options, author_id)
-    return get_shouts_with_links(info, q, limit, offset)
+    return await get_shouts_with_links(info, q, limit, offset)
 
 
 @mutation.field("toggle_bookmark_shout")
@@ -1,3 +1,4 @@
+import asyncio
 import time
 
 from sqlalchemy.sql import and_
@@ -16,6 +17,7 @@ from orm.topic import Topic
 from services.auth import login_required
 from services.db import local_session
 from services.notify import notify_shout
+from services.related import update_related
 from services.schema import mutation, query
 from services.search import search_service
 from utils.logger import root_logger as logger
@@ -291,7 +293,8 @@ async def publish_shout(_, info, shout_id: int):
                 await notify_shout(shout.dict(), "published")
 
                 # Обновляем поисковый индекс
-                search_service.index(shout)
+                await search_service.index(shout)
+                asyncio.create_task(update_related(shout.id))
             else:
                 # Для уже опубликованных материалов просто отправляем уведомление об обновлении
                 await notify_shout(shout.dict(), "update")
@@ -328,8 +331,7 @@ async def unpublish_shout(_, info, shout_id: int):
             shout = session.query(Shout).filter(Shout.id == shout_id).first()
             shout.published_at = None
             session.commit()
-            invalidate_shout_related_cache(shout)
-            invalidate_shouts_cache()
+            await invalidate_shout_related_cache(shout, author_id)
 
         except Exception:
             session.rollback()
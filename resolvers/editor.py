@@ -1,3 +1,4 @@
+import asyncio
 import json
 import time
 
@@ -19,6 +20,7 @@ from resolvers.stat import get_with_stat
 from services.auth import login_required
 from services.db import local_session
 from services.notify import notify_shout
+from services.related import update_related
 from services.schema import query
 from services.search import search_service
 from utils.logger import root_logger as logger
@@ -541,7 +543,8 @@ async def update_shout(_, info, shout_id: int, shout_input=None, publish=False):
                     else:
                         await notify_shout(shout_by_id.dict(), "published")
                         # search service indexing
-                        search_service.index(shout_by_id)
+                        await search_service.index(shout_by_id)
+                        asyncio.create_task(update_related(shout_by_id.id))
                         for a in shout_by_id.authors:
                             await cache_by_id(Author, a.id, cache_author)
                     logger.info(f"shout#{shout_id} updated")
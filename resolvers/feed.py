@@ -12,7 +12,7 @@ from resolvers.reader import (
     query_with_stat,
 )
 from services.auth import login_required
-from services.db import local_session
+from services.db import fetch_scalars
 from services.schema import query
 from utils.logger import root_logger as logger
 
@@ -33,7 +33,7 @@ async def load_shouts_coauthored(_, info, options):
     q = query_with_stat(info)
     q = q.filter(Shout.authors.any(id=author_id))
     q, limit, offset = apply_options(q, options)
-    return get_shouts_with_links(info, q, limit, offset=offset)
+    return await get_shouts_with_links(info, q, limit, offset=offset)
 
 
 @query.field("load_shouts_discussed")
@@ -52,10 +52,10 @@ async def load_shouts_discussed(_, info, options):
     q = query_with_stat(info)
     options["filters"]["commented"] = True
     q, limit, offset = apply_options(q, options, author_id)
-    return get_shouts_with_links(info, q, limit, offset=offset)
+    return await get_shouts_with_links(info, q, limit, offset=offset)
 
 
-def shouts_by_follower(info, follower_id: int, options):
+async def shouts_by_follower(info, follower_id: int, options):
     """
     Загружает публикации, на которые подписан автор.
 
@@ -85,7 +85,7 @@ def shouts_by_follower(info, follower_id: int, options):
     )
     q = q.filter(Shout.id.in_(followed_subquery))
     q, limit, offset = apply_options(q, options)
-    shouts = get_shouts_with_links(info, q, limit, offset=offset)
+    shouts = await get_shouts_with_links(info, q, limit, offset=offset)
     return shouts
 
 
@@ -99,12 +99,9 @@ async def load_shouts_followed_by(_, info, slug: str, options) -> List[Shout]:
     :param options: Опции фильтрации и сортировки.
     :return: Список публикаций.
     """
-    with local_session() as session:
-        author = session.query(Author).filter(Author.slug == slug).first()
-        if author:
-            follower_id = author.dict()["id"]
-            shouts = shouts_by_follower(info, follower_id, options)
-            return shouts
+    follower_id = next(iter(await fetch_scalars(select(Author.id).where(Author.slug == slug))), None)
+    if follower_id:
+        return await shouts_by_follower(info, follower_id, options)
     return []
 
 
@@ -119,7 +116,7 @@ async def load_shouts_feed(_, info, options) -> List[Shout]:
     :return: Список публикаций.
     """
     author_id = info.context.get("author", {}).get("id")
-    return shouts_by_follower(info, author_id, options) if author_id else []
+    return await shouts_by_follower(info, author_id, options) if author_id else []
 
 
 @query.field("load_shouts_authored_by")
@@ -132,22 +129,19 @@ async def load_shouts_authored_by(_, info, slug: str, options) -> List[Shout]:
     :param options: Опции фильтрации и сортировки.
     :return: Список публикаций.
     """
-    with local_session() as session:
-        author = session.query(Author).filter(Author.slug == slug).first()
-        if author:
-            try:
-                author_id: int = author.dict()["id"]
-                q = (
-                    query_with_stat(info)
-                    if has_field(info, "stat")
-                    else select(Shout).filter(and_(Shout.published_at.is_not(None), Shout.deleted_at.is_(None)))
-                )
-                q = q.filter(Shout.authors.any(id=author_id))
-                q, limit, offset = apply_options(q, options, author_id)
-                shouts = get_shouts_with_links(info, q, limit, offset=offset)
-                return shouts
-            except Exception as error:
-                logger.debug(error)
+    author_id = next(iter(await fetch_scalars(select(Author.id).where(Author.slug == slug))), None)
+    if author_id:
+        try:
+            q = (
+                query_with_stat(info)
+                if has_field(info, "stat")
+                else select(*Shout.columns()).filter(and_(Shout.published_at.is_not(None), Shout.deleted_at.is_(None)))
+            )
+            q = q.filter(Shout.authors.any(id=author_id))
+            q, limit, offset = apply_options(q, options, author_id)
+            return await get_shouts_with_links(info, q, limit, offset=offset)
+        except Exception as error:
+            logger.debug(error)
     return []
 
 
@@ -161,22 +155,19 @@ async def load_shouts_with_topic(_, info, slug: str, options) -> List[Shout]:
     :param options: Опции фильтрации и сортировки.
     :return: Список публикаций.
     """
-    with local_session() as session:
-        topic = session.query(Topic).filter(Topic.slug == slug).first()
-        if topic:
-            try:
-                topic_id: int = topic.dict()["id"]
-                q = (
-                    query_with_stat(info)
-                    if has_field(info, "stat")
-                    else select(Shout).filter(and_(Shout.published_at.is_not(None), Shout.deleted_at.is_(None)))
-                )
-                q = q.filter(Shout.topics.any(id=topic_id))
-                q, limit, offset = apply_options(q, options)
-                shouts = get_shouts_with_links(info, q, limit, offset=offset)
-                return shouts
-            except Exception as error:
-                logger.debug(error)
+    topic_id = next(iter(await fetch_scalars(select(Topic.id).where(Topic.slug == slug))), None)
+    if topic_id:
+        try:
+            q = (
+                query_with_stat(info)
+                if has_field(info, "stat")
+                else select(*Shout.columns()).filter(and_(Shout.published_at.is_not(None), Shout.deleted_at.is_(None)))
+            )
+            q = q.filter(Shout.topics.any(id=topic_id))
+            q, limit, offset = apply_options(q, options)
+            return await get_shouts_with_links(info, q, limit, offset=offset)
+        except Exception as error:
+            logger.debug(error)
     return []
 
 
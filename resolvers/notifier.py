@@ -13,6 +13,7 @@ from orm.notification import (
     NotificationAction,
     NotificationEntity,
     NotificationSeen,
+    shout_thread,
 )
 from orm.shout import Shout
 from services.auth import login_required
@@ -66,6 +67,22 @@ def query_notifications(author_id: int, after: int = 0) -> Tuple[int, int, List[
     return total, unread, notifications
 
 
+def notification_payload(notification: Notification):
+    """
+    Возвращает payload уведомления как объект.
+
+    JSON-колонка уже отдаёт словарь, строка встречается только у старых записей.
+    """
+    payload = notification.payload
+    if isinstance(payload, (str, bytes)):
+        try:
+            payload = json.loads(payload)
+        except json.JSONDecodeError:
+            logger.error(f"notification #{notification.id} has invalid payload")
+            return {}
+    return payload
+
+
 def group_notification(thread, authors=None, shout=None, reactions=None, entity="follower", action="follow"):
     reactions = reactions or []
     authors = authors or []
@@ -115,13 +132,13 @@ def get_notifications_grouped(author_id: int, after: int = 0, limit: int = 10, o
         if (groups_amount + offset) >= limit:
             break
 
-        payload = json.loads(str(notification.payload))
+        payload = notification_payload(notification)
 
         if str(notification.entity) == NotificationEntity.SHOUT.value:
             shout = payload
             shout_id = shout.get("id")
             author_id = shout.get("created_by")
-            thread_id = f"shout-{shout_id}"
+            thread_id = shout_thread(shout_id)
             with local_session() as session:
                 author = session.query(Author).filter(Author.id == author_id).first()
                 shout = session.query(Shout).filter(Shout.id == shout_id).first()
@@ -152,9 +169,9 @@ def get_notifications_grouped(author_id: int, after: int = 0, limit: int = 10, o
                         author = author.dict()
                         shout = shout.dict()
                         reply_id = reaction.get("reply_to")
-                        thread_id = f"shout-{shout_id}"
+                        thread_id = shout_thread(shout_id)
                         if reply_id and reaction.get("kind", "").lower() == "comment":
-                            thread_id += f"{reply_id}"
+                            thread_id = shout_thread(shout_id, reply_id)
                         existing_group = groups_by_thread.get(thread_id)
                         if existing_group:
                             existing_group["seen"] = False
@@ -177,7 +194,7 @@ def get_notifications_grouped(author_id: int, after: int = 0, limit: int = 10, o
 
             elif str(notification.entity) == "follower":
                 thread_id = "followers"
-                follower = json.loads(payload)
+                follower = payload
                 group = groups_by_thread.get(thread_id)
                 if group:
                     if str(notification.action) == "follow":
@@ -273,37 +290,31 @@ async def notifications_seen_thread(_, info, thread: str, after: int):
         [shout_id, reply_to_id] = thread.split(":")
         with local_session() as session:
             # TODO: handle new follower and new shout notifications
-            new_reaction_notifications = (
+            # тред вычислен при записи уведомления, payload разбирать не нужно
+            thread_id = shout_thread(shout_id, reply_to_id)
+            removed_reaction_notifications = (
                 session.query(Notification)
                 .filter(
-                    Notification.action == "create",
+                    Notification.thread == thread_id,
+                    Notification.action == "delete",
                     Notification.entity == "reaction",
                     Notification.created_at > after,
                 )
                 .all()
             )
-            removed_reaction_notifications = (
+            exclude = {notification_payload(nr).get("id") for nr in removed_reaction_notifications}
+            new_reaction_notifications = (
                 session.query(Notification)
                 .filter(
-                    Notification.action == "delete",
+                    Notification.thread == thread_id,
+                    Notification.action == "create",
                     Notification.entity == "reaction",
                     Notification.created_at > after,
                 )
                 .all()
             )
-            exclude = set()
-            for nr in removed_reaction_notifications:
-                reaction = json.loads(str(nr.payload))
-                reaction_id = reaction.get("id")
-                exclude.add(reaction_id)
             for n in new_reaction_notifications:
-                reaction = json.loads(str(n.payload))
-                reaction_id = reaction.get("id")
-                if (
-                    reaction_id not in exclude
-                    and reaction.get("shout") == shout_id
-                    and reaction.get("reply_to") == reply_to_id
-                ):
+                if notification_payload(n).get("id") not in exclude:
                     try:
                         ns = NotificationSeen(notification=n.id, viewer=author_id)
                         session.add(ns)
@@ -1,11 +1,13 @@
-from sqlalchemy import and_, case, func, select, true
+from sqlalchemy import and_, func
 from sqlalchemy.orm import aliased
 
-from orm.author import Author, AuthorRating
+from cache.rates import get_cached_my_rates, rate_field
+from orm.author import Author, AuthorKarma, AuthorRating
 from orm.reaction import Reaction, ReactionKind
-from orm.shout import Shout
+from orm.shout import Shout, ShoutAuthor
 from services.auth import login_required
 from services.db import local_session
+from services.karma import comments_rating_query, replied_comment, shouts_rating_query
 from services.schema import mutation, query
 from utils.logger import root_logger as logger
 
@@ -31,23 +33,14 @@ async def get_my_rates_comments(_, info, comments: list[int]) -> list[dict]:
     if not author_id:
         return []  # Возвращаем пустой список вместо словаря с ошибкой
 
-    # Подзапрос для реакций текущего пользователя
-    rated_query = (
-        select(Reaction.id.label("comment_id"), Reaction.kind.label("my_rate"))
-        .where(
-            and_(
-                Reaction.reply_to.in_(comments),
-                Reaction.created_by == author_id,
-                Reaction.deleted_at.is_(None),
-                Reaction.kind.in_([ReactionKind.LIKE.value, ReactionKind.DISLIKE.value]),
-            )
-        )
-        .order_by(Reaction.shout, Reaction.created_at.desc())
-        .distinct(Reaction.shout)
-    )
-    with local_session() as session:
-        comments_result = session.execute(rated_query).all()
-        return [{"comment_id": row.comment_id, "my_rate": row.my_rate} for row in comments_result]
+    try:
+        rates = await get_cached_my_rates(author_id, [rate_field(0, comment_id) for comment_id in comments])
+        return [
+            {"comment_id": comment_id, "my_rate": my_rate} for comment_id, my_rate in zip(comments, rates) if my_rate
+        ]
+    except Exception as e:
+        logger.error(f"Error in get_my_rates_comments: {e}")
+        return []
 
 
 @query.field("get_my_rates_shouts")
@@ -62,35 +55,12 @@ async def get_my_rates_shouts(_, info, shouts):
     if not author_id:
         return []
 
-    with local_session() as session:
-        try:
-            stmt = (
-                select(Reaction)
-                .where(
-                    and_(
-                        Reaction.shout.in_(shouts),
-                        Reaction.reply_to.is_(None),
-                        Reaction.created_by == author_id,
-                        Reaction.deleted_at.is_(None),
-                        Reaction.kind.in_([ReactionKind.LIKE.value, ReactionKind.DISLIKE.value]),
-                    )
-                )
-                .order_by(Reaction.shout, Reaction.created_at.desc())
-                .distinct(Reaction.shout)
-            )
-
-            result = session.execute(stmt).all()
-
-            return [
-                {
-                    "shout_id": row[0].shout,  # Получаем shout_id из объекта Reaction
-                    "my_rate": row[0].kind,  # Получаем kind (my_rate) из объекта Reaction
-                }
-                for row in result
-            ]
-        except Exception as e:
-            logger.error(f"Error in get_my_rates_shouts: {e}")
-            return []
+    try:
+        rates = await get_cached_my_rates(author_id, [rate_field(shout_id) for shout_id in shouts])
+        return [{"shout_id": shout_id, "my_rate": my_rate} for shout_id, my_rate in zip(shouts, rates) if my_rate]
+    except Exception as e:
+        logger.error(f"Error in get_my_rates_shouts: {e}")
+        return []
 
 
 @mutation.field("rate_author")
@@ -198,140 +168,28 @@ def get_author_rating_old(session, author: Author):
 
 
 def get_author_rating_shouts(session, author: Author) -> int:
-    q = (
-        select(
-            func.coalesce(
-                func.sum(
-                    case(
-                        (Reaction.kind == ReactionKind.LIKE.value, 1),
-                        (Reaction.kind == ReactionKind.DISLIKE.value, -1),
-                        else_=0,
-                    )
-                ),
-                0,
-            ).label("shouts_rating")
-        )
-        .select_from(Reaction)
-        .outerjoin(Shout, Shout.authors.any(id=author.id))
-        .outerjoin(
-            Reaction,
-            and_(
-                Reaction.reply_to.is_(None),
-                Reaction.shout == Shout.id,
-                Reaction.deleted_at.is_(None),
-            ),
-        )
-    )
-    result = session.execute(q).scalar()
-    return result
+    row = session.execute(shouts_rating_query().where(ShoutAuthor.author == author.id)).first()
+    return int(row[1]) if row else 0
 
 
 def get_author_rating_comments(session, author: Author) -> int:
-    replied_comment = aliased(Reaction)
-    q = (
-        select(
-            func.coalesce(
-                func.sum(
-                    case(
-                        (Reaction.kind == ReactionKind.LIKE.value, 1),
-                        (Reaction.kind == ReactionKind.DISLIKE.value, -1),
-                        else_=0,
-                    )
-                ),
-                0,
-            ).label("shouts_rating")
-        )
-        .select_from(Reaction)
-        .outerjoin(
-            Reaction,
-            and_(
-                replied_comment.kind == ReactionKind.COMMENT.value,
-                replied_comment.created_by == author.id,
-                Reaction.kind.in_([ReactionKind.LIKE.value, ReactionKind.DISLIKE.value]),
-                Reaction.reply_to == replied_comment.id,
-                Reaction.deleted_at.is_(None),
-            ),
-        )
-    )
-    result = session.execute(q).scalar()
-    return result
+    row = session.execute(comments_rating_query().where(replied_comment.created_by == author.id)).first()
+    return int(row[1]) if row else 0
 
 
 def add_author_rating_columns(q, group_list):
-    # NOTE: method is not used
-
-    # old karma
-    q = q.outerjoin(AuthorRating, AuthorRating.author == Author.id)
-    q = q.add_columns(func.sum(case((AuthorRating.plus == true(), 1), else_=-1)).label("rating"))
-
-    # by shouts rating
-    shout_reaction = aliased(Reaction)
-    shouts_rating_subq = (
-        select(
-            Author.id,
-            func.coalesce(
-                func.sum(
-                    case(
-                        (shout_reaction.kind == ReactionKind.LIKE.value, 1),
-                        (shout_reaction.kind == ReactionKind.DISLIKE.value, -1),
-                        else_=0,
-                    )
-                ),
-                0,
-            ).label("shouts_rating"),
-        )
-        .select_from(shout_reaction)
-        .outerjoin(Shout, Shout.authors.any(id=Author.id))
-        .outerjoin(
-            shout_reaction,
-            and_(
-                shout_reaction.reply_to.is_(None),
-                shout_reaction.shout == Shout.id,
-                shout_reaction.deleted_at.is_(None),
-            ),
-        )
-        .group_by(Author.id)
-        .subquery()
-    )
-
-    q = q.outerjoin(shouts_rating_subq, Author.id == shouts_rating_subq.c.id)
-    q = q.add_columns(shouts_rating_subq.c.shouts_rating)
-    group_list = [shouts_rating_subq.c.shouts_rating]
+    """
+    Добавляет к запросу авторов колонки рейтинга из проекции author_karma.
 
-    # by comments
-    replied_comment = aliased(Reaction)
-    reaction_2 = aliased(Reaction)
-    comments_subq = (
-        select(
-            Author.id,
-            func.coalesce(
-                func.sum(
-                    case(
-                        (reaction_2.kind == ReactionKind.LIKE.value, 1),
-                        (reaction_2.kind == ReactionKind.DISLIKE.value, -1),
-                        else_=0,
-                    )
-                ),
-                0,
-            ).label("comments_rating"),
-        )
-        .select_from(reaction_2)
-        .outerjoin(
-            replied_comment,
-            and_(
-                replied_comment.kind == ReactionKind.COMMENT.value,
-                replied_comment.created_by == Author.id,
-                reaction_2.kind.in_([ReactionKind.LIKE.value, ReactionKind.DISLIKE.value]),
-                reaction_2.reply_to == replied_comment.id,
-                reaction_2.deleted_at.is_(None),
-            ),
-        )
-        .group_by(Author.id)
-        .subquery()
+    :param q: SQL-запрос для получения авторов.
+    :param group_list: Список колонок группировки.
+    :return: Запрос и дополненный список группировки.
+    """
+    q = q.outerjoin(AuthorKarma, AuthorKarma.author == Author.id)
+    q = q.add_columns(
+        func.coalesce(AuthorKarma.rating, 0).label("rating"),
+        func.coalesce(AuthorKarma.rating_shouts, 0).label("shouts_rating"),
+        func.coalesce(AuthorKarma.rating_comments, 0).label("comments_rating"),
     )
-
-    q = q.outerjoin(comments_subq, Author.id == comments_subq.c.id)
-    q = q.add_columns(comments_subq.c.comments_rating)
-    group_list.extend([comments_subq.c.comments_rating])
-
+    group_list = [*group_list, AuthorKarma.author]
     return q, group_list
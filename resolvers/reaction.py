@@ -1,21 +1,70 @@
+import asyncio
 import time
 
 from sqlalchemy import and_, asc, case, desc, func, select
 from sqlalchemy.orm import aliased
 
+from cache.rates import cache_my_rate, get_cached_my_rates, rate_field, uncache_my_rate
 from orm.author import Author
-from orm.rating import PROPOSAL_REACTIONS, RATING_REACTIONS, is_negative, is_positive
+from orm.outbox import OutboxKind
+from orm.rating import (
+    NEGATIVE_REACTIONS,
+    POSITIVE_REACTIONS,
+    PROPOSAL_REACTIONS,
+    RATING_REACTIONS,
+    is_negative,
+    is_positive,
+)
 from orm.reaction import Reaction, ReactionKind
 from orm.shout import Shout, ShoutAuthor
 from resolvers.follower import follow
 from resolvers.proposals import handle_proposing
 from resolvers.stat import update_author_stat
-from services.auth import add_user_role, login_required
-from services.db import local_session
+from services.auth import login_required
+from services.coalescer import WriteCoalescer
+from services.db import fetch_all, local_session
 from services.notify import notify_reaction
+from services.outbox import enqueue, outbox_dispatcher
+from services.ratelimit import RateLimiter
 from services.schema import mutation, query
+from settings import REACTION_BURST, REACTION_RATE
 from utils.logger import root_logger as logger
 
+reaction_limiter = RateLimiter("reaction", REACTION_RATE, REACTION_BURST)
+
+
+async def rating_allowed(author_id: int, kind: str) -> bool:
+    """
+    Ограничение частоты оценок автора против накруток лайков и дизлайков,
+    комментарии и цитаты не ограничиваются.
+    """
+    return kind not in RATING_REACTIONS or await reaction_limiter.allow(author_id)
+
+
+# Базовый запрос и алиас ответов создаются один раз при загрузке модуля, а не на каждый вызов
+REACTIONS_QUERY = (
+    select(
+        Reaction,
+        Author,
+        Shout,
+    )
+    .select_from(Reaction)
+    .join(Author, Reaction.created_by == Author.id)
+    .join(Shout, Reaction.shout == Shout.id)
+)
+replies = aliased(Reaction, name="replies")
+
+# Списки реакций только на чтение: колонки реакции, автора и публикации подряд, без ORM-объектов
+REACTION_ROWS_QUERY = (
+    select(*Reaction.columns(), *Author.columns(), *Shout.columns())
+    .select_from(Reaction)
+    .join(Author, Reaction.created_by == Author.id)
+    .join(Shout, Reaction.shout == Shout.id)
+)
+AUTHOR_START = len(Reaction.columns())
+SHOUT_START = AUTHOR_START + len(Author.columns())
+STAT_START = SHOUT_START + len(Shout.columns())
+
 
 def query_reactions():
     """
@@ -23,16 +72,16 @@ def query_reactions():
 
     :return: Base query.
     """
-    return (
-        select(
-            Reaction,
-            Author,
-            Shout,
-        )
-        .select_from(Reaction)
-        .join(Author, Reaction.created_by == Author.id)
-        .join(Shout, Reaction.shout == Shout.id)
-    )
+    return REACTIONS_QUERY
+
+
+def query_reaction_rows():
+    """
+    Base query for read-only reaction listings, see get_reactions_with_stat.
+
+    :return: Base query.
+    """
+    return REACTION_ROWS_QUERY
 
 
 def add_reaction_stat_columns(q):
@@ -42,24 +91,23 @@ def add_reaction_stat_columns(q):
     :param q: SQL query for reactions.
     :return: Query with added statistics columns.
     """
-    aliased_reaction = aliased(Reaction)
     # Join reactions and add statistical columns
     q = q.outerjoin(
-        aliased_reaction,
+        replies,
         and_(
-            aliased_reaction.reply_to == Reaction.id,
-            aliased_reaction.deleted_at.is_(None),
+            replies.reply_to == Reaction.id,
+            replies.deleted_at.is_(None),
         ),
     ).add_columns(
         # Count unique comments
-        func.coalesce(
-            func.count(aliased_reaction.id).filter(aliased_reaction.kind == ReactionKind.COMMENT.value), 0
-        ).label("comments_stat"),
+        func.coalesce(func.count(replies.id).filter(replies.kind == ReactionKind.COMMENT.value), 0).label(
+            "comments_stat"
+        ),
         # Calculate rating as the difference between likes and dislikes
         func.sum(
             case(
-                (aliased_reaction.kind == ReactionKind.LIKE.value, 1),
-                (aliased_reaction.kind == ReactionKind.DISLIKE.value, -1),
+                (replies.kind == ReactionKind.LIKE.value, 1),
+                (replies.kind == ReactionKind.DISLIKE.value, -1),
                 else_=0,
             )
         ).label("rating_stat"),
@@ -67,9 +115,10 @@ def add_reaction_stat_columns(q):
     return q
 
 
-def get_reactions_with_stat(q, limit, offset):
+async def get_reactions_with_stat(q, limit, offset):
     """
-    Execute the reaction query and retrieve reactions with statistics.
+    Execute the reaction query and retrieve reactions with statistics
+    without blocking the event loop.
 
     :param q: Query with reactions and statistics.
     :param limit: Number of reactions to load.
@@ -79,18 +128,21 @@ def get_reactions_with_stat(q, limit, offset):
     q = q.limit(limit).offset(offset)
     reactions = []
 
-    with local_session() as session:
-        result_rows = session.execute(q)
-        for reaction, author, shout, commented_stat, rating_stat in result_rows:
-            # Пропускаем реакции с отсутствующими shout или author
-            if not shout or not author:
-                logger.error(f"Пропущена реакция из-за отсутствия shout или author: {reaction.dict()}")
-                continue
-
-            reaction.created_by = author.dict()
-            reaction.shout = shout.dict()
-            reaction.stat = {"rating": rating_stat, "comments": commented_stat}
-            reactions.append(reaction)
+    for row in await fetch_all(q):
+        reaction = Reaction.row_dict(row)
+        author = Author.row_dict(row, AUTHOR_START)
+        shout = Shout.row_dict(row, SHOUT_START)
+        # Пропускаем реакции с отсутствующими shout или author
+        if not shout["id"] or not author["id"]:
+            logger.error(f"Пропущена реакция из-за отсутствия shout или author: {reaction}")
+            continue
+
+        reaction["created_by"] = author
+        reaction["shout"] = shout
+        if len(row) > STAT_START:
+            commented_stat, rating_stat = row[STAT_START : STAT_START + 2]
+            reaction["stat"] = {"rating": rating_stat, "comments": commented_stat}
+        reactions.append(reaction)
 
     return reactions
 
@@ -108,75 +160,69 @@ def is_featured_author(session, author_id) -> bool:
     ).scalar()
 
 
-def check_to_feature(session, approver_id, reaction) -> bool:
+def check_to_feature(session, shout_id: int, approvers: set) -> bool:
     """
     Make a shout featured if it receives more than 4 votes.
 
+    A vote counts for the approving author plus featured authors among all positive reactors,
+    so the decision does not depend on how votes are grouped into coalescing windows.
+
     :param session: Database session.
-    :param approver_id: Approver author ID.
-    :param reaction: Reaction object.
+    :param shout_id: Shout ID.
+    :param approvers: IDs of authors who liked the shout since the last check.
     :return: True if shout should be featured, else False.
     """
-    if not reaction.reply_to and is_positive(reaction.kind):
-        approvers = {approver_id}
-        # Count the number of approvers
-        reacted_readers = (
-            session.query(Reaction.created_by)
-            .filter(Reaction.shout == reaction.shout, is_positive(Reaction.kind), Reaction.deleted_at.is_(None))
-            .distinct()
-        )
-
-        for reader_id in reacted_readers:
-            if is_featured_author(session, reader_id):
-                approvers.add(reader_id)
-        return len(approvers) > 4
-    return False
+    # Count the number of approvers
+    reacted_readers = (
+        session.query(Reaction.created_by)
+        .filter(Reaction.shout == shout_id, Reaction.kind.in_(POSITIVE_REACTIONS), Reaction.deleted_at.is_(None))
+        .distinct()
+    )
+    featured_readers = {reader_id for (reader_id,) in reacted_readers if is_featured_author(session, reader_id)}
+    return any(len(featured_readers | {approver_id}) > 4 for approver_id in approvers)
 
 
-def check_to_unfeature(session, rejecter_id, reaction) -> bool:
+def check_to_unfeature(session, shout_id: int) -> bool:
     """
     Unfeature a shout if 20% of reactions are negative.
 
     :param session: Database session.
-    :param rejecter_id: Rejecter author ID.
-    :param reaction: Reaction object.
+    :param shout_id: Shout ID.
     :return: True if shout should be unfeatured, else False.
     """
-    if not reaction.reply_to and is_negative(reaction.kind):
-        total_reactions = (
-            session.query(Reaction)
-            .filter(
-                Reaction.shout == reaction.shout, Reaction.kind.in_(RATING_REACTIONS), Reaction.deleted_at.is_(None)
-            )
-            .count()
-        )
+    total_reactions = (
+        session.query(Reaction)
+        .filter(Reaction.shout == shout_id, Reaction.kind.in_(RATING_REACTIONS), Reaction.deleted_at.is_(None))
+        .count()
+    )
 
-        negative_reactions = (
-            session.query(Reaction)
-            .filter(Reaction.shout == reaction.shout, is_negative(Reaction.kind), Reaction.deleted_at.is_(None))
-            .count()
-        )
+    negative_reactions = (
+        session.query(Reaction)
+        .filter(Reaction.shout == shout_id, Reaction.kind.in_(NEGATIVE_REACTIONS), Reaction.deleted_at.is_(None))
+        .count()
+    )
 
-        return total_reactions > 0 and (negative_reactions / total_reactions) >= 0.2
-    return False
+    return total_reactions > 0 and (negative_reactions / total_reactions) >= 0.2
 
 
-async def set_featured(session, shout_id):
+def set_featured(session, shout_id):
     """
-    Feature a shout and update the author's role.
+    Feature a shout and schedule the author's role update.
+
+    The role update is written to the outbox in the same transaction
+    and dispatched in background, the request does not wait for the auth service.
+    Caller wakes up the dispatcher with outbox_dispatcher.notify().
 
     :param session: Database session.
     :param shout_id: Shout ID.
     """
     s = session.query(Shout).filter(Shout.id == shout_id).first()
     if s:
-        current_time = int(time.time())
-        s.featured_at = current_time
-        session.commit()
-        author = session.query(Author).filter(Author.id == s.created_by).first()
-        if author:
-            await add_user_role(str(author.user))
+        s.featured_at = int(time.time())
         session.add(s)
+        author = session.query(Author).filter(Author.id == s.created_by).first()
+        if author and author.user:
+            enqueue(session, OutboxKind.ADD_USER_ROLE, {"user_id": str(author.user)})
         session.commit()
 
 
@@ -191,6 +237,43 @@ def set_unfeatured(session, shout_id):
     session.commit()
 
 
+def update_featuring(ratings: dict) -> bool:
+    """
+    Recompute featuring for shouts rated during the last coalescing window.
+
+    :param ratings: {shout_id: [(author_id, kind), ...]}.
+    :return: True if some shout was featured.
+    """
+    featured = False
+    with local_session() as session:
+        for shout_id, votes in ratings.items():
+            if any(is_negative(kind) for _, kind in votes) and check_to_unfeature(session, shout_id):
+                set_unfeatured(session, shout_id)
+                continue
+            approvers = {author_id for author_id, kind in votes if is_positive(kind)}
+            if approvers and check_to_feature(session, shout_id, approvers):
+                set_featured(session, shout_id)
+                featured = True
+    return featured
+
+
+async def flush_reaction_updates(batch: dict):
+    """
+    Apply coalesced reaction side effects: one recomputation per shout and per author.
+
+    :param batch: {("shout", id): [(author_id, kind), ...], ("author", id): []}.
+    """
+    ratings = {key[1]: votes for key, votes in batch.items() if key[0] == "shout"}
+    if ratings and await asyncio.to_thread(update_featuring, ratings):
+        outbox_dispatcher.notify()
+    for key in batch:
+        if key[0] == "author":
+            update_author_stat(key[1])
+
+
+reaction_coalescer = WriteCoalescer(flush_reaction_updates, window=1.0)
+
+
 async def _create_reaction(session, shout_id: int, is_author: bool, author_id: int, reaction) -> dict:
     """
     Create a new reaction and perform related actions such as updating counters and notification.
@@ -209,18 +292,15 @@ async def _create_reaction(session, shout_id: int, is_author: bool, author_id: i
 
     # Update author stat for comments
     if r.kind == ReactionKind.COMMENT.value:
-        update_author_stat(author_id)
+        reaction_coalescer.add(("author", author_id))
 
     # Handle proposal
     if r.reply_to and r.kind in PROPOSAL_REACTIONS and is_author:
         handle_proposing(r.kind, r.reply_to, shout_id)
 
-    # Handle rating
-    if r.kind in RATING_REACTIONS:
-        if check_to_unfeature(session, author_id, r):
-            set_unfeatured(session, shout_id)
-        elif check_to_feature(session, author_id, r):
-            await set_featured(session, shout_id)
+    # Handle rating, featuring is recomputed once per shout in a coalescing window
+    if r.kind in RATING_REACTIONS and not r.reply_to:
+        reaction_coalescer.add(("shout", shout_id), (author_id, r.kind))
 
     # Notify creation
     await notify_reaction(rdict, "create")
@@ -228,37 +308,23 @@ async def _create_reaction(session, shout_id: int, is_author: bool, author_id: i
     return rdict
 
 
-def prepare_new_rating(reaction: dict, shout_id: int, session, author_id: int):
+async def prepare_new_rating(reaction: dict, shout_id: int, author_id: int):
     """
-    Check for the possibility of rating a shout.
+    Check for the possibility of rating a shout or a comment.
+
+    Uses the viewer's rates index instead of querying reactions table.
 
     :param reaction: Dictionary with reaction data.
     :param shout_id: Shout ID.
-    :param session: Database session.
     :param author_id: Author ID.
     :return: Dictionary with error or None.
     """
     kind = reaction.get("kind")
-    opposite_kind = ReactionKind.DISLIKE.value if is_positive(kind) else ReactionKind.LIKE.value
-
-    existing_ratings = (
-        session.query(Reaction)
-        .filter(
-            Reaction.shout == shout_id,
-            Reaction.created_by == author_id,
-            Reaction.kind.in_(RATING_REACTIONS),
-            Reaction.deleted_at.is_(None),
-        )
-        .all()
-    )
-
-    for r in existing_ratings:
-        if r.kind == kind:
-            return {"error": "You can't rate the same thing twice"}
-        if r.kind == opposite_kind:
-            return {"error": "Remove opposite vote first"}
-    if shout_id in [r.shout for r in existing_ratings]:
-        return {"error": "You can't rate your own thing"}
+    [my_rate] = await get_cached_my_rates(author_id, [rate_field(shout_id, reaction.get("reply_to"))])
+    if my_rate == kind:
+        return {"error": "You can't rate the same thing twice"}
+    if my_rate:
+        return {"error": "Remove opposite vote first"}
 
     return
 
@@ -285,6 +351,17 @@ async def create_reaction(_, info, reaction):
         return {"error": "Author ID is required to create a reaction."}
     if not shout_id:
         return {"error": "Shout ID is required to create a reaction."}
+    kind = reaction_input.get("kind")
+    if not await rating_allowed(author_id, kind):
+        return {"error": "Too many reactions, try again later"}
+
+    # handle ratings before opening a session
+    if kind in RATING_REACTIONS:
+        logger.debug(f"creating rating reaction: {kind}")
+        error_result = await prepare_new_rating(reaction_input, shout_id, author_id)
+        if error_result:
+            logger.error(f"Rating preparation error: {error_result}")
+            return error_result
 
     try:
         with local_session() as session:
@@ -293,20 +370,15 @@ async def create_reaction(_, info, reaction):
                 bool(list(filter(lambda x: x == int(author_id), authors))) if isinstance(authors, list) else False
             )
             reaction_input["created_by"] = author_id
-            kind = reaction_input.get("kind")
-
-            # handle ratings
-            if kind in RATING_REACTIONS:
-                logger.debug(f"creating rating reaction: {kind}")
-                error_result = prepare_new_rating(reaction_input, shout_id, session, author_id)
-                if error_result:
-                    logger.error(f"Rating preparation error: {error_result}")
-                    return error_result
 
             # handle all reactions
             rdict = await _create_reaction(session, shout_id, is_author, author_id, reaction_input)
             logger.debug(f"Created reaction result: {rdict}")
 
+            # update viewer's rates index
+            if kind in RATING_REACTIONS:
+                await cache_my_rate(author_id, shout_id, rdict.get("reply_to"), kind)
+
             # follow if liked
             if kind == ReactionKind.LIKE.value:
                 try:
@@ -414,6 +486,8 @@ async def delete_reaction(_, info, reaction_id: int):
             # Update author stat
             if r.kind == ReactionKind.COMMENT.value:
                 update_author_stat(author.id)
+            elif r.kind in RATING_REACTIONS:
+                await uncache_my_rate(r.created_by, r.shout, r.reply_to)
 
             await notify_reaction(reaction_dict, "delete")
 
@@ -480,7 +554,7 @@ async def load_reactions_by(_, _info, by, limit=50, offset=0):
     :param offset: Pagination offset.
     :return: List of reactions.
     """
-    q = query_reactions()
+    q = query_reaction_rows()
 
     # Add statistics and apply filters
     q = add_reaction_stat_columns(q)
@@ -498,7 +572,7 @@ async def load_reactions_by(_, _info, by, limit=50, offset=0):
     q = q.order_by(order_by_stmt)
 
     # Retrieve and return reactions
-    return get_reactions_with_stat(q, limit, offset)
+    return await get_reactions_with_stat(q, limit, offset)
 
 
 @query.field("load_shout_ratings")
@@ -512,7 +586,7 @@ async def load_shout_ratings(_, info, shout: int, limit=100, offset=0):
     :param offset: Pagination offset.
     :return: List of reactions.
     """
-    q = query_reactions()
+    q = query_reaction_rows()
 
     # Filter, group, sort, limit, offset
     q = q.filter(
@@ -526,7 +600,7 @@ async def load_shout_ratings(_, info, shout: int, limit=100, offset=0):
     q = q.order_by(desc(Reaction.created_at))
 
     # Retrieve and return reactions
-    return get_reactions_with_stat(q, limit, offset)
+    return await get_reactions_with_stat(q, limit, offset)
 
 
 @query.field("load_shout_comments")
@@ -540,7 +614,7 @@ async def load_shout_comments(_, info, shout: int, limit=50, offset=0):
     :param offset: Pagination offset.
     :return: List of reactions.
     """
-    q = query_reactions()
+    q = query_reaction_rows()
 
     q = add_reaction_stat_columns(q)
 
@@ -556,7 +630,7 @@ async def load_shout_comments(_, info, shout: int, limit=50, offset=0):
     q = q.order_by(desc(Reaction.created_at))
 
     # Retrieve and return reactions
-    return get_reactions_with_stat(q, limit, offset)
+    return await get_reactions_with_stat(q, limit, offset)
 
 
 @query.field("load_comment_ratings")
@@ -570,7 +644,7 @@ async def load_comment_ratings(_, info, comment: int, limit=50, offset=0):
     :param offset: Pagination offset.
     :return: List of reactions.
     """
-    q = query_reactions()
+    q = query_reaction_rows()
 
     q = add_reaction_stat_columns(q)
 
@@ -586,4 +660,4 @@ async def load_comment_ratings(_, info, comment: int, limit=50, offset=0):
     q = q.order_by(desc(Reaction.created_at))
 
     # Retrieve and return reactions
-    return get_reactions_with_stat(q, limit, offset)
+    return await get_reactions_with_stat(q, limit, offset)
@@ -1,15 +1,18 @@
 import json
+from functools import lru_cache
 
 from graphql import GraphQLResolveInfo
 from sqlalchemy import and_, nulls_last, text
-from sqlalchemy.orm import aliased
+from sqlalchemy.orm import aliased, selectinload
 from sqlalchemy.sql.expression import asc, case, desc, func, select
 
+from cache.cache import get_cached_shout_cards
 from orm.author import Author
 from orm.reaction import Reaction, ReactionKind
 from orm.shout import Shout, ShoutAuthor, ShoutTopic
 from orm.topic import Topic
-from services.db import json_array_builder, json_builder, local_session
+from services.db import fetch_all, json_array_builder, json_builder, local_session
+from services.related import get_related_ids
 from services.schema import query
 from services.search import search_text
 from services.viewed import ViewedStorage
@@ -55,14 +58,20 @@ def has_field(info, fieldname: str) -> bool:
     return False
 
 
-def query_with_stat(info):
-    """
-    :param info: Информация о контексте GraphQL - для получения id авторизованного пользователя
-    :return: Запрос с подзапросами статистики.
+# Алиасы создаются один раз при загрузке модуля, а не при каждом построении запроса
+main_author = aliased(Author, name="main_author")
+main_topic_join = aliased(ShoutTopic, name="main_topic_join")
+main_topic = aliased(Topic, name="main_topic")
 
-    Добавляет подзапрос статистики
+
+@lru_cache(maxsize=16)
+def shouts_query(with_main_topic: bool, with_authors: bool, with_topics: bool, with_stat: bool):
     """
-    q = select(Shout).filter(
+    Запрос публикаций с подзапросами для запрошенных полей.
+    Select неизменяем, поэтому один объект на набор полей переиспользуется между запросами:
+    он не строится заново и попадает в кэш скомпилированных запросов SQLAlchemy.
+    """
+    q = select(*Shout.columns()).filter(
         and_(
             Shout.published_at.is_not(None),  # Проверяем published_at
             Shout.deleted_at.is_(None),  # Проверяем deleted_at
@@ -70,7 +79,6 @@ def query_with_stat(info):
     )
 
     # Главный автор
-    main_author = aliased(Author)
     q = q.join(main_author, main_author.id == Shout.created_by)
     q = q.add_columns(
         json_builder(
@@ -87,9 +95,7 @@ def query_with_stat(info):
         ).label("main_author")
     )
 
-    if has_field(info, "main_topic"):
-        main_topic_join = aliased(ShoutTopic)
-        main_topic = aliased(Topic)
+    if with_main_topic:
         q = q.join(main_topic_join, and_(main_topic_join.shout == Shout.id, main_topic_join.main.is_(True)))
         q = q.join(main_topic, main_topic.id == main_topic_join.topic)
         q = q.add_columns(
@@ -98,7 +104,7 @@ def query_with_stat(info):
             ).label("main_topic")
         )
 
-    if has_field(info, "authors"):
+    if with_authors:
         authors_subquery = (
             select(
                 ShoutAuthor.shout,
@@ -127,7 +133,7 @@ def query_with_stat(info):
         q = q.outerjoin(authors_subquery, authors_subquery.c.shout == Shout.id)
         q = q.add_columns(authors_subquery.c.authors)
 
-    if has_field(info, "topics"):
+    if with_topics:
         topics_subquery = (
             select(
                 ShoutTopic.shout,
@@ -143,7 +149,7 @@ def query_with_stat(info):
         q = q.outerjoin(topics_subquery, topics_subquery.c.shout == Shout.id)
         q = q.add_columns(topics_subquery.c.topics)
 
-    if has_field(info, "stat"):
+    if with_stat:
         stats_subquery = (
             select(
                 Reaction.shout,
@@ -182,36 +188,60 @@ def query_with_stat(info):
     return q
 
 
-def get_shouts_with_links(info, q, limit=20, offset=0):
+def query_with_stat(info):
+    """
+    :param info: Информация о контексте GraphQL - для получения id авторизованного пользователя
+    :return: Запрос с подзапросами статистики.
+
+    Добавляет подзапрос статистики
+    """
+    return shouts_query(
+        has_field(info, "main_topic"), has_field(info, "authors"), has_field(info, "topics"), has_field(info, "stat")
+    )
+
+
+async def get_shouts_with_links(info, q, limit=20, offset=0):
     """
-    получение публикаций с применением пагинации
+    получение публикаций с применением пагинации, запросы не блокируют цикл событий
     """
     shouts = []
     try:
         # logger.info(f"Starting get_shouts_with_links with limit={limit}, offset={offset}")
         q = q.limit(limit).offset(offset)
 
-        with local_session() as session:
-            shouts_result = session.execute(q).all()
-            # logger.info(f"Got {len(shouts_result) if shouts_result else 0} shouts from query")
-
-            if not shouts_result:
-                logger.warning("No shouts found in query result")
-                return []
-
-            for idx, row in enumerate(shouts_result):
-                try:
-                    shout = None
-                    if hasattr(row, "Shout"):
-                        shout = row.Shout
-                        # logger.debug(f"Processing shout#{shout.id} at index {idx}")
-                    if shout:
-                        shout_id = int(f"{shout.id}")
-                        shout_dict = shout.dict()
-
-                        if has_field(info, "created_by") and shout_dict.get("created_by"):
-                            main_author_id = shout_dict.get("created_by")
-                            a = session.query(Author).filter(Author.id == main_author_id).first()
+        shouts_result = await fetch_all(q)
+        # logger.info(f"Got {len(shouts_result) if shouts_result else 0} shouts from query")
+
+        if not shouts_result:
+            logger.warning("No shouts found in query result")
+            return []
+
+        # колонки публикации идут первыми в строке, словарь собирается без ORM-объекта
+        shout_dicts = [Shout.row_dict(row) for row in shouts_result]
+
+        # создатели публикаций одним запросом на страницу
+        created_by = {}
+        if has_field(info, "created_by"):
+            creators_ids = {shout_dict["created_by"] for shout_dict in shout_dicts}
+            creators = await fetch_all(
+                select(Author.id, Author.name, Author.slug, Author.pic).where(Author.id.in_(creators_ids))
+            )
+            created_by = {a.id: a for a in creators}
+
+        for idx, (row, shout_dict) in enumerate(zip(shouts_result, shout_dicts)):
+            try:
+                if shout_dict.get("id"):
+                    shout_id = shout_dict["id"]
+                    # logger.debug(f"Processing shout#{shout_id} at index {idx}")
+
+                    if has_field(info, "created_by") and shout_dict.get("created_by"):
+                        main_author_id = shout_dict.get("created_by")
+                        a = created_by.get(main_author_id)
+                        if a is None:
+                            # автор удалён или реплика ещё не получила его строку
+                            logger.warning(f"Creator #{main_author_id} of shout#{shout_id} not found")
+                            shout_dict["created_by"] = {"id": main_author_id, "name": None, "slug": "", "pic": None}
+                        else:
                             shout_dict["created_by"] = {
                                 "id": main_author_id,
                                 "name": a.name,
@@ -219,65 +249,63 @@ def get_shouts_with_links(info, q, limit=20, offset=0):
                                 "pic": a.pic,
                             }
 
-                        if has_field(info, "stat"):
-                            stat = {}
-                            if isinstance(row.stat, str):
-                                stat = json.loads(row.stat)
-                            elif isinstance(row.stat, dict):
-                                stat = row.stat
-                            viewed = ViewedStorage.get_shout(shout_id=shout_id) or 0
-                            shout_dict["stat"] = {**stat, "viewed": viewed, "commented": stat.get("comments_count", 0)}
-
-                        # Обработка main_topic и topics
-                        topics = None
-                        if has_field(info, "topics") and hasattr(row, "topics"):
-                            topics = json.loads(row.topics) if isinstance(row.topics, str) else row.topics
-                            # logger.debug(f"Shout#{shout_id} topics: {topics}")
-                            shout_dict["topics"] = topics
-
-                        if has_field(info, "main_topic"):
-                            main_topic = None
-                            if hasattr(row, "main_topic"):
-                                # logger.debug(f"Raw main_topic for shout#{shout_id}: {row.main_topic}")
-                                main_topic = (
-                                    json.loads(row.main_topic) if isinstance(row.main_topic, str) else row.main_topic
-                                )
-                                # logger.debug(f"Parsed main_topic for shout#{shout_id}: {main_topic}")
-
-                            if not main_topic and topics and len(topics) > 0:
-                                # logger.info(f"No main_topic found for shout#{shout_id}, using first topic from list")
-                                main_topic = {
-                                    "id": topics[0]["id"],
-                                    "title": topics[0]["title"],
-                                    "slug": topics[0]["slug"],
-                                    "is_main": True,
-                                }
-                            elif not main_topic:
-                                logger.warning(f"No main_topic and no topics found for shout#{shout_id}")
-                                main_topic = {"id": 0, "title": "no topic", "slug": "notopic", "is_main": True}
-                            shout_dict["main_topic"] = main_topic
-                            # logger.debug(f"Final main_topic for shout#{shout_id}: {main_topic}")
-
-                        if has_field(info, "authors") and hasattr(row, "authors"):
-                            shout_dict["authors"] = (
-                                json.loads(row.authors) if isinstance(row.authors, str) else row.authors
+                    if has_field(info, "stat"):
+                        stat = {}
+                        if isinstance(row.stat, str):
+                            stat = json.loads(row.stat)
+                        elif isinstance(row.stat, dict):
+                            stat = row.stat
+                        viewed = ViewedStorage.get_shout(shout_id=shout_id) or 0
+                        shout_dict["stat"] = {**stat, "viewed": viewed, "commented": stat.get("comments_count", 0)}
+
+                    # Обработка main_topic и topics
+                    topics = None
+                    if has_field(info, "topics") and hasattr(row, "topics"):
+                        topics = json.loads(row.topics) if isinstance(row.topics, str) else row.topics
+                        # logger.debug(f"Shout#{shout_id} topics: {topics}")
+                        shout_dict["topics"] = topics
+
+                    if has_field(info, "main_topic"):
+                        main_topic = None
+                        if hasattr(row, "main_topic"):
+                            # logger.debug(f"Raw main_topic for shout#{shout_id}: {row.main_topic}")
+                            main_topic = (
+                                json.loads(row.main_topic) if isinstance(row.main_topic, str) else row.main_topic
                             )
-
-                        if has_field(info, "media") and shout.media:
-                            # Обработка поля media
-                            media_data = shout.media
-                            if isinstance(media_data, str):
-                                try:
-                                    media_data = json.loads(media_data)
-                                except json.JSONDecodeError:
-                                    media_data = []
-                            shout_dict["media"] = [media_data] if isinstance(media_data, dict) else media_data
-
-                        shouts.append(shout_dict)
-
-                except Exception as row_error:
-                    logger.error(f"Error processing row {idx}: {row_error}", exc_info=True)
-                    continue
+                            # logger.debug(f"Parsed main_topic for shout#{shout_id}: {main_topic}")
+
+                        if not main_topic and topics and len(topics) > 0:
+                            # logger.info(f"No main_topic found for shout#{shout_id}, using first topic from list")
+                            main_topic = {
+                                "id": topics[0]["id"],
+                                "title": topics[0]["title"],
+                                "slug": topics[0]["slug"],
+                                "is_main": True,
+                            }
+                        elif not main_topic:
+                            logger.warning(f"No main_topic and no topics found for shout#{shout_id}")
+                            main_topic = {"id": 0, "title": "no topic", "slug": "notopic", "is_main": True}
+                        shout_dict["main_topic"] = main_topic
+                        # logger.debug(f"Final main_topic for shout#{shout_id}: {main_topic}")
+
+                    if has_field(info, "authors") and hasattr(row, "authors"):
+                        shout_dict["authors"] = json.loads(row.authors) if isinstance(row.authors, str) else row.authors
+
+                    if has_field(info, "media") and shout_dict.get("media"):
+                        # Обработка поля media
+                        media_data = shout_dict["media"]
+                        if isinstance(media_data, str):
+                            try:
+                                media_data = json.loads(media_data)
+                            except json.JSONDecodeError:
+                                media_data = []
+                        shout_dict["media"] = [media_data] if isinstance(media_data, dict) else media_data
+
+                    shouts.append(shout_dict)
+
+            except Exception as row_error:
+                logger.error(f"Error processing row {idx}: {row_error}", exc_info=True)
+                continue
 
     except Exception as e:
         logger.error(f"Fatal error in get_shouts_with_links: {e}", exc_info=True)
@@ -343,7 +371,7 @@ async def get_shout(_, info: GraphQLResolveInfo, slug="", shout_id=0):
             return None
 
         # Получаем результат через get_shouts_with_stats с limit=1
-        shouts = get_shouts_with_links(info, q, limit=1)
+        shouts = await get_shouts_with_links(info, q, limit=1)
 
         # Возвращаем первую (и единственную) публикацию, если она найдена
         return shouts[0] if shouts else None
@@ -386,7 +414,44 @@ async def load_shouts_by(_, info: GraphQLResolveInfo, options):
     q, limit, offset = apply_options(q, options)
 
     # Передача сформированного запроса в метод получения публикаций с учетом сортировки и пагинации
-    return get_shouts_with_links(info, q, limit, offset)
+    return await get_shouts_with_links(info, q, limit, offset)
+
+
+def load_shout_cards(shout_ids):
+    """
+    Карточки опубликованных публикаций для выдачи поиска.
+
+    :param shout_ids: Список ID публикаций.
+    :return: Словарь {id: карточка} с авторами, темами и главной темой.
+    """
+    with local_session() as session:
+        shouts = (
+            session.query(Shout)
+            .options(selectinload(Shout.authors), selectinload(Shout.topics))
+            .filter(Shout.id.in_(shout_ids), Shout.published_at.is_not(None), Shout.deleted_at.is_(None))
+            .all()
+        )
+        main_topics = dict(
+            session.query(ShoutTopic.shout, ShoutTopic.topic)
+            .filter(ShoutTopic.shout.in_(shout_ids), ShoutTopic.main.is_(True))
+            .all()
+        )
+        cards = {}
+        for shout in shouts:
+            authors = [{"id": a.id, "name": a.name, "slug": a.slug, "pic": a.pic} for a in shout.authors]
+            topics = [{"id": t.id, "title": t.title, "slug": t.slug} for t in shout.topics]
+            main_topic = next((t for t in topics if t["id"] == main_topics.get(shout.id)), None)
+            cards[shout.id] = {
+                "id": shout.id,
+                "slug": shout.slug,
+                "title": shout.title,
+                "cover": shout.cover,
+                "created_at": shout.created_at,
+                "authors": authors,
+                "topics": topics,
+                "main_topic": main_topic or (topics[0] if topics else None),
+            }
+        return cards
 
 
 @query.field("load_shouts_search")
@@ -394,41 +459,40 @@ async def load_shouts_search(_, info, text, options):
     """
     Поиск публикаций по тексту.
 
+    Пагинация выполняется только в поиске, карточки найденных публикаций
+    берутся из кэша в порядке релевантности.
+
     :param _: Корневой объект запроса (не используется)
     :param info: Информация о контексте GraphQL
     :param text: Строка поиска.
-    :param options: Опции фильтрации и сортировки.
-    :return: Список публикаций, найденных по тексту.
+    :param options: Опции пагинации.
+    :return: Список публикаций, найденных по тексту, с полем score.
     """
     limit = options.get("limit", 10)
     offset = options.get("offset", 0)
     if isinstance(text, str) and len(text) > 2:
         results = await search_text(text, limit, offset)
-        scores = {}
-        hits_ids = []
-        for sr in results:
-            shout_id = sr.get("id")
-            if shout_id:
-                shout_id = str(shout_id)
-                scores[shout_id] = sr.get("score")
-                hits_ids.append(shout_id)
-
-        q = (
-            query_with_stat(info)
-            if has_field(info, "stat")
-            else select(Shout).filter(and_(Shout.published_at.is_not(None), Shout.deleted_at.is_(None)))
-        )
-        q = q.filter(Shout.id.in_(hits_ids))
-        q = apply_filters(q, options)
-        q = apply_sorting(q, options)
-        shouts = get_shouts_with_links(info, q, limit, offset)
-        for shout in shouts:
-            shout.score = scores[f"{shout.id}"]
-        shouts.sort(key=lambda x: x.score, reverse=True)
-        return shouts
+        scores = {int(sr["id"]): sr.get("score") for sr in results if sr.get("id")}
+        cards = await get_cached_shout_cards(list(scores), load_shout_cards)
+        return [{**card, "score": scores[card["id"]]} for card in cards if card]
     return []
 
 
+@query.field("load_shouts_related")
+async def load_shouts_related(_, _info, shout_id: int, limit=10):
+    """
+    Похожие публикации из предвычисленных соседей.
+
+    :param shout_id: ID публикации.
+    :param limit: Количество публикаций.
+    :return: Карточки публикаций с оценкой близости в поле score.
+    """
+    neighbours = await get_related_ids(shout_id, min(limit or 10, 30))
+    scores = dict(neighbours)
+    cards = await get_cached_shout_cards(list(scores), load_shout_cards)
+    return [{**card, "score": scores[card["id"]]} for card in cards if card]
+
+
 @query.field("load_shouts_unrated")
 async def load_shouts_unrated(_, info, options):
     """
@@ -451,7 +515,7 @@ async def load_shouts_unrated(_, info, options):
         .scalar_subquery()
     )
 
-    q = select(Shout).where(and_(Shout.published_at.is_not(None), Shout.deleted_at.is_(None)))
+    q = select(*Shout.columns()).where(and_(Shout.published_at.is_not(None), Shout.deleted_at.is_(None)))
     q = q.join(Author, Author.id == Shout.created_by)
     q = q.add_columns(
         json_builder("id", Author.id, "name", Author.name, "slug", Author.slug, "pic", Author.pic).label("main_author")
@@ -464,7 +528,7 @@ async def load_shouts_unrated(_, info, options):
 
     limit = options.get("limit", 5)
     offset = options.get("offset", 0)
-    return get_shouts_with_links(info, q, limit, offset)
+    return await get_shouts_with_links(info, q, limit, offset)
 
 
 @query.field("load_shouts_random_top")
@@ -504,4 +568,4 @@ async def load_shouts_random_top(_, info, options):
     q = q.filter(Shout.id.in_(subquery))
     q = q.order_by(func.random())
     limit = options.get("limit", 10)
-    return get_shouts_with_links(info, q, limit)
+    return await get_shouts_with_links(info, q, limit)
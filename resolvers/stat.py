@@ -1,16 +1,46 @@
 import asyncio
 
-from sqlalchemy import and_, distinct, func, join, select
+from sqlalchemy import and_, bindparam, distinct, func, join, select
 from sqlalchemy.orm import aliased
 
 from cache.cache import cache_author
-from orm.author import Author, AuthorFollower
+from orm.author import Author, AuthorFollower, AuthorKarma
 from orm.reaction import Reaction, ReactionKind
 from orm.shout import Shout, ShoutAuthor, ShoutTopic
 from orm.topic import Topic, TopicFollower
-from services.db import local_session
+from services.db import primary_only, read_session
 from utils.logger import root_logger as logger
 
+# Алиасы и подзапросы статистики создаются один раз: одинаковые объекты дают
+# одинаковый ключ кэша SQLAlchemy, и запрос не компилируется повторно
+topic_shouts = aliased(ShoutTopic, name="topic_shouts")
+topic_followers = aliased(TopicFollower, name="topic_followers")
+followed_by = aliased(AuthorFollower, name="af")
+
+TOPIC_STAT_QUERY = (
+    select(Topic)
+    .join(topic_shouts, topic_shouts.topic == Topic.id)
+    .join(Shout, and_(topic_shouts.shout == Shout.id, Shout.deleted_at.is_(None)))
+    .add_columns(func.count(distinct(topic_shouts.shout)).label("shouts_stat"))  # уникальные публикации темы
+    .outerjoin(topic_followers, topic_followers.topic == Topic.id)
+    .add_columns(func.count(distinct(topic_followers.follower)).label("followers_stat"))
+    .group_by(Topic.id)
+)
+
+# Подзапрос для подсчета публикаций
+author_shouts_subq = (
+    select(func.count(distinct(Shout.id)))
+    .select_from(ShoutAuthor)
+    .join(Shout, and_(Shout.id == ShoutAuthor.shout, Shout.deleted_at.is_(None)))
+    .where(ShoutAuthor.author == Author.id)
+    .scalar_subquery()
+)
+
+# Подзапрос для подсчета подписчиков
+author_followers_subq = (
+    select(func.count(distinct(AuthorFollower.follower))).where(AuthorFollower.author == Author.id).scalar_subquery()
+)
+
 
 def add_topic_stat_columns(q):
     """
@@ -19,95 +49,140 @@ def add_topic_stat_columns(q):
     :param q: SQL-запрос для получения тем.
     :return: Запрос с добавленными колонками статистики.
     """
-    # Создаем алиасы для предотвращения конфликтов имен
-    aliased_shout = aliased(ShoutTopic)
+    return TOPIC_STAT_QUERY
 
-    # Создаем новый объект запроса для тем
-    new_q = select(Topic)
 
-    # Применяем необходимые фильтры и добавляем колонки статистики
-    new_q = (
-        new_q.join(
-            aliased_shout,
-            aliased_shout.topic == Topic.id,
-        )
-        .join(
-            Shout,
-            and_(
-                aliased_shout.shout == Shout.id,
-                Shout.deleted_at.is_(None),
-            ),
-        )
+def add_author_stat_columns(q):
+    """
+    Добавляет статистические колонки к запросу авторов.
+
+    :param q: SQL-запрос для получения авторов.
+    :return: Запрос с добавленными колонками статистики.
+    """
+    # Основной запрос, рейтинг берется из проекции author_karma
+    q = (
+        q.select_from(Author)
+        .add_columns(author_shouts_subq.label("shouts_stat"), author_followers_subq.label("followers_stat"))
+        .outerjoin(AuthorKarma, AuthorKarma.author == Author.id)
         .add_columns(
-            func.count(distinct(aliased_shout.shout)).label("shouts_stat")
-        )  # Подсчет уникальных публикаций для темы
+            func.coalesce(AuthorKarma.rating, 0).label("rating_stat"),
+            func.coalesce(AuthorKarma.rating_shouts, 0).label("rating_shouts_stat"),
+            func.coalesce(AuthorKarma.rating_comments, 0).label("rating_comments_stat"),
+        )
+        .group_by(Author.id, AuthorKarma.author)
     )
 
-    aliased_follower = aliased(TopicFollower)
-
-    # Добавляем количество подписчиков темы
-    new_q = new_q.outerjoin(aliased_follower, aliased_follower.topic == Topic.id).add_columns(
-        func.count(distinct(aliased_follower.follower)).label("followers_stat")
-    )
+    return q
 
-    # Группировка по идентификатору темы
-    new_q = new_q.group_by(Topic.id)
 
-    return new_q
+# Счётчики по одной сущности: готовые запросы с параметрами :topic_id и :author_id
+TOPIC_SHOUTS_STAT = (
+    select(func.count(distinct(ShoutTopic.shout)))
+    .select_from(join(ShoutTopic, Shout, ShoutTopic.shout == Shout.id))
+    .filter(
+        and_(
+            ShoutTopic.topic == bindparam("topic_id"),
+            Shout.published_at.is_not(None),
+            Shout.deleted_at.is_(None),
+        )
+    )
+)
 
+TOPIC_AUTHORS_STAT = (
+    select(func.count(distinct(ShoutAuthor.author)))
+    .select_from(join(ShoutTopic, Shout, ShoutTopic.shout == Shout.id))
+    .join(ShoutAuthor, ShoutAuthor.shout == Shout.id)
+    .filter(
+        and_(
+            ShoutTopic.topic == bindparam("topic_id"),
+            Shout.published_at.is_not(None),
+            Shout.deleted_at.is_(None),
+        )
+    )
+)
 
-def add_author_stat_columns(q):
-    """
-    Добавляет статистические колонки к запросу авторов.
+TOPIC_FOLLOWERS_STAT = select(func.count(distinct(topic_followers.follower))).filter(
+    topic_followers.topic == bindparam("topic_id")
+)
 
-    :param q: SQL-запрос для получения авторов.
-    :return: Запрос с добавленными колонками статистики.
-    """
-    # Подзапрос для подсчета публикаций
-    shouts_subq = (
-        select(func.count(distinct(Shout.id)))
-        .select_from(ShoutAuthor)
-        .join(Shout, and_(Shout.id == ShoutAuthor.shout, Shout.deleted_at.is_(None)))
-        .where(ShoutAuthor.author == Author.id)
-        .scalar_subquery()
+# Подзапрос для получения количества комментариев для каждой публикации
+topic_comments_subq = (
+    select(
+        Shout.id.label("shout_id"),
+        func.coalesce(func.count(Reaction.id), 0).label("comments_count"),
+    )
+    .join(ShoutTopic, ShoutTopic.shout == Shout.id)
+    .join(Topic, ShoutTopic.topic == Topic.id)
+    .outerjoin(
+        Reaction,
+        and_(
+            Reaction.shout == Shout.id,
+            Reaction.kind == ReactionKind.COMMENT.value,
+            Reaction.deleted_at.is_(None),
+        ),
+    )
+    .group_by(Shout.id)
+    .subquery()
+)
+
+# Запрос для суммирования количества комментариев по теме
+TOPIC_COMMENTS_STAT = (
+    select(func.coalesce(func.sum(topic_comments_subq.c.comments_count), 0))
+    .filter(ShoutTopic.topic == bindparam("topic_id"))
+    .outerjoin(topic_comments_subq, ShoutTopic.shout == topic_comments_subq.c.shout_id)
+)
+
+AUTHOR_SHOUTS_STAT = (
+    select(func.count(distinct(Shout.id)))
+    .select_from(Shout)
+    .join(ShoutAuthor, Shout.id == ShoutAuthor.shout)
+    .filter(
+        and_(
+            ShoutAuthor.author == bindparam("author_id"),
+            Shout.published_at.is_not(None),
+            Shout.deleted_at.is_(None),  # Добавляем проверку на удаление
+        )
     )
+)
 
-    # Подзапрос для подсчета подписчиков
-    followers_subq = (
-        select(func.count(distinct(AuthorFollower.follower)))
-        .where(AuthorFollower.author == Author.id)
-        .scalar_subquery()
+AUTHOR_AUTHORS_STAT = select(func.count(distinct(AuthorFollower.author))).filter(
+    and_(
+        AuthorFollower.follower == bindparam("author_id"),
+        AuthorFollower.author != bindparam("author_id"),
     )
+)
 
-    # Основной запрос
-    q = (
-        q.select_from(Author)
-        .add_columns(shouts_subq.label("shouts_stat"), followers_subq.label("followers_stat"))
-        .group_by(Author.id)
+AUTHOR_FOLLOWERS_STAT = select(func.count(distinct(AuthorFollower.follower))).filter(
+    AuthorFollower.author == bindparam("author_id")
+)
+
+AUTHOR_COMMENTS_STAT = (
+    select(func.coalesce(func.count(Reaction.id), 0).label("comments_count"))
+    .select_from(Author)
+    .outerjoin(
+        Reaction,
+        and_(
+            Reaction.created_by == Author.id,
+            Reaction.kind == ReactionKind.COMMENT.value,
+            Reaction.deleted_at.is_(None),
+        ),
     )
+    .where(Author.id == bindparam("author_id"))
+    .group_by(Author.id)
+)
 
-    return q
+
+def count_stat(q, **params) -> int:
+    with read_session() as session:
+        result = session.execute(q, params).first()
+    return result[0] if result else 0
 
 
 def get_topic_shouts_stat(topic_id: int) -> int:
     """
     Получает количество опубликованных постов для темы
     """
-    q = (
-        select(func.count(distinct(ShoutTopic.shout)))
-        .select_from(join(ShoutTopic, Shout, ShoutTopic.shout == Shout.id))
-        .filter(
-            and_(
-                ShoutTopic.topic == topic_id,
-                Shout.published_at.is_not(None),
-                Shout.deleted_at.is_(None),
-            )
-        )
-    )
-
-    with local_session() as session:
-        result = session.execute(q).first()
-    return result[0] if result else 0
+    return count_stat(TOPIC_SHOUTS_STAT, topic_id=topic_id)
 
 
 def get_topic_authors_stat(topic_id: int) -> int:
@@ -117,23 +192,7 @@ def get_topic_authors_stat(topic_id: int) -> int:
     :param topic_id: Идентификатор темы.
     :return: Количество уникальных авторов, связанных с темой.
     """
-    count_query = (
-        select(func.count(distinct(ShoutAuthor.author)))
-        .select_from(join(ShoutTopic, Shout, ShoutTopic.shout == Shout.id))
-        .join(ShoutAuthor, ShoutAuthor.shout == Shout.id)
-        .filter(
-            and_(
-                ShoutTopic.topic == topic_id,
-                Shout.published_at.is_not(None),
-                Shout.deleted_at.is_(None),
-            )
-        )
-    )
-
-    # Выполнение запроса и получение результата
-    with local_session() as session:
-        result = session.execute(count_query).first()
-    return result[0] if result else 0
+    return count_stat(TOPIC_AUTHORS_STAT, topic_id=topic_id)
 
 
 def get_topic_followers_stat(topic_id: int) -> int:
@@ -143,11 +202,7 @@ def get_topic_followers_stat(topic_id: int) -> int:
     :param topic_id: Идентификатор темы.
     :return: Количество уникальных подписчиков темы.
     """
-    aliased_followers = aliased(TopicFollower)
-    q = select(func.count(distinct(aliased_followers.follower))).filter(aliased_followers.topic == topic_id)
-    with local_session() as session:
-        result = session.execute(q).first()
-    return result[0] if result else 0
+    return count_stat(TOPIC_FOLLOWERS_STAT, topic_id=topic_id)
 
 
 def get_topic_comments_stat(topic_id: int) -> int:
@@ -157,57 +212,14 @@ def get_topic_comments_stat(topic_id: int) -> int:
     :param topic_id: Идентификатор темы.
     :return: Общее количество комментариев к публикациям темы.
     """
-    # Подзапрос для получения количества комментариев для каждой публикации
-    sub_comments = (
-        select(
-            Shout.id.label("shout_id"),
-            func.coalesce(func.count(Reaction.id), 0).label("comments_count"),
-        )
-        .join(ShoutTopic, ShoutTopic.shout == Shout.id)
-        .join(Topic, ShoutTopic.topic == Topic.id)
-        .outerjoin(
-            Reaction,
-            and_(
-                Reaction.shout == Shout.id,
-                Reaction.kind == ReactionKind.COMMENT.value,
-                Reaction.deleted_at.is_(None),
-            ),
-        )
-        .group_by(Shout.id)
-        .subquery()
-    )
-    # Запрос для суммирования количества комментариев по теме
-    q = select(func.coalesce(func.sum(sub_comments.c.comments_count), 0)).filter(ShoutTopic.topic == topic_id)
-    q = q.outerjoin(sub_comments, ShoutTopic.shout == sub_comments.c.shout_id)
-    with local_session() as session:
-        result = session.execute(q).first()
-    return result[0] if result else 0
+    return count_stat(TOPIC_COMMENTS_STAT, topic_id=topic_id)
 
 
 def get_author_shouts_stat(author_id: int) -> int:
     """
     Получает количество опубликованных постов для автора
     """
-    aliased_shout_author = aliased(ShoutAuthor)
-    aliased_shout = aliased(Shout)
-
-    q = (
-        select(func.count(distinct(aliased_shout.id)))
-        .select_from(aliased_shout)
-        .join(aliased_shout_author, aliased_shout.id == aliased_shout_author.shout)
-        .filter(
-            and_(
-                aliased_shout_author.author == author_id,
-                aliased_shout.published_at.is_not(None),
-                aliased_shout.deleted_at.is_(None),  # Добавляем проверку на удаление
-            )
-        )
-    )
-
-    with local_session() as session:
-        result = session.execute(q).first()
-
-    return result[0] if result else 0
+    return count_stat(AUTHOR_SHOUTS_STAT, author_id=author_id)
 
 
 def get_author_authors_stat(author_id: int) -> int:
@@ -217,16 +229,7 @@ def get_author_authors_stat(author_id: int) -> int:
     :param author_id: Идентификатор автора.
     :return: Количество уникальных авторов, на которых подписан автор.
     """
-    aliased_authors = aliased(AuthorFollower)
-    q = select(func.count(distinct(aliased_authors.author))).filter(
-        and_(
-            aliased_authors.follower == author_id,
-            aliased_authors.author != author_id,
-        )
-    )
-    with local_session() as session:
-        result = session.execute(q).first()
-    return result[0] if result else 0
+    return count_stat(AUTHOR_AUTHORS_STAT, author_id=author_id)
 
 
 def get_author_followers_stat(author_id: int) -> int:
@@ -236,32 +239,11 @@ def get_author_followers_stat(author_id: int) -> int:
     :param author_id: Идентификатор автора.
     :return: Количество уникальных подписчиков автора.
     """
-    aliased_followers = aliased(AuthorFollower)
-    q = select(func.count(distinct(aliased_followers.follower))).filter(aliased_followers.author == author_id)
-    with local_session() as session:
-        result = session.execute(q).first()
-    return result[0] if result else 0
+    return count_stat(AUTHOR_FOLLOWERS_STAT, author_id=author_id)
 
 
 def get_author_comments_stat(author_id):
-    q = (
-        select(func.coalesce(func.count(Reaction.id), 0).label("comments_count"))
-        .select_from(Author)
-        .outerjoin(
-            Reaction,
-            and_(
-                Reaction.created_by == Author.id,
-                Reaction.kind == ReactionKind.COMMENT.value,
-                Reaction.deleted_at.is_(None),
-            ),
-        )
-        .where(Author.id == author_id)
-        .group_by(Author.id)
-    )
-
-    with local_session() as session:
-        result = session.execute(q).first()
-        return result.comments_count if result else 0
+    return count_stat(AUTHOR_COMMENTS_STAT, author_id=author_id)
 
 
 def get_with_stat(q):
@@ -273,10 +255,9 @@ def get_with_stat(q):
     """
     records = []
     try:
-        with local_session() as session:
-            # Определяем, является ли запрос запросом авторов
-            author_prefixes = ("select author", "select * from author")
-            is_author = f"{q}".lower().startswith(author_prefixes)
+        with read_session() as session:
+            # Определяем, является ли запрос запросом авторов, без компиляции запроса в строку
+            is_author = q.column_descriptions[0].get("entity") is Author
 
             # Добавляем колонки статистики в запрос
             q = add_author_stat_columns(q) if is_author else add_topic_stat_columns(q)
@@ -291,6 +272,9 @@ def get_with_stat(q):
                 if is_author:
                     stat["authors"] = get_author_authors_stat(entity.id)  # Статистика по подпискам на авторов
                     stat["comments"] = get_author_comments_stat(entity.id)  # Статистика по комментариям
+                    stat["rating"] = cols[3]  # Рейтинг из проекции author_karma
+                    stat["rating_shouts"] = cols[4]
+                    stat["rating_comments"] = cols[5]
                 else:
                     stat["authors"] = get_topic_authors_stat(entity.id)  # Статистика по авторам темы
                 entity.stat = stat
@@ -311,9 +295,10 @@ def author_follows_authors(author_id: int):
     :param author_id: Идентификатор автора.
     :return: Список авторов с добавленной статистикой.
     """
-    af = aliased(AuthorFollower, name="af")
     author_follows_authors_query = (
-        select(Author).select_from(join(Author, af, Author.id == af.author)).where(af.follower == author_id)
+        select(Author)
+        .select_from(join(Author, followed_by, Author.id == followed_by.author))
+        .where(followed_by.follower == author_id)
     )
     return get_with_stat(author_follows_authors_query)
 
@@ -340,6 +325,8 @@ def update_author_stat(author_id: int):
     :param author_id: Идентификатор автора.
     """
     author_query = select(Author).where(Author.id == author_id)
+    # пересчёт сразу после записи, реплика может ещё не догнать
+    token = primary_only.set(True)
     try:
         result = get_with_stat(author_query)
         if result:
@@ -350,3 +337,5 @@ def update_author_stat(author_id: int):
                 asyncio.create_task(cache_author(author_dict))
     except Exception as exc:
         logger.error(exc, exc_info=True)
+    finally:
+        primary_only.reset(token)
@@ -6,11 +6,12 @@ from cache.cache import (
     get_cached_topic_followers,
 )
 from cache.memorycache import cache_region
+from cache.typeahead import typeahead
 from orm.author import Author
 from orm.topic import Topic
 from resolvers.stat import get_with_stat
 from services.auth import login_required
-from services.db import local_session
+from services.db import local_session, run_in_db_pool
 from services.schema import mutation, query
 from utils.logger import root_logger as logger
 
@@ -52,7 +53,7 @@ async def get_topics_by_author(_, _info, author_id=0, slug="", user=""):
     elif user:
         topics_by_author_query = topics_by_author_query.join(Author).where(Author.user == user)
 
-    return get_with_stat(topics_by_author_query)
+    return await run_in_db_pool(get_with_stat, topics_by_author_query)
 
 
 # Запрос на получение одной темы по её slug
@@ -63,6 +64,13 @@ async def get_topic(_, _info, slug: str):
         return topic
 
 
+# Запрос на поиск тем по началу названия
+@query.field("search_topics")
+def search_topics(_, _info, what: str, limit=10):
+    """Автодополнение тем по префиксу названия или slug, самые популярные первыми."""
+    return typeahead.topics.search(what, min(limit or 10, 50))
+
+
 # Мутация для создания новой темы
 @mutation.field("create_topic")
 @login_required
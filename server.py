@@ -5,7 +5,7 @@ from granian.constants import Interfaces
 from granian.log import LogLevels
 from granian.server import Granian
 
-from settings import PORT
+from settings import PORT, WORKERS
 from utils.logger import root_logger as logger
 
 if __name__ == "__main__":
@@ -16,6 +16,7 @@ if __name__ == "__main__":
             address="0.0.0.0",
             port=PORT,
             interface=Interfaces.ASGI,
+            workers=WORKERS,
             threads=4,
             websockets=False,
             log_level=LogLevels.debug,
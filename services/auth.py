@@ -1,21 +1,236 @@
+import asyncio
+import base64
+import hashlib
+import json
+import time
 from functools import wraps
 
+from authlib.jose import JsonWebKey, JsonWebToken
+from authlib.jose.errors import DecodeError, JoseError
+from graphql import OperationType
+
 from cache.cache import get_cached_author_by_user_id
 from resolvers.stat import get_with_stat
+from services.db import is_sticky, primary_only, stick_to_primary
+from services.http import http_client
+from services.redis import redis
 from services.schema import request_graphql_data
-from settings import ADMIN_SECRET, AUTH_URL
+from settings import ADMIN_SECRET, AUTH_CLIENT_ID, AUTH_JWKS_URL, AUTH_JWT_SECRET, AUTH_TOKEN_CACHE_TTL, AUTH_URL
 from utils.logger import root_logger as logger
 
 # Список разрешенных заголовков
 ALLOWED_HEADERS = ["Authorization", "Content-Type"]
 
+JWKS_TTL = 60 * 60  # ключи авторизатора перечитываются раз в час
+JWKS_REFRESH_INTERVAL = 60  # и не чаще раза в минуту при появлении неизвестного kid
+TOKEN_CLAIMS_KEY = "auth:claims:{}"  # кэш результата удалённой проверки токена
+TOKEN_REVOKED_KEY = "auth:revoked:{}"  # отозванные токены по jti или хэшу
+USER_REVOKED_KEY = "auth:revoked:user:{}"  # время отзыва всех токенов пользователя
+USER_REVOKED_TTL = 60 * 60 * 24 * 30  # дольше срока жизни любого токена авторизатора
+# события вебхуков авторизатора, после которых токены пользователя недействительны
+REVOKE_EVENTS = ("user.access_revoked", "user.deactivated", "user.deleted")
+
+# алгоритмы разделены, чтобы публичный ключ нельзя было использовать как HS-секрет
+jwt_asymmetric = JsonWebToken(["RS256", "RS384", "RS512", "ES256", "ES384", "ES512"])
+jwt_symmetric = JsonWebToken(["HS256", "HS384", "HS512"])
+claims_options = {"exp": {"essential": True}, "sub": {"essential": True}}
+if AUTH_CLIENT_ID:
+    claims_options["aud"] = {"essential": True, "value": AUTH_CLIENT_ID}
+
+jwks_cache = {}  # jwks url -> (KeySet, kids, время загрузки)
+
+
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def jwks_url(auth_url: str) -> str:
+    if auth_url == AUTH_URL and AUTH_JWKS_URL:
+        return AUTH_JWKS_URL
+    return auth_url.replace("/graphql", "/.well-known/jwks.json") if auth_url else ""
+
+
+async def load_jwks(url: str, kid=None):
+    """
+    Ключи авторизатора из кэша процесса, перечитываются по истечении JWKS_TTL
+    или при неизвестном kid (ротация ключей), не чаще раза в JWKS_REFRESH_INTERVAL.
+
+    :return: Набор ключей или None, если ключа kid в нём нет или ключи не загружены.
+    """
+    keys, kids, loaded_at = jwks_cache.get(url, (None, set(), 0))
+    age = time.time() - loaded_at
+    if keys and age < JWKS_TTL and (not kid or kid in kids):
+        return keys
+    if age < JWKS_REFRESH_INTERVAL:
+        # ключа kid нет в недавно загруженном наборе: токен проверяет авторизатор, а не отвергает подпись
+        return None
+    try:
+        response = await http_client.get(url)
+        response.raise_for_status()
+        jwks = response.json()
+        keys = JsonWebKey.import_key_set(jwks)
+        kids = {key.get("kid") for key in jwks.get("keys", [])}
+        logger.info(f"JWKS loaded from {url}: {len(kids)} keys")
+    except Exception as e:
+        logger.error(f"JWKS loading failed from {url}: {e}")
+    jwks_cache[url] = (keys, kids, time.time())
+    return keys if not kid or kid in kids else None
+
+
+def token_header(token: str) -> dict | None:
+    """Заголовок JWT или None для непрозрачного токена."""
+    try:
+        header = token.split(".")[0]
+        return json.loads(base64.urlsafe_b64decode(header + "=" * (-len(header) % 4)))
+    except Exception:
+        return None
+
+
+async def verify_token(token: str, auth_url: str) -> dict | None:
+    """
+    Локальная проверка подписи, срока действия и утверждений access token.
+
+    :return: Утверждения токена, {} если токен недействителен,
+             None если проверить локально нельзя (непрозрачный токен или нет ключей).
+    """
+    header = token_header(token)
+    if not isinstance(header, dict) or "alg" not in header:
+        return None
+    if header["alg"].startswith("HS"):
+        jwt, key = jwt_symmetric, AUTH_JWT_SECRET.encode()
+        if not AUTH_JWT_SECRET:
+            return None
+    else:
+        jwt, key = jwt_asymmetric, await load_jwks(jwks_url(auth_url), header.get("kid"))
+        if not key:
+            return None
+    try:
+        claims = jwt.decode(token, key, claims_options=claims_options)
+        claims.validate(leeway=5)
+    except DecodeError:
+        return None
+    except (JoseError, ValueError) as e:
+        logger.warning(f"Token validation failed: {e}")
+        return {}
+    if claims.get("token_type", "access_token") != "access_token":
+        logger.warning(f"Token validation failed: unexpected token_type {claims.get('token_type')}")
+        return {}
+    return dict(claims)
+
+
+async def validate_token_remotely(token: str, auth_url: str) -> dict | None:
+    """
+    Проверка токена и сессии запросом validate_jwt_token к авторизатору.
+
+    :return: Утверждения токена, {} если токен или сессия недействительны, None если авторизатор недоступен.
+    """
+    query_name = "validate_jwt_token"
+    operation = "ValidateToken"
+    variables = {"params": {"token_type": "access_token", "token": token}}
+
+    # Только необходимые заголовки для GraphQL запроса
+    headers = {"Content-Type": "application/json"}
+
+    gql = {
+        "query": f"query {operation}($params: ValidateJWTTokenInput!)"
+        + "{"
+        + f"{query_name}(params: $params) {{ is_valid claims }} "
+        + "}",
+        "variables": variables,
+        "operationName": operation,
+    }
+    data = await request_graphql_data(gql, url=auth_url, headers=headers)
+    if not data:
+        return None
+    logger.debug(f"Auth response: {data}")
+    validation_result = data.get("data", {}).get(query_name, {})
+    logger.debug(f"Validation result: {validation_result}")
+    if not validation_result.get("is_valid", False):
+        logger.error(f"Token validation failed: {validation_result}")
+        return {}
+    return validation_result.get("claims", {})
+
+
+def session_check_ttl(claims: dict) -> int:
+    """
+    Сколько секунд доверять подтверждению сессии: AUTH_TOKEN_CACHE_TTL,
+    но не больше десятой части срока жизни токена и не дольше самого токена.
+    """
+    ttl = AUTH_TOKEN_CACHE_TTL
+    if claims.get("exp"):
+        ttl = min(ttl, int(claims["exp"] - time.time()))
+        if claims.get("iat"):
+            ttl = min(ttl, int(claims["exp"] - claims["iat"]) // 10)
+    return ttl
+
+
+async def get_token_claims(token: str, auth_url: str) -> dict:
+    """
+    Утверждения токена. Подпись и срок JWT проверяются локально, а сессия у авторизатора
+    подтверждается не реже раза в session_check_ttl секунд: выход и смена пароля
+    действуют не позже этого срока. Непрозрачные токены проверяются только удалённо.
+    """
+    claims = await verify_token(token, auth_url)
+    if claims == {}:
+        return {}
+    key = TOKEN_CLAIMS_KEY.format(token_hash(token))
+    cached = await redis.execute("GET", key)
+    if cached:
+        return json.loads(cached)
+    remote = await validate_token_remotely(token, auth_url)
+    if remote is None:
+        # авторизатор недоступен: подписанному токену верим, пока связь не восстановится
+        return claims or {}
+    if not remote:
+        return {}
+    claims = claims or remote
+    ttl = session_check_ttl(claims)
+    if ttl > 0:
+        await redis.execute("SET", key, json.dumps(claims), "EX", ttl)
+    return claims
+
+
+async def is_revoked(token: str, claims: dict) -> bool:
+    """Токен отозван сам по себе или выдан до отзыва всех токенов пользователя."""
+    keys = [TOKEN_REVOKED_KEY.format(claims.get("jti") or token_hash(token))]
+    if claims.get("sub"):
+        keys.append(USER_REVOKED_KEY.format(claims["sub"]))
+    revoked = await redis.execute("MGET", *keys) or []
+    if revoked and revoked[0]:
+        return True
+    revoked_at = revoked[1] if len(revoked) > 1 else None
+    return bool(revoked_at) and float(claims.get("iat") or 0) <= float(revoked_at)
+
+
+async def revoke_token(token: str, claims: dict | None = None):
+    """
+    Отзыв токена до истечения его срока: запись в список отозванных в Redis
+    и удаление закэшированного результата проверки.
+    """
+    claims = claims or {}
+    ttl = int(claims.get("exp", 0) - time.time()) if claims.get("exp") else AUTH_TOKEN_CACHE_TTL
+    if ttl > 0:
+        await redis.execute("SET", TOKEN_REVOKED_KEY.format(claims.get("jti") or token_hash(token)), 1, "EX", ttl)
+    await redis.execute("DEL", TOKEN_CLAIMS_KEY.format(token_hash(token)))
+
+
+async def revoke_user(user_id: str):
+    """
+    Отзыв всех выданных пользователю токенов по событию авторизатора (отзыв доступа,
+    блокировка, удаление): токены с iat не позже этого момента отклоняются.
+    """
+    if user_id:
+        await redis.execute("SET", USER_REVOKED_KEY.format(user_id), time.time(), "EX", USER_REVOKED_TTL)
+        logger.info(f"tokens of user {user_id} are revoked")
+
 
 async def check_auth(req):
     """
     Проверка авторизации пользователя.
 
     Эта функция проверяет токен авторизации, переданный в заголовках запроса,
-    и возвращает идентификатор пользователя и его роли.
+    и возвращает идентификатор пользователя и его роли. JWT проверяется локально
+    по ключам авторизатора, сессия подтверждается у авторизатора с коротким кэшем.
 
     Параметры:
     - req: Входящий GraphQL запрос, содержащий заголовок авторизации.
@@ -37,36 +252,12 @@ async def check_auth(req):
         # Проверяем и очищаем токен от префикса Bearer если он есть
         if token.startswith("Bearer "):
             token = token.split("Bearer ")[-1].strip()
-        # Logging the authentication token
-        logger.debug(f"TOKEN: {token}")
-        query_name = "validate_jwt_token"
-        operation = "ValidateToken"
-        variables = {"params": {"token_type": "access_token", "token": token}}
-
-        # Только необходимые заголовки для GraphQL запроса
-        headers = {"Content-Type": "application/json"}
-
-        gql = {
-            "query": f"query {operation}($params: ValidateJWTTokenInput!)"
-            + "{"
-            + f"{query_name}(params: $params) {{ is_valid claims }} "
-            + "}",
-            "variables": variables,
-            "operationName": operation,
-        }
-        data = await request_graphql_data(gql, url=auth_url, headers=headers)
-        if data:
-            logger.debug(f"Auth response: {data}")
-            validation_result = data.get("data", {}).get(query_name, {})
-            logger.debug(f"Validation result: {validation_result}")
-            is_valid = validation_result.get("is_valid", False)
-            if not is_valid:
-                logger.error(f"Token validation failed: {validation_result}")
-                return "", []
-            user_data = validation_result.get("claims", {})
-            logger.debug(f"User claims: {user_data}")
-            user_id = user_data.get("sub", "")
-            user_roles = user_data.get("allowed_roles", [])
+        user_data = await get_token_claims(token, auth_url)
+        if not user_data or await is_revoked(token, user_data):
+            return "", []
+        logger.debug(f"User claims: {user_data}")
+        user_id = user_data.get("sub", "")
+        user_roles = user_data.get("allowed_roles", [])
     return user_id, user_roles
 
 
@@ -75,7 +266,7 @@ async def add_user_role(user_id):
     Добавление роли пользователя.
 
     Эта функция добавляет роли "author" и "reader" для указанного пользователя
-    в системе авторизации.
+    в системе авторизации. Вызывается диспетчером outbox, а не из обработчиков запросов.
 
     Параметры:
     - user_id: str - Идентификатор пользователя, которому нужно добавить роли.
@@ -102,11 +293,53 @@ async def add_user_role(user_id):
         return user_id
 
 
+async def load_auth(req):
+    """Пользователь, роли и профиль автора по токену запроса."""
+    user_id, user_roles = await check_auth(req)
+    author = None
+    if user_id and user_roles:
+        author = await get_cached_author_by_user_id(user_id, get_with_stat)
+        if not author:
+            logger.error(f"author profile not found for user {user_id}")
+    return user_id, user_roles, author
+
+
+async def resolve_auth(info):
+    """
+    Авторизация один раз на HTTP-запрос: результат хранится в контексте GraphQL,
+    общем для всех резолверов документа. Параллельные резолверы ждут одну и ту же задачу.
+    """
+    task = info.context.get("auth")
+    if task is None:
+        task = info.context["auth"] = asyncio.ensure_future(load_auth(info.context.get("request")))
+    return await asyncio.shield(task)
+
+
+async def route_reads(info, author) -> bool:
+    """
+    Чтение своих записей: мутации и запросы автора в течение DB_STICKY_WINDOW
+    после его мутации читают из основной БД, а не с реплик.
+
+    :return: True для мутации, после неё автор закрепляется за основной БД.
+    """
+    if not author:
+        return False
+    if info.operation.operation == OperationType.MUTATION:
+        primary_only.set(True)
+        return True
+    sticky = info.context.get("sticky")
+    if sticky is None:
+        sticky = info.context["sticky"] = await is_sticky(author["id"])
+    if sticky:
+        primary_only.set(True)
+    return False
+
+
 def login_required(f):
     """
     Декоратор для проверки авторизации пользователя.
 
-    Этот декоратор проверяет, авторизован ли пользователь, �� добавляет
+    Этот декоратор проверяет, авторизован ли пользователь, и добавляет
     информацию о пользователе в контекст функции.
 
     Параметры:
@@ -119,16 +352,17 @@ def login_required(f):
     @wraps(f)
     async def decorated_function(*args, **kwargs):
         info = args[1]
-        req = info.context.get("request")
-        user_id, user_roles = await check_auth(req)
+        user_id, user_roles, author = await resolve_auth(info)
         if user_id and user_roles:
             logger.info(f" got {user_id} roles: {user_roles}")
             info.context["user_id"] = user_id.strip()
             info.context["roles"] = user_roles
-            author = await get_cached_author_by_user_id(user_id, get_with_stat)
-            if not author:
-                logger.error(f"author profile not found for user {user_id}")
             info.context["author"] = author
+        if await route_reads(info, author):
+            try:
+                return await f(*args, **kwargs)
+            finally:
+                await stick_to_primary(author["id"])
         return await f(*args, **kwargs)
 
     return decorated_function
@@ -151,33 +385,30 @@ def login_accepted(f):
     @wraps(f)
     async def decorated_function(*args, **kwargs):
         info = args[1]
-        req = info.context.get("request")
 
         logger.debug("login_accepted: Проверка авторизации пользователя.")
-        user_id, user_roles = await check_auth(req)
+        user_id, user_roles, author = await resolve_auth(info)
         logger.debug(f"login_accepted: user_id={user_id}, user_roles={user_roles}")
 
         if user_id and user_roles:
             logger.info(f"login_accepted: Пользователь авторизован: {user_id} с ролями {user_roles}")
             info.context["user_id"] = user_id.strip()
             info.context["roles"] = user_roles
-
-            # Пробуем получить профиль автора
-            author = await get_cached_author_by_user_id(user_id, get_with_stat)
             if author:
                 logger.debug(f"login_accepted: Найден профиль автора: {author}")
-                # Предполагается, что `author` является объектом с атрибутом `id`
-                info.context["author"] = author.dict()
-            else:
-                logger.error(
-                    f"login_accepted: Профиль автора не найден для пользователя {user_id}. Используем базовые данные."
-                )  # Используем базовую информацию об автор
+                # кэш авторов возвращает словарь
+                info.context["author"] = author
         else:
             logger.debug("login_accepted: Пользователь не авторизован. Очищаем контекст.")
             info.context["user_id"] = None
             info.context["roles"] = None
             info.context["author"] = None
 
+        if await route_reads(info, author if user_id and user_roles else None):
+            try:
+                return await f(*args, **kwargs)
+            finally:
+                await stick_to_primary(author["id"])
         return await f(*args, **kwargs)
 
     return decorated_function
@@ -0,0 +1,65 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
+
+from utils.logger import root_logger as logger
+
+
+class WriteCoalescer:
+    """
+    Склеивает повторяющиеся фоновые пересчёты в короткие окна.
+
+    Ключи, добавленные за окно window, передаются обработчику flush одной пачкой:
+    {ключ: [значения, добавленные с этим ключом]}.
+    """
+
+    def __init__(self, flush: Callable[[Dict[Hashable, List[Any]]], Awaitable[None]], window=1.0, max_pending=5000):
+        self.flush = flush
+        self.window = window
+        self.max_pending = max_pending
+        self.pending: Dict[Hashable, List[Any]] = {}
+        self.running = False
+        self.full = asyncio.Event()
+
+    def add(self, key: Hashable, value: Any = None):
+        """Добавить ключ в текущее окно, воркер запускается при первом обращении."""
+        values = self.pending.setdefault(key, [])
+        if value is not None:
+            values.append(value)
+        if len(self.pending) >= self.max_pending:
+            self.full.set()
+        if not self.running:
+            self.running = True
+            self.task = asyncio.create_task(self.worker())
+
+    async def worker(self):
+        """Сброс накопленных ключей раз в self.window секунд или при переполнении."""
+        try:
+            while self.running:
+                try:
+                    await asyncio.wait_for(self.full.wait(), timeout=self.window)
+                except asyncio.TimeoutError:
+                    pass
+                self.full.clear()
+                await self.flush_pending()
+        except asyncio.CancelledError:
+            logger.info("Write coalescer was stopped.")
+
+    async def flush_pending(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, {}
+        try:
+            await self.flush(batch)
+        except Exception as e:
+            logger.error(f"Coalesced flush failed for {len(batch)} keys: {e}", exc_info=True)
+
+    async def stop(self):
+        """Остановка воркера с досбросом накопленного."""
+        self.running = False
+        if hasattr(self, "task"):
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        await self.flush_pending()
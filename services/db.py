@@ -1,9 +1,16 @@
+import asyncio
+import contextvars
 import json
 import math
+import sys
 import time
 import traceback
 import warnings
-from typing import Any, Callable, Dict, TypeVar
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from importlib.util import find_spec
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Tuple, TypeVar
+from uuid import uuid4
 
 import sqlalchemy
 from sqlalchemy import (
@@ -16,29 +23,216 @@ from sqlalchemy import (
     exc,
     func,
     inspect,
+    select,
+    text,
 )
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import Session, configure_mappers, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from sqlalchemy.sql.schema import Table
 
-from settings import DB_URL
+from services.http import LATENCY_BUCKETS, EndpointMetrics
+from services.profiler import query_profiler
+from services.redis import redis
+from settings import (
+    DB_ASYNC_MAX_OVERFLOW,
+    DB_ASYNC_POOL_SIZE,
+    DB_CALL_TIMEOUT,
+    DB_MAX_OVERFLOW,
+    DB_PGBOUNCER,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_PREPARED_STATEMENTS,
+    DB_QUERY_CACHE_SIZE,
+    DB_REPLICA_CHECK_INTERVAL,
+    DB_REPLICA_MAX_LAG,
+    DB_REPLICA_URLS,
+    DB_STICKY_WINDOW,
+    DB_URL,
+    QUERY_PROFILER,
+)
 from utils.logger import root_logger as logger
 
-if DB_URL.startswith("postgres"):
-    engine = create_engine(
-        DB_URL,
-        echo=False,
-        pool_size=10,
-        max_overflow=20,
-        pool_timeout=30,  # Время ожидания свободного соединения
-        pool_recycle=1800,  # Время жизни соединения
-        pool_pre_ping=True,  # Добавить проверку соединений
-        connect_args={
-            "sslmode": "disable",
-            "connect_timeout": 40,  # Добавить таймаут подключения
-        },
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+
+class PoolMetrics(EndpointMetrics):
+    """Ожидание свободного соединения в пуле SQLAlchemy, errors - превышения pool_timeout."""
+
+    def __init__(self):
+        super().__init__()
+        self.disconnects = 0
+
+
+class PoolInstrumentation:
+    """Учёт времени выдачи соединения из пула, метрики переживают пересоздание пула."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.errors += 1
+            logger.error(f"db pool exhausted: {self.checkedout()} connections in use for {self._timeout}s")
+            raise
+        finally:
+            self.metrics.observe(time.perf_counter() - started)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+class InstrumentedQueuePool(PoolInstrumentation, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(PoolInstrumentation, AsyncAdaptedQueuePool):
+    pass
+
+
+db_engines: Dict[str, Engine] = {}  # имя пула в метриках -> движок
+
+
+def pool_label(url: str) -> str:
+    return f"replica{DB_REPLICA_URLS.index(url)}" if url in DB_REPLICA_URLS else "primary"
+
+
+def create_db_engine(url: str) -> Engine:
+    if url.startswith("postgres"):
+        db_engines[pool_label(url)] = create_engine(
+            url,
+            echo=False,
+            query_cache_size=DB_QUERY_CACHE_SIZE,
+            poolclass=InstrumentedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,  # Время ожидания свободного соединения
+            pool_recycle=DB_POOL_RECYCLE,  # Время жизни соединения
+            pool_pre_ping=not DB_PGBOUNCER,  # за pgbouncer соединение заменяется после ошибки, см. fetch_all
+            connect_args={
+                "sslmode": "disable",
+                "connect_timeout": 40,  # Добавить таймаут подключения
+            },
+        )
+        return db_engines[pool_label(url)]
+    return create_engine(
+        url, echo=False, query_cache_size=DB_QUERY_CACHE_SIZE, connect_args={"check_same_thread": False}
     )
-else:
-    engine = create_engine(DB_URL, echo=False, connect_args={"check_same_thread": False})
+
+
+engine = create_db_engine(DB_URL)
+
+# Асинхронный доступ к той же БД: asyncpg для postgres, aiosqlite для sqlite
+ASYNC_DB_DRIVER = "asyncpg" if DB_URL.startswith("postgres") else "aiosqlite"
+ASYNC_DB_AVAILABLE = bool(find_spec(ASYNC_DB_DRIVER) and find_spec("greenlet"))  # sqlalchemy[asyncio]
+async_engines: Dict[str, "AsyncEngine"] = {}  # url -> движок, основная БД и реплики
+
+# Чтение из основной БД в текущем контексте: мутации и чтение своих записей
+primary_only: ContextVar[bool] = ContextVar("primary_only", default=False)
+DB_STICKY_KEY = "db:sticky:{}"
+REPLICA_LAG_QUERY = (
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+def checked_out(engine) -> int:
+    """Число занятых соединений пула, для выбора наименее загруженной реплики."""
+    return getattr(engine.pool, "checkedout", lambda: 0)()
+
+
+class ReplicaRouter:
+    def __init__(self, urls: List[str]):
+        """
+        Маршрутизация чтения по репликам: наименее загруженная из отстающих не больше
+        DB_REPLICA_MAX_LAG секунд, при равенстве по очереди; без подходящих - основная БД.
+        """
+        self.urls = urls
+        self.engines = [create_db_engine(url) for url in urls]
+        self.lag = [0.0] * len(urls)
+        self.turn = 0
+        self.running = True
+
+    def choose(self) -> int | None:
+        """Индекс реплики для чтения или None для основной БД."""
+        if primary_only.get():
+            return None
+        candidates = [i for i, lag in enumerate(self.lag) if lag <= DB_REPLICA_MAX_LAG]
+        if not candidates:
+            return None
+        self.turn += 1
+        shift = self.turn % len(candidates)
+        candidates = candidates[shift:] + candidates[:shift]
+        return min(candidates, key=lambda i: checked_out(self.engines[i]))
+
+    def engine(self) -> Engine:
+        i = self.choose()
+        return engine if i is None else self.engines[i]
+
+    def url(self) -> str:
+        i = self.choose()
+        return DB_URL if i is None else self.urls[i]
+
+    def check_lag(self):
+        """Отставание реплик в секундах, недоступная реплика исключается до следующей проверки."""
+        for i, replica in enumerate(self.engines):
+            try:
+                with replica.connect() as connection:
+                    if replica.dialect.name == "postgresql":
+                        self.lag[i] = float(connection.execute(text(REPLICA_LAG_QUERY)).scalar() or 0)
+                    else:
+                        connection.execute(text("SELECT 1"))
+                        self.lag[i] = 0.0
+            except Exception as e:
+                logger.error(f"replica {i} is unavailable: {e}")
+                self.lag[i] = math.inf
+            if self.lag[i] > DB_REPLICA_MAX_LAG:
+                logger.warning(f"replica {i} lag {self.lag[i]:.1f}s, reads go elsewhere")
+
+    async def start(self):
+        if self.engines:
+            self.task = asyncio.create_task(self.worker())
+
+    async def worker(self):
+        try:
+            while self.running:
+                await asyncio.to_thread(self.check_lag)
+                await asyncio.sleep(DB_REPLICA_CHECK_INTERVAL)
+        except asyncio.CancelledError:
+            logger.info("Replica lag checker was stopped.")
+
+    async def stop(self):
+        self.running = False
+        if hasattr(self, "task"):
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+
+replica_router = ReplicaRouter(DB_REPLICA_URLS)
+
+
+async def stick_to_primary(author_id: int):
+    """После мутации автора его чтение идёт в основную БД DB_STICKY_WINDOW секунд, во всех воркерах."""
+    if replica_router.engines and author_id:
+        await redis.execute("SET", DB_STICKY_KEY.format(author_id), 1, "EX", DB_STICKY_WINDOW)
+
+
+async def is_sticky(author_id: int) -> bool:
+    if not replica_router.engines or not author_id:
+        return False
+    return bool(await redis.execute("EXISTS", DB_STICKY_KEY.format(author_id)))
+
 
 inspector = inspect(engine)
 configure_mappers()
@@ -61,6 +255,192 @@ def local_session(src=""):
     return Session(bind=engine, expire_on_commit=False)
 
 
+def read_session():
+    """Сессия только для чтения: реплика, если есть подходящая, иначе основная БД."""
+    return Session(bind=replica_router.engine(), expire_on_commit=False)
+
+
+def get_async_engine(url: str = DB_URL) -> "AsyncEngine | None":
+    """
+    Асинхронный движок для основной БД или реплики создаётся при первом обращении.
+    None, если не установлены драйвер или greenlet (sqlalchemy[asyncio]).
+    """
+    if url not in async_engines and ASYNC_DB_AVAILABLE:
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        async_url = url.replace("postgresql://", "postgresql+asyncpg://", 1).replace(
+            "sqlite://", "sqlite+aiosqlite://", 1
+        )
+        if ASYNC_DB_DRIVER == "asyncpg":
+            # скомпилированные запросы asyncpg подготавливает на сервере и переиспользует в соединении
+            async_url = make_url(async_url).update_query_dict(
+                {"prepared_statement_cache_size": str(DB_PREPARED_STATEMENTS)}
+            )
+            connect_args = {"ssl": False, "timeout": 40}
+            if DB_PGBOUNCER:
+                # в режиме транзакций pgbouncer соединения сервера общие: без кэша и с уникальными именами
+                connect_args["statement_cache_size"] = 0
+                connect_args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid4()}__"
+            async_engines[url] = create_async_engine(
+                async_url,
+                echo=False,
+                query_cache_size=DB_QUERY_CACHE_SIZE,
+                poolclass=InstrumentedAsyncQueuePool,
+                pool_size=DB_ASYNC_POOL_SIZE,
+                max_overflow=DB_ASYNC_MAX_OVERFLOW,
+                pool_timeout=DB_POOL_TIMEOUT,
+                pool_recycle=DB_POOL_RECYCLE,
+                pool_pre_ping=not DB_PGBOUNCER,
+                connect_args=connect_args,
+            )
+            db_engines[f"{pool_label(url)} async"] = async_engines[url].sync_engine
+        else:
+            async_engines[url] = create_async_engine(async_url, echo=False, query_cache_size=DB_QUERY_CACHE_SIZE)
+    return async_engines.get(url)
+
+
+def async_local_session(url: str = DB_URL) -> "AsyncSession":
+    """
+    Асинхронная сессия: запросы не блокируют цикл событий.
+
+    async with async_local_session() as session:
+        result = await session.execute(q)
+    """
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+    return AsyncSession(bind=get_async_engine(url), expire_on_commit=False)
+
+
+# Пул потоков для синхронной работы с БД из async-кода: не больше потоков, чем соединений в пуле SQLAlchemy
+db_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE + DB_MAX_OVERFLOW, thread_name_prefix="db")
+db_pool_queue = EndpointMetrics()  # ожидание свободного потока, ошибки - превышения таймаута
+db_pool_calls = EndpointMetrics()  # выполнение в потоке
+db_pool_pending = 0
+
+
+async def run_in_db_pool(func: Callable[..., T], *args, timeout: float | None = DB_CALL_TIMEOUT, **kwargs) -> T:
+    """
+    Выполнение синхронной функции с запросами к БД в ограниченном пуле потоков.
+
+    :param func: Синхронная функция, например get_with_stat.
+    :param timeout: Предел ожидания результата вместе с очередью, None - без ограничения.
+    :raises asyncio.TimeoutError: Результат не получен за timeout. Запрос в потоке
+        прервать нельзя, он доработает, но вызывающий код его уже не ждёт.
+    """
+    global db_pool_pending
+    submitted = time.perf_counter()
+
+    # контекст (primary_only) переходит в поток, как в asyncio.to_thread
+    context = contextvars.copy_context()
+
+    def call():
+        started = time.perf_counter()
+        db_pool_queue.observe(started - submitted)
+        try:
+            return context.run(func, *args, **kwargs)
+        finally:
+            db_pool_calls.observe(time.perf_counter() - started)
+
+    db_pool_pending += 1
+    try:
+        future = asyncio.get_running_loop().run_in_executor(db_executor, call)
+        return await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        db_pool_queue.errors += 1
+        logger.error(f"run_in_db_pool: {getattr(func, '__name__', func)} timed out after {timeout}s")
+        raise
+    finally:
+        db_pool_pending -= 1
+
+
+def export_db_pool_metrics() -> str:
+    """Метрики пула потоков БД и пулов соединений SQLAlchemy в текстовом формате Prometheus."""
+    lines = [
+        "# TYPE db_pool_queue_seconds histogram",
+        "# TYPE db_pool_call_seconds histogram",
+    ]
+    for name, metrics in (("db_pool_queue_seconds", db_pool_queue), ("db_pool_call_seconds", db_pool_calls)):
+        for bound, count in zip(LATENCY_BUCKETS, metrics.buckets):
+            lines.append(f'{name}_bucket{{le="{bound}"}} {count}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {metrics.count}')
+        lines.append(f"{name}_sum {metrics.total:.6f}")
+        lines.append(f"{name}_count {metrics.count}")
+    lines.append(f"db_pool_timeouts_total {db_pool_queue.errors}")
+    lines.append(f"db_pool_pending {db_pool_pending}")
+    lines += [
+        "# TYPE db_connection_checkout_seconds histogram",
+        "# TYPE db_connection_timeouts_total counter",
+        "# TYPE db_connection_disconnects_total counter",
+        "# TYPE db_connections_in_use gauge",
+        "# TYPE db_connections_idle gauge",
+        "# TYPE db_connections_overflow gauge",
+        "# TYPE db_connections_limit gauge",
+    ]
+    for name, db_engine in sorted(db_engines.items()):
+        pool = db_engine.pool
+        metrics = getattr(pool, "metrics", None)
+        if metrics is None:
+            continue
+        label = f'pool="{name}"'
+        for bound, count in zip(LATENCY_BUCKETS, metrics.buckets):
+            lines.append(f'db_connection_checkout_seconds_bucket{{{label},le="{bound}"}} {count}')
+        lines.append(f'db_connection_checkout_seconds_bucket{{{label},le="+Inf"}} {metrics.count}')
+        lines.append(f"db_connection_checkout_seconds_sum{{{label}}} {metrics.total:.6f}")
+        lines.append(f"db_connection_checkout_seconds_count{{{label}}} {metrics.count}")
+        lines.append(f"db_connection_timeouts_total{{{label}}} {metrics.errors}")
+        lines.append(f"db_connection_disconnects_total{{{label}}} {metrics.disconnects}")
+        lines.append(f"db_connections_in_use{{{label}}} {pool.checkedout()}")
+        lines.append(f"db_connections_idle{{{label}}} {pool.checkedin()}")
+        lines.append(f"db_connections_overflow{{{label}}} {max(0, pool.overflow())}")
+        lines.append(f"db_connections_limit{{{label}}} {pool.size() + pool._max_overflow}")
+    return "\n".join(lines) + "\n"
+
+
+def fetch_all_sync(q) -> List[Any]:
+    for attempt in range(2):
+        try:
+            with read_session() as session:
+                return list(session.execute(q).all())
+        except exc.DBAPIError as e:
+            if attempt or not e.connection_invalidated:
+                raise
+            logger.warning(f"db connection lost, retrying read: {e.orig}")
+
+
+async def fetch_all(q) -> List[Any]:
+    """
+    Строки результата SELECT без блокировки цикла событий: через асинхронный движок,
+    а без асинхронного драйвера - синхронной сессией в пуле потоков. Читает с реплики, если она есть.
+    Чтение повторяется один раз, если соединение оказалось разорванным: без pre-ping
+    (DB_PGBOUNCER) так обнаруживаются соединения, закрытые сервером.
+    """
+    if not ASYNC_DB_AVAILABLE:
+        return await run_in_db_pool(fetch_all_sync, q)
+    for attempt in range(2):
+        try:
+            async with async_local_session(replica_router.url()) as session:
+                return list((await session.execute(q)).all())
+        except exc.DBAPIError as e:
+            if attempt or not e.connection_invalidated:
+                raise
+            logger.warning(f"db connection lost, retrying read: {e.orig}")
+
+
+async def fetch_scalars(q) -> List[Any]:
+    """Первый столбец каждой строки результата SELECT, например сущности или id."""
+    return [row[0] for row in await fetch_all(q)]
+
+
+def decode_json(column_name: str, value):
+    """Значение JSON-колонки, сохранённое строкой, декодируется."""
+    if isinstance(value, (str, bytes)):
+        try:
+            return json.loads(value)
+        except (TypeError, json.JSONDecodeError) as e:
+            logger.error(f"Error decoding JSON for column '{column_name}': {e}")
+    return value
+
+
 class Base(declarative_base()):
     __table__: Table
     __tablename__: str
@@ -75,21 +455,45 @@ class Base(declarative_base()):
     def __init_subclass__(cls, **kwargs):
         REGISTRY[cls.__name__] = cls
 
+    @classmethod
+    def projection(cls) -> Tuple[Tuple[str, ...], Tuple[str, ...], Tuple[Column, ...]]:
+        """Имена колонок для dict(), имена JSON-колонок и сами колонки, вычисляются один раз на класс."""
+        projection = cls.__dict__.get("_projection")
+        if projection is None:
+            columns = tuple(column for column in cls.__table__.columns if column.key not in FILTERED_FIELDS)
+            projection = (
+                tuple(column.key for column in columns),
+                tuple(column.key for column in columns if isinstance(column.type, JSON)),
+                columns,
+            )
+            cls._projection = projection
+        return projection
+
+    @classmethod
+    def columns(cls) -> Tuple[Column, ...]:
+        """Колонки для Core-запросов без ORM-объектов: select(*Shout.columns())."""
+        return cls.projection()[2]
+
+    @classmethod
+    def row_dict(cls, row, start: int = 0) -> Dict[str, Any]:
+        """
+        Словарь из строки Core-запроса, колонки класса идут подряд с позиции start
+        в порядке columns(). Без ORM-объекта и identity map, для списков только на чтение.
+        """
+        names, json_names, _ = cls.projection()
+        data = dict(zip(names, row[start : start + len(names)]))
+        for name in json_names:
+            data[name] = decode_json(name, data[name])
+        return data
+
     def dict(self) -> Dict[str, Any]:
-        column_names = filter(lambda x: x not in FILTERED_FIELDS, self.__table__.columns.keys())
+        names, json_names, _ = self.projection()
         data = {}
         try:
-            for column_name in column_names:
-                value = getattr(self, column_name)
-                # Check if the value is JSON and decode it if necessary
-                if isinstance(value, (str, bytes)) and isinstance(self.__table__.columns[column_name].type, JSON):
-                    try:
-                        data[column_name] = json.loads(value)
-                    except (TypeError, json.JSONDecodeError) as e:
-                        logger.error(f"Error decoding JSON for column '{column_name}': {e}")
-                        data[column_name] = value
-                else:
-                    data[column_name] = value
+            data = {name: getattr(self, name) for name in names}
+            # Check if the value is JSON and decode it if necessary
+            for name in json_names:
+                data[name] = decode_json(name, data[name])
             # Add synthetic field .stat if it exists
             if hasattr(self, "stat"):
                 data["stat"] = self.stat
@@ -119,49 +523,27 @@ warnings.showwarning = warning_with_traceback
 warnings.simplefilter("always", exc.SAWarning)
 
 
-# Функция для извлечения SQL-запроса из контекста
-def get_statement_from_context(context):
-    query = ""
-    compiled = context.compiled
-    if compiled:
-        compiled_statement = compiled.string
-        compiled_parameters = compiled.params
-        if compiled_statement:
-            if compiled_parameters:
-                try:
-                    # Безопасное форматирование параметров
-                    query = compiled_statement % compiled_parameters
-                except Exception as e:
-                    logger.error(f"Error formatting query: {e}")
-            else:
-                query = compiled_statement
-    if query:
-        query = query.replace("\n", " ").replace("  ", " ").replace("  ", " ").strip()
-    return query
-
-
-# Обработчик события перед выполнением запроса
+# Обработчик события перед выполнением запроса: время старта хранится в контексте выполнения
 @event.listens_for(Engine, "before_cursor_execute")
 def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
-    conn.query_start_time = time.time()
-    conn.cursor_id = id(cursor)  # Отслеживание конкретного курсора
+    if context is not None:
+        context._query_started = time.perf_counter()
+
+
+# Разорванные соединения: SQLAlchemy заменяет их в пуле, здесь только учёт для метрик
+@event.listens_for(Engine, "handle_error")
+def handle_error(context):
+    metrics = getattr(context.engine.pool, "metrics", None) if context.engine else None
+    if context.is_disconnect and metrics is not None:
+        metrics.disconnects += 1
 
 
-# Обработчик события после выполнения запроса
+# Обработчик события после выполнения запроса: учёт в профилировщике по отпечатку запроса
 @event.listens_for(Engine, "after_cursor_execute")
 def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
-    if hasattr(conn, "cursor_id") and conn.cursor_id == id(cursor):
-        query = get_statement_from_context(context)
-        if query:
-            elapsed = time.time() - conn.query_start_time
-            if elapsed > 1:
-                query_end = query[-16:]
-                query = query.split(query_end)[0] + query_end
-                logger.debug(query)
-                elapsed_n = math.floor(elapsed)
-                logger.debug("*" * (elapsed_n))
-                logger.debug(f"{elapsed:.3f} s")
-        del conn.cursor_id  # Удаление идентификатора курсора после выполнения
+    started = getattr(context, "_query_started", None)
+    if started is not None and QUERY_PROFILER:
+        query_profiler.record(statement, parameters, time.perf_counter() - started)
 
 
 def get_json_builder():
@@ -181,3 +563,111 @@ def get_json_builder():
 
 # Используем их в коде
 json_builder, json_array_builder, json_cast = get_json_builder()
+
+
+BENCH_QUERY = "SELECT id, slug FROM shout WHERE published_at IS NOT NULL ORDER BY published_at DESC LIMIT 20"
+
+
+async def bench(concurrency=50, requests=1000, query=BENCH_QUERY):
+    """
+    Пропускная способность и задержка цикла событий при concurrency параллельных запросах:
+    синхронная сессия в корутине, синхронная сессия в потоках и асинхронный движок.
+    """
+
+    async def sync_in_loop():
+        fetch_all_sync(text(query))
+
+    async def sync_in_pool():
+        await run_in_db_pool(fetch_all_sync, text(query))
+
+    async def async_engine_query():
+        async with async_local_session() as session:
+            (await session.execute(text(query))).all()
+
+    modes = {"sync": sync_in_loop, "db pool": sync_in_pool}
+    if get_async_engine():
+        modes["async"] = async_engine_query
+    else:
+        print(f"{ASYNC_DB_DRIVER} is not installed, async engine skipped")
+
+    for name, run in modes.items():
+        lag = []
+        done = asyncio.Event()
+
+        async def ticker():
+            # насколько опаздывает цикл событий, пока идут запросы
+            while not done.is_set():
+                started = time.perf_counter()
+                await asyncio.sleep(0.01)
+                lag.append(time.perf_counter() - started - 0.01)
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited():
+            async with semaphore:
+                await run()
+
+        tick = asyncio.create_task(ticker())
+        started = time.perf_counter()
+        await asyncio.gather(*(limited() for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await tick
+        lag.sort()
+        p99 = lag[min(len(lag) - 1, int(len(lag) * 0.99))] * 1000 if lag else 0
+        print(
+            f"{name:<7} {requests / elapsed:>8.0f} req/s  loop lag max={lag[-1] * 1000 if lag else 0:.1f}ms p99={p99:.1f}ms"
+        )
+    for async_engine in async_engines.values():
+        await async_engine.dispose()
+
+
+def bench_compile(rounds=1000):
+    """
+    Стоимость построения и компиляции горячих запросов на один запрос: компиляция с нуля
+    против вычисления ключа для поиска в кэше скомпилированных запросов.
+    """
+    from orm.author import Author
+    from orm.reaction import Reaction
+    from orm.shout import Shout
+    from resolvers.reaction import add_reaction_stat_columns, query_reaction_rows
+    from resolvers.reader import apply_sorting, shouts_query
+    from resolvers.stat import AUTHOR_COMMENTS_STAT, add_author_stat_columns, add_topic_stat_columns
+
+    builders = {
+        "shouts": lambda: apply_sorting(shouts_query(True, True, True, True), {}).where(Shout.id == 1),
+        "reactions": lambda: add_reaction_stat_columns(query_reaction_rows()).where(Reaction.shout == 1),
+        "authors stat": lambda: add_author_stat_columns(select(Author).where(Author.id == 1)),
+        "topics stat": lambda: add_topic_stat_columns(None),
+        "author comments": lambda: AUTHOR_COMMENTS_STAT,
+    }
+    dialect = engine.dialect
+    for name, build in builders.items():
+        started = time.perf_counter()
+        for _ in range(rounds):
+            build()
+        built = (time.perf_counter() - started) / rounds
+        q = build()
+        started = time.perf_counter()
+        for _ in range(rounds):
+            q.compile(dialect=dialect)
+        compiled = (time.perf_counter() - started) / rounds
+        started = time.perf_counter()
+        for _ in range(rounds):
+            build()._generate_cache_key()
+        cached = (time.perf_counter() - started) / rounds - built  # ключ кэша для нового объекта запроса
+        print(
+            f"{name:<16} build={built * 1e6:>7.0f}us compile={compiled * 1e6:>7.0f}us "
+            f"cache hit={cached * 1e6:>7.0f}us saved={(compiled - cached) * 1e6:>7.0f}us"
+        )
+
+
+if __name__ == "__main__":
+    # python -m services.db bench [concurrency] [requests]
+    # python -m services.db compile [rounds]
+    if sys.argv[1:2] == ["bench"]:
+        asyncio.run(bench(*map(int, sys.argv[2:4])))
+    elif sys.argv[1:2] == ["compile"]:
+        bench_compile(*map(int, sys.argv[2:3]))
+    else:
+        print("usage: python -m services.db bench [concurrency] [requests] | compile [rounds]")
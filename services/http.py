@@ -0,0 +1,171 @@
+import asyncio
+import random
+import time
+from importlib.util import find_spec
+from typing import Dict
+from urllib.parse import urlsplit
+
+import httpx
+
+from settings import (
+    HTTP_BREAKER_RESET,
+    HTTP_BREAKER_THRESHOLD,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_RETRIES,
+    HTTP_TIMEOUT,
+)
+from utils.logger import root_logger as logger
+
+RETRY_STATUSES = {502, 503, 504}
+RETRY_BACKOFF = 0.1  # секунды, удваивается с каждой попыткой
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class CircuitOpenError(Exception):
+    """Сервис недоступен, запрос отклонён без обращения к сети."""
+
+
+class CircuitBreaker:
+    def __init__(self, threshold=HTTP_BREAKER_THRESHOLD, reset_timeout=HTTP_BREAKER_RESET):
+        """
+        Размыкается после threshold неудач подряд, через reset_timeout секунд
+        пропускает один пробный запрос и замыкается при его успехе.
+        """
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.failures < self.threshold:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        self.probing = False
+
+    def failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+class EndpointMetrics:
+    """Гистограмма задержек и счётчики ошибок по одному адресу."""
+
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.rejected = 0
+
+    def observe(self, seconds: float, error=False):
+        self.count += 1
+        self.total += seconds
+        self.errors += error
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+
+
+class HTTPClientService:
+    def __init__(self):
+        """Общий HTTP-клиент приложения с пулом соединений, создаётся в lifespan."""
+        self.client: httpx.AsyncClient | None = None
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.metrics: Dict[str, EndpointMetrics] = {}
+
+    async def start(self):
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS),
+            http2=find_spec("h2") is not None,
+        )
+
+    async def stop(self):
+        if self.client:
+            await self.client.aclose()
+            self.client = None
+
+    async def request(self, method: str, url: str, retries=HTTP_RETRIES, **kwargs) -> httpx.Response:
+        """
+        Запрос через общий клиент: повтор с экспоненциальной задержкой и джиттером
+        при сетевых ошибках и 502/503/504, отказ без запроса при разомкнутом автомате хоста.
+
+        :raises CircuitOpenError: Хост недавно не отвечал.
+        :raises httpx.HTTPError: Ошибка после всех повторов.
+        """
+        parts = urlsplit(url)
+        breaker = self.breakers.setdefault(parts.netloc, CircuitBreaker())
+        metrics = self.metrics.setdefault(f"{parts.netloc}{parts.path}", EndpointMetrics())
+        if not self.client:
+            # вне lifespan (скрипты, тесты) клиент создаётся при первом обращении
+            await self.start()
+        for attempt in range(retries + 1):
+            if not breaker.allow():
+                metrics.rejected += 1
+                raise CircuitOpenError(f"{parts.netloc} is unavailable")
+            start = time.perf_counter()
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                metrics.observe(time.perf_counter() - start, error=True)
+                breaker.failure()
+                if attempt == retries:
+                    raise
+                logger.warning(f"{method} {url} failed: {e!r}, retrying")
+            else:
+                failed = response.status_code in RETRY_STATUSES
+                metrics.observe(time.perf_counter() - start, error=failed)
+                if not failed:
+                    breaker.success()
+                    return response
+                breaker.failure()
+                if attempt == retries:
+                    return response
+                logger.warning(f"{method} {url}: {response.status_code}, retrying")
+            await asyncio.sleep(random.uniform(0, RETRY_BACKOFF * 2**attempt))
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    def export_metrics(self) -> str:
+        """Метрики исходящих запросов в текстовом формате Prometheus."""
+        lines = [
+            "# TYPE http_client_request_duration_seconds histogram",
+            "# TYPE http_client_errors_total counter",
+            "# TYPE http_client_rejected_total counter",
+        ]
+        for endpoint, metrics in sorted(self.metrics.items()):
+            label = f'endpoint="{endpoint}"'
+            for bound, count in zip(LATENCY_BUCKETS, metrics.buckets):
+                lines.append(f'http_client_request_duration_seconds_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'http_client_request_duration_seconds_bucket{{{label},le="+Inf"}} {metrics.count}')
+            lines.append(f"http_client_request_duration_seconds_sum{{{label}}} {metrics.total:.6f}")
+            lines.append(f"http_client_request_duration_seconds_count{{{label}}} {metrics.count}")
+            lines.append(f"http_client_errors_total{{{label}}} {metrics.errors}")
+            lines.append(f"http_client_rejected_total{{{label}}} {metrics.rejected}")
+        return "\n".join(lines) + "\n"
+
+
+http_client = HTTPClientService()
@@ -0,0 +1,217 @@
+import sys
+import time
+from typing import Dict
+
+from sqlalchemy import and_, case, delete, func, insert, inspect, select, true, update
+from sqlalchemy.orm import aliased
+
+from orm.author import AuthorKarma, AuthorRating
+from orm.rating import RATING_REACTIONS
+from orm.reaction import Reaction, ReactionKind
+from orm.shout import ShoutAuthor
+from services.db import local_session
+from utils.logger import root_logger as logger
+
+KARMA_FIELDS = ("rating_shouts", "rating_comments", "rating_direct")
+
+rating_value = case(
+    (Reaction.kind == ReactionKind.LIKE.value, 1),
+    (Reaction.kind == ReactionKind.DISLIKE.value, -1),
+    else_=0,
+)
+direct_value = case((AuthorRating.plus == true(), 1), else_=-1)
+replied_comment = aliased(Reaction)
+
+
+def shouts_rating_query():
+    """Рейтинг публикаций: оценки публикаций, по каждому соавтору."""
+    return (
+        select(ShoutAuthor.author, func.coalesce(func.sum(rating_value), 0))
+        .select_from(Reaction)
+        .join(ShoutAuthor, ShoutAuthor.shout == Reaction.shout)
+        .where(
+            and_(
+                Reaction.reply_to.is_(None),
+                Reaction.deleted_at.is_(None),
+                Reaction.kind.in_(RATING_REACTIONS),
+            )
+        )
+        .group_by(ShoutAuthor.author)
+    )
+
+
+def comments_rating_query():
+    """Рейтинг комментариев: оценки комментариев, по автору комментария."""
+    return (
+        select(replied_comment.created_by, func.coalesce(func.sum(rating_value), 0))
+        .select_from(Reaction)
+        .join(replied_comment, replied_comment.id == Reaction.reply_to)
+        .where(
+            and_(
+                replied_comment.kind == ReactionKind.COMMENT.value,
+                Reaction.deleted_at.is_(None),
+                Reaction.kind.in_(RATING_REACTIONS),
+            )
+        )
+        .group_by(replied_comment.created_by)
+    )
+
+
+def direct_rating_query():
+    """Прямой рейтинг автора через rate_author."""
+    return select(AuthorRating.author, func.coalesce(func.sum(direct_value), 0)).group_by(AuthorRating.author)
+
+
+def count_author_karma(connection, author_id: int) -> Dict[str, int]:
+    """
+    Полный пересчёт рейтинга одного автора.
+
+    :param connection: Соединение или сессия.
+    :param author_id: Идентификатор автора.
+    :return: Словарь со значениями KARMA_FIELDS.
+    """
+    queries = {
+        "rating_shouts": shouts_rating_query().where(ShoutAuthor.author == author_id),
+        "rating_comments": comments_rating_query().where(replied_comment.created_by == author_id),
+        "rating_direct": direct_rating_query().where(AuthorRating.author == author_id),
+    }
+    karma = {}
+    for field, q in queries.items():
+        row = connection.execute(q).first()
+        karma[field] = int(row[1]) if row else 0
+    return karma
+
+
+def update_author_karma(connection, author_id: int, field: str, delta: int):
+    """
+    Инкрементально изменяет рейтинг автора в той же транзакции.
+
+    Если строки проекции ещё нет, рейтинг автора пересчитывается полностью.
+    """
+    if not author_id or not delta:
+        return
+    now = int(time.time())
+    result = connection.execute(
+        update(AuthorKarma)
+        .where(AuthorKarma.author == author_id)
+        .values(
+            {
+                field: getattr(AuthorKarma, field) + delta,
+                "rating": AuthorKarma.rating + delta,
+                "updated_at": now,
+            }
+        )
+    )
+    if not result.rowcount:
+        karma = count_author_karma(connection, author_id)
+        connection.execute(
+            insert(AuthorKarma).values(author=author_id, rating=sum(karma.values()), updated_at=now, **karma)
+        )
+
+
+def rebuild_author_karma(session) -> int:
+    """
+    Полная перестройка проекции author_karma.
+
+    :param session: Сессия базы данных.
+    :return: Количество авторов с ненулевой строкой проекции.
+    """
+    karma: Dict[int, Dict[str, int]] = {}
+    for field, q in (
+        ("rating_shouts", shouts_rating_query()),
+        ("rating_comments", comments_rating_query()),
+        ("rating_direct", direct_rating_query()),
+    ):
+        for author_id, value in session.execute(q).all():
+            if author_id:
+                karma.setdefault(author_id, dict.fromkeys(KARMA_FIELDS, 0))[field] = int(value)
+
+    now = int(time.time())
+    session.execute(delete(AuthorKarma))
+    if karma:
+        session.execute(
+            insert(AuthorKarma),
+            [
+                {"author": author_id, "rating": sum(values.values()), "updated_at": now, **values}
+                for author_id, values in karma.items()
+            ],
+        )
+    session.commit()
+    return len(karma)
+
+
+def reaction_karma_targets(connection, reaction):
+    """
+    Определяет, чей рейтинг меняет реакция.
+
+    :return: Поле проекции и список авторов.
+    """
+    if reaction.kind not in RATING_REACTIONS:
+        return None, []
+    if reaction.reply_to:
+        replied = connection.execute(
+            select(Reaction.created_by).where(
+                and_(Reaction.id == reaction.reply_to, Reaction.kind == ReactionKind.COMMENT.value)
+            )
+        ).first()
+        return "rating_comments", [replied[0]] if replied else []
+    shout_id = reaction.shout if isinstance(reaction.shout, int) else reaction.shout.id
+    authors = connection.execute(select(ShoutAuthor.author).where(ShoutAuthor.shout == shout_id)).scalars().all()
+    return "rating_shouts", authors
+
+
+def reaction_delta(reaction, sign: int):
+    field_delta = 1 if reaction.kind == ReactionKind.LIKE.value else -1
+    return field_delta * sign
+
+
+def deleted_at_sign(target) -> int:
+    """+1 если реакция восстановлена, -1 если помечена удалённой, 0 без изменений."""
+    history = inspect(target).attrs.deleted_at.history
+    if not history.has_changes():
+        return 0
+    was_deleted = bool(history.deleted and history.deleted[0])
+    is_deleted = target.deleted_at is not None
+    if was_deleted == is_deleted:
+        return 0
+    return -1 if is_deleted else 1
+
+
+def after_reaction_karma_handler(mapper, connection, target, sign=None):
+    """Обновление author_karma при создании, удалении и мягком удалении оценки."""
+    try:
+        if sign is None:
+            sign = deleted_at_sign(target)
+        elif target.deleted_at is not None:
+            return
+        if not sign:
+            return
+        field, authors = reaction_karma_targets(connection, target)
+        for author_id in authors:
+            update_author_karma(connection, author_id, field, reaction_delta(target, sign))
+    except Exception as e:
+        logger.error(f"author karma update failed for reaction#{target.id}: {e}")
+
+
+def after_author_rating_handler(mapper, connection, target, sign=None):
+    """Обновление author_karma при изменении прямого рейтинга автора."""
+    try:
+        value = 1 if target.plus else -1
+        if sign is not None:
+            update_author_karma(connection, target.author, "rating_direct", value * sign)
+            return
+        history = inspect(target).attrs.plus.history
+        if history.has_changes() and history.deleted:
+            old_value = 1 if history.deleted[0] else -1
+            update_author_karma(connection, target.author, "rating_direct", value - old_value)
+    except Exception as e:
+        logger.error(f"author karma update failed for author#{target.author}: {e}")
+
+
+if __name__ == "__main__":
+    # python -m services.karma rebuild
+    if sys.argv[1:] == ["rebuild"]:
+        with local_session() as session:
+            logger.info(f"author karma rebuilt for {rebuild_author_karma(session)} authors")
+    else:
+        print("usage: python -m services.karma rebuild")
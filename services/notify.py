@@ -1,6 +1,6 @@
 import json
 
-from orm.notification import Notification
+from orm.notification import Notification, notification_author, notification_thread
 from services.db import local_session
 from services.redis import redis
 from utils.logger import root_logger as logger
@@ -8,7 +8,13 @@ from utils.logger import root_logger as logger
 
 def save_notification(action: str, entity: str, payload):
     with local_session() as session:
-        n = Notification(action=action, entity=entity, payload=payload)
+        n = Notification(
+            action=action,
+            entity=entity,
+            payload=payload,
+            author=notification_author(entity, payload),
+            thread=notification_thread(entity, payload),
+        )
         session.add(n)
         session.commit()
 
@@ -0,0 +1,174 @@
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Dict, List
+
+from sqlalchemy import and_, select, update
+
+from orm.outbox import Outbox, OutboxKind
+from services.db import local_session
+from utils.logger import root_logger as logger
+
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 5  # секунды
+BACKOFF_MAX = 60 * 60
+OUTBOX_LEASE = 5 * 60  # задача закреплена за выбравшим её диспетчером на время обработки
+
+
+def enqueue(session, kind: OutboxKind, payload: dict):
+    """
+    Добавляет задачу в outbox в текущей транзакции.
+
+    Коммит остаётся за вызывающим кодом: задача сохраняется вместе с изменением данных.
+    """
+    session.add(Outbox(kind=kind.value, payload=payload))
+
+
+def backoff_delay(attempts: int) -> int:
+    """Экспоненциальная задержка с джиттером."""
+    delay = min(BACKOFF_BASE * 2 ** max(attempts - 1, 0), BACKOFF_MAX)
+    return int(delay * random.uniform(0.5, 1.0)) or 1
+
+
+async def handle_add_user_role(payloads: List[dict]) -> List[bool]:
+    """Выдаёт роль автора пачке пользователей через общий HTTP-клиент."""
+    from services.auth import add_user_role
+
+    results = await asyncio.gather(*(add_user_role(p.get("user_id")) for p in payloads), return_exceptions=True)
+    return [bool(r) and not isinstance(r, Exception) for r in results]
+
+
+OUTBOX_HANDLERS: Dict[str, Callable[[List[dict]], Awaitable[List[bool]]]] = {
+    OutboxKind.ADD_USER_ROLE.value: handle_add_user_role,
+}
+
+
+class OutboxDispatcher:
+    def __init__(self, interval=10, batch_size=50):
+        """Инициализация диспетчера с интервалом опроса (в секундах) и размером пачки."""
+        self.interval = interval
+        self.batch_size = batch_size
+        self.running = True
+        self.wakeup = asyncio.Event()
+
+    async def start(self):
+        """Запуск фонового диспетчера outbox."""
+        self.task = asyncio.create_task(self.worker())
+
+    def notify(self):
+        """Разбудить диспетчер после записи новой задачи."""
+        self.wakeup.set()
+
+    async def worker(self):
+        """Обработка задач по сигналу или раз в self.interval секунд."""
+        try:
+            while self.running:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=self.interval)
+                except asyncio.TimeoutError:
+                    pass
+                self.wakeup.clear()
+                while await self.process_batch() == self.batch_size:
+                    pass
+        except asyncio.CancelledError:
+            logger.info("Outbox dispatcher was stopped.")
+
+    @staticmethod
+    def claim_due(batch_size: int) -> List[Outbox]:
+        """
+        Выбирает и закрепляет пачку задач одним UPDATE ... RETURNING: next_attempt_at
+        сдвигается на OUTBOX_LEASE, поэтому диспетчеры других воркеров эти задачи не видят.
+        Строки, заблокированные параллельным диспетчером, пропускаются (SKIP LOCKED).
+        Если диспетчер упадёт, задачи снова станут доступны по истечении аренды.
+        """
+        now = int(time.time())
+        with local_session() as session:
+            due = (
+                select(Outbox.id)
+                .where(
+                    and_(
+                        Outbox.processed_at.is_(None),
+                        Outbox.next_attempt_at <= now,
+                        Outbox.attempts < MAX_ATTEMPTS,
+                    )
+                )
+                .order_by(Outbox.id)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            items = session.execute(
+                update(Outbox)
+                .where(Outbox.id.in_(due.scalar_subquery()), Outbox.next_attempt_at <= now)
+                .values(next_attempt_at=now + OUTBOX_LEASE)
+                .returning(Outbox)
+                .execution_options(synchronize_session=False)
+            )
+            items = sorted(items.scalars().all(), key=lambda item: item.id)
+            session.commit()
+            return items
+
+    @staticmethod
+    def save_results(done: List[int], failed: Dict[int, tuple[int, str]]):
+        now = int(time.time())
+        with local_session() as session:
+            if done:
+                session.execute(update(Outbox).where(Outbox.id.in_(done)).values(processed_at=now))
+            for outbox_id, (attempts, error) in failed.items():
+                session.execute(
+                    update(Outbox)
+                    .where(Outbox.id == outbox_id)
+                    .values(attempts=attempts, next_attempt_at=now + backoff_delay(attempts), last_error=error)
+                )
+            session.commit()
+
+    async def process_batch(self) -> int:
+        """
+        Обрабатывает одну пачку задач.
+
+        :return: Количество выбранных задач.
+        """
+        try:
+            items = await asyncio.to_thread(self.claim_due, self.batch_size)
+            if not items:
+                return 0
+            by_kind: Dict[str, List[Outbox]] = {}
+            for item in items:
+                by_kind.setdefault(item.kind, []).append(item)
+
+            done, failed = [], {}
+            for kind, kind_items in by_kind.items():
+                handler = OUTBOX_HANDLERS.get(kind)
+                if not handler:
+                    failed.update({item.id: (MAX_ATTEMPTS, f"unknown kind {kind}") for item in kind_items})
+                    continue
+                try:
+                    results = await handler([item.payload or {} for item in kind_items])
+                except Exception as e:
+                    results = [False] * len(kind_items)
+                    logger.error(f"outbox {kind} handler error: {e}")
+                for item, ok in zip(kind_items, results):
+                    if ok:
+                        done.append(item.id)
+                    else:
+                        failed[item.id] = (item.attempts + 1, f"{kind} failed")
+
+            await asyncio.to_thread(self.save_results, done, failed)
+            if failed:
+                logger.warning(f"outbox: {len(done)} done, {len(failed)} scheduled for retry")
+            return len(items)
+        except Exception as e:
+            logger.error(f"Outbox dispatch error: {e}")
+            return 0
+
+    async def stop(self):
+        """Остановка диспетчера."""
+        self.running = False
+        if hasattr(self, "task"):
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+
+outbox_dispatcher = OutboxDispatcher()
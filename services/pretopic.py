@@ -1,24 +1,58 @@
 import concurrent.futures
-from typing import Dict, List, Tuple
+import hashlib
+import json
+import os
+import shutil
+import threading
+from typing import Dict, Iterable, List, Tuple
 
 from txtai.embeddings import Embeddings
 
-from services.logger import root_logger as logger
+from settings import PRETOPIC_INDEX_PATH, PRETOPIC_MODEL_NAME, PRETOPIC_MODEL_PATH
+from utils.logger import root_logger as logger
+
+# Меняется при изменении формата документов или настроек индекса, старые версии не загружаются
+INDEX_VERSION = 2
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def publication_text(pub: Dict[str, str]) -> str:
+    return f"{pub['title']} {pub['text']}"
+
+
+def local_model_path() -> str:
+    """
+    Путь к локальной копии модели, при первом запуске модель скачивается в PRETOPIC_MODEL_PATH.
+    """
+    if not os.path.isdir(PRETOPIC_MODEL_PATH):
+        from huggingface_hub import snapshot_download
+
+        logger.info(f"Скачиваем модель {PRETOPIC_MODEL_NAME} в {PRETOPIC_MODEL_PATH}...")
+        snapshot_download(PRETOPIC_MODEL_NAME, local_dir=PRETOPIC_MODEL_PATH)
+    return PRETOPIC_MODEL_PATH
 
 
 class TopicClassifier:
-    def __init__(self, shouts_by_topic: Dict[str, str], publications: List[Dict[str, str]]):
+    def __init__(self, shouts_by_topic: Dict[str, str], publications: List[Dict[str, str]], index_path=None):
         """
         Инициализация классификатора тем и поиска публикаций.
         Args:
             shouts_by_topic: Словарь {тема: текст_всех_публикаций}
             publications: Список публикаций с полями 'id', 'title', 'text'
+            index_path: Каталог для сохранения индексов, по умолчанию PRETOPIC_INDEX_PATH
         """
         self.shouts_by_topic = shouts_by_topic
         self.topics = list(shouts_by_topic.keys())
-        self.publications = publications
+        self.publications = {str(pub["id"]): pub for pub in publications}
+        self.index_path = os.path.join(index_path or PRETOPIC_INDEX_PATH, f"v{INDEX_VERSION}")
         self.topic_embeddings = None  # Для классификации тем
         self.search_embeddings = None  # Для поиска публикаций
+        self.hashes = {"topics": {}, "shouts": {}}  # хэши проиндексированных текстов
+        # publications, hashes и запись в индексы меняются и из фоновой подготовки, и из вызывающих потоков
+        self.lock = threading.RLock()
         self._initialization_future = None
         self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
 
@@ -30,27 +64,130 @@ class TopicClassifier:
             self._initialization_future = self._executor.submit(self._prepare_embeddings)
             logger.info("Векторизация текстов начата в фоновом режиме...")
 
+    def _new_embeddings(self, model_path: str) -> Embeddings:
+        # faiss с mmap: сохранённый индекс отображается в память, а не читается целиком
+        return Embeddings({"path": model_path, "content": False, "backend": "faiss", "faiss": {"mmap": True}})
+
+    def _load_or_create(self, name: str, model_path: str) -> Embeddings:
+        path = os.path.join(self.index_path, name)
+        embeddings = self._new_embeddings(model_path)
+        if embeddings.exists(path):
+            embeddings.load(path, config={"path": model_path})
+        return embeddings
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.index_path, "meta.json")
+
+    def _load_meta(self):
+        try:
+            with open(self._meta_path()) as f:
+                meta = json.load(f)
+            if meta.get("model") == PRETOPIC_MODEL_NAME:
+                self.hashes = meta["hashes"]
+                return
+            logger.warning("Индекс построен другой моделью, строим заново")
+            shutil.rmtree(self.index_path, ignore_errors=True)
+        except FileNotFoundError:
+            pass
+        self.hashes = {"topics": {}, "shouts": {}}
+
+    def _sync(self, embeddings: Embeddings, kind: str, documents: Dict[str, str]) -> bool:
+        """
+        Приводит индекс к актуальному набору документов: добавляет новые и изменённые, удаляет лишние.
+
+        Returns:
+            bool: были ли изменения
+        """
+        known = self.hashes[kind]
+        current = {doc_id: text_hash(text) for doc_id, text in documents.items()}
+        removed = [doc_id for doc_id in known if doc_id not in current]
+        changed = [doc_id for doc_id, h in current.items() if known.get(doc_id) != h]
+        if removed and embeddings.count():
+            embeddings.delete(removed)
+        if changed:
+            batch = [(doc_id, documents[doc_id], None) for doc_id in changed]
+            if embeddings.count():
+                embeddings.upsert(batch)
+            else:
+                embeddings.index(batch)
+        self.hashes[kind] = current
+        if removed or changed:
+            logger.info(f"Индекс {kind}: +{len(changed)} -{len(removed)}")
+        return bool(removed or changed)
+
     def _prepare_embeddings(self) -> None:
         """
-        Подготавливает векторные представления для тем и поиска.
+        Загружает сохранённые векторные представления и досчитывает только изменившиеся документы.
         """
         logger.info("Начинается подготовка векторных представлений...")
+        model_path = local_model_path()
+        self._load_meta()
 
-        # Модель для русского языка
-        # TODO: model local caching
-        model_path = "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
+        topic_embeddings = self._load_or_create("topics", model_path)
+        search_embeddings = self._load_or_create("shouts", model_path)
+        changed = self._sync(topic_embeddings, "topics", self.shouts_by_topic)
+        # долгая векторизация идёт по копии, add_publications тем временем пополняет self.publications
+        with self.lock:
+            documents = {pub_id: publication_text(pub) for pub_id, pub in self.publications.items()}
+        changed = self._sync(search_embeddings, "shouts", documents) or changed
+
+        with self.lock:
+            # публикации, добавленные и удалённые во время векторизации
+            documents = {pub_id: publication_text(pub) for pub_id, pub in self.publications.items()}
+            changed = self._sync(search_embeddings, "shouts", documents) or changed
+            self.topic_embeddings = topic_embeddings
+            self.search_embeddings = search_embeddings
+            if changed:
+                self.save()
+        logger.info("Подготовка векторных представлений завершена.")
 
-        # Инициализируем embeddings для классификации тем
-        self.topic_embeddings = Embeddings(path=model_path)
-        topic_documents = [(topic, text) for topic, text in self.shouts_by_topic.items()]
-        self.topic_embeddings.index(topic_documents)
+    def save(self) -> None:
+        """
+        Сохраняет индексы и хэши документов на диск.
+        """
+        os.makedirs(self.index_path, exist_ok=True)
+        self.topic_embeddings.save(os.path.join(self.index_path, "topics"))
+        self.search_embeddings.save(os.path.join(self.index_path, "shouts"))
+        with open(self._meta_path(), "w") as f:
+            json.dump({"model": PRETOPIC_MODEL_NAME, "version": INDEX_VERSION, "hashes": self.hashes}, f)
 
-        # Инициализируем embeddings для поиска публикаций
-        self.search_embeddings = Embeddings(path=model_path)
-        search_documents = [(str(pub["id"]), f"{pub['title']} {pub['text']}") for pub in self.publications]
-        self.search_embeddings.index(search_documents)
+    def add_publications(self, publications: Iterable[Dict[str, str]], save=True) -> None:
+        """
+        Добавляет или обновляет публикации в поисковом индексе.
+        До готовности индекса публикации только запоминаются, подготовка доиндексирует их.
+        """
+        with self.lock:
+            if not self.is_ready():
+                self.publications.update({str(pub["id"]): pub for pub in publications})
+                return
+            batch = []
+            for pub in publications:
+                pub_id = str(pub["id"])
+                text = publication_text(pub)
+                if self.hashes["shouts"].get(pub_id) != text_hash(text):
+                    batch.append((pub_id, text, None))
+                    self.hashes["shouts"][pub_id] = text_hash(text)
+                self.publications[pub_id] = pub
+            if batch:
+                self.search_embeddings.upsert(batch)
+                if save:
+                    self.save()
 
-        logger.info("Подготовка векторных представлений завершена.")
+    def remove_publications(self, ids: Iterable, save=True) -> None:
+        """
+        Удаляет публикации из поискового индекса.
+        """
+        ids = [str(pub_id) for pub_id in ids]
+        with self.lock:
+            for pub_id in ids:
+                self.publications.pop(pub_id, None)
+            if not self.is_ready():
+                return
+            indexed = [pub_id for pub_id in ids if self.hashes["shouts"].pop(pub_id, None)]
+            if indexed:
+                self.search_embeddings.delete(indexed)
+                if save:
+                    self.save()
 
     def predict_topic(self, text: str) -> Tuple[float, str]:
         """
@@ -60,22 +197,39 @@ class TopicClassifier:
         Returns:
             Tuple[float, str]: (уверенность, тема)
         """
+        return self.predict_topics([text])[0]
+
+    def predict_topics(self, texts: List[str]) -> List[Tuple[float, str]]:
+        """
+        Пакетное определение тем: один проход модели на все тексты.
+        Args:
+            texts: Тексты для классификации
+        Returns:
+            List[Tuple[float, str]]: (уверенность, тема) для каждого текста
+        """
         if not self.is_ready():
             logger.error("Векторные представления не готовы. Вызовите initialize() и дождитесь завершения.")
-            return 0.0, "unknown"
+            return [(0.0, "unknown")] * len(texts)
 
         try:
             # Ищем наиболее похожую тему
-            results = self.topic_embeddings.search(text, 1)
-            if not results:
-                return 0.0, "unknown"
-
-            score, topic = results[0]
-            return float(score), topic
+            results = self.topic_embeddings.batchsearch(texts, 1)
+            return [(float(found[0][1]), found[0][0]) if found else (0.0, "unknown") for found in results]
 
         except Exception as e:
             logger.error(f"Ошибка при определении темы: {str(e)}")
-            return 0.0, "unknown"
+            return [(0.0, "unknown")] * len(texts)
+
+    def classify_drafts(self, drafts: List[Dict[str, str]]) -> Dict[str, Tuple[float, str]]:
+        """
+        Предлагает темы для черновиков.
+        Args:
+            drafts: Черновики с полями 'id', 'title', 'body'
+        Returns:
+            Dict: {id черновика: (уверенность, тема)}
+        """
+        texts = [f"{draft.get('title') or ''} {draft.get('body') or ''}" for draft in drafts]
+        return {str(draft["id"]): result for draft, result in zip(drafts, self.predict_topics(texts))}
 
     def search_similar(self, query: str, limit: int = 5) -> List[Dict[str, any]]:
         """
@@ -96,9 +250,8 @@ class TopicClassifier:
 
             # Формируем результаты
             found_publications = []
-            for score, pub_id in results:
-                # Находим публикацию по id
-                publication = next((pub for pub in self.publications if str(pub["id"]) == pub_id), None)
+            for pub_id, score in results:
+                publication = self.publications.get(str(pub_id))
                 if publication:
                     found_publications.append({**publication, "relevance": float(score)})
 
@@ -160,6 +313,13 @@ text = "Новый процессор показал высокую произв
 score, topic = classifier.predict_topic(text)
 print(f"Тема: {topic} (уверенность: {score:.4f})")
 
+# Темы для нескольких черновиков сразу
+suggestions = classifier.classify_drafts([{"id": 10, "title": "Матч года", "body": "..."}])
+
+# Новые и снятые с публикации материалы без полной перестройки индекса
+classifier.add_publications([{"id": 3, "title": "Новая видеокарта", "text": "..."}])
+classifier.remove_publications([2])
+
 # Поиск похожих публикаций
 query = "процессор AMD производительность"
 similar_publications = classifier.search_similar(query, limit=3)
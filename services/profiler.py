@@ -0,0 +1,188 @@
+import hmac
+import inspect
+import re
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Dict
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from settings import AUTH_SECRET, NPLUSONE_THRESHOLD, SLOW_QUERY_THRESHOLD
+from utils.logger import root_logger as logger
+
+PROFILE_SAMPLES = 256  # последние длительности по отпечатку для p95
+PROFILE_MAX_FINGERPRINTS = 2000
+NPLUSONE_REPORTS = 200
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\$\d+|(?<![:\w]):\w+|\?")
+IN_LIST = re.compile(r"\bIN\s*\((?:\s*\?\s*,)*\s*\?\s*\)", re.IGNORECASE)
+WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(statement: str) -> str:
+    """
+    Нормализованный вид запроса: литералы и параметры заменены на ?,
+    списки IN (...) любой длины сведены к одному виду, пробелы схлопнуты.
+    """
+    statement = STRING_LITERAL.sub("?", statement)
+    statement = PLACEHOLDER.sub("?", statement)
+    statement = NUMBER_LITERAL.sub("?", statement)
+    statement = IN_LIST.sub("IN (?+)", statement)
+    return WHITESPACE.sub(" ", statement).strip()
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=PROFILE_SAMPLES)
+        self.sources = Counter()  # резолвер -> число запросов
+
+    def add(self, elapsed: float, source: str):
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.samples.append(elapsed)
+        self.sources[source] += 1
+
+    def report(self, query: str) -> dict:
+        samples = sorted(self.samples)
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))] if samples else 0
+        return {
+            "query": query,
+            "count": self.count,
+            "total_ms": round(self.total * 1000, 2),
+            "mean_ms": round(self.total * 1000 / self.count, 2) if self.count else 0,
+            "p95_ms": round(p95 * 1000, 2),
+            "max_ms": round(self.max * 1000, 2),
+            "sources": dict(self.sources.most_common(5)),
+        }
+
+
+class RequestProfile:
+    """Запросы к БД в рамках одного HTTP-запроса для поиска N+1."""
+
+    def __init__(self):
+        self.operation = ""
+        self.queries = Counter()  # (резолвер, отпечаток) -> число запросов
+
+
+# GraphQL-операция и резолвер, от имени которых идут запросы к БД
+request_profile: ContextVar[RequestProfile | None] = ContextVar("request_profile", default=None)
+current_resolver: ContextVar[str] = ContextVar("current_resolver", default="")
+
+
+class QueryProfiler:
+    def __init__(self):
+        self.stats: Dict[str, QueryStats] = {}
+        self.nplusone: deque = deque(maxlen=NPLUSONE_REPORTS)
+        self.started_at = time.time()
+
+    def source(self) -> str:
+        profile = request_profile.get()
+        operation = profile.operation if profile else ""
+        resolver = current_resolver.get()
+        return f"{operation}:{resolver}" if operation or resolver else "background"
+
+    def record(self, statement: str, parameters, elapsed: float):
+        query = fingerprint(statement)
+        stats = self.stats.get(query)
+        if stats is None:
+            if len(self.stats) >= PROFILE_MAX_FINGERPRINTS:
+                return
+            stats = self.stats[query] = QueryStats()
+        stats.add(elapsed, self.source())
+        profile = request_profile.get()
+        if profile is not None:
+            profile.queries[(current_resolver.get(), query)] += 1
+        if elapsed > SLOW_QUERY_THRESHOLD:
+            logger.warning(f"slow query {elapsed:.3f}s from {self.source()}: {query} {parameters!r:.500}")
+
+    def finish_request(self, profile: RequestProfile):
+        """Отчёт о запросах, повторённых в одном HTTP-запросе больше NPLUSONE_THRESHOLD раз."""
+        for (resolver, query), count in profile.queries.items():
+            if count > NPLUSONE_THRESHOLD:
+                report = {
+                    "operation": profile.operation,
+                    "resolver": resolver,
+                    "query": query,
+                    "count": count,
+                    "at": int(time.time()),
+                }
+                self.nplusone.append(report)
+                logger.warning(f"N+1 in {profile.operation}:{resolver}: {count} x {query}")
+
+    def report(self, limit=50) -> dict:
+        top = sorted(self.stats.items(), key=lambda item: item[1].total, reverse=True)[:limit]
+        return {
+            "since": int(self.started_at),
+            "queries": [stats.report(query) for query, stats in top],
+            "nplusone": list(self.nplusone)[-limit:],
+        }
+
+    def reset(self):
+        self.stats.clear()
+        self.nplusone.clear()
+        self.started_at = time.time()
+
+
+query_profiler = QueryProfiler()
+
+
+def profiler_middleware(resolver, obj, info, **kwargs):
+    """
+    Middleware Ariadne: корневые поля запоминают своё имя и имя операции,
+    запросы к БД из вложенных резолверов приписываются корневому полю.
+    """
+    if info.path.prev is not None:
+        return resolver(obj, info, **kwargs)
+    name = f"{info.parent_type.name}.{info.field_name}"
+    profile = request_profile.get()
+    if profile is not None and not profile.operation:
+        profile.operation = info.operation.name.value if info.operation.name else "anonymous"
+    token = current_resolver.set(name)
+    try:
+        result = resolver(obj, info, **kwargs)
+    finally:
+        current_resolver.reset(token)
+    if not inspect.isawaitable(result):
+        return result
+
+    async def profiled():
+        token = current_resolver.set(name)
+        try:
+            return await result
+        finally:
+            current_resolver.reset(token)
+
+    return profiled()
+
+
+def is_admin_request(request: Request) -> bool:
+    """Служебный доступ по заголовку X-Admin-Secret, без заданного AUTH_SECRET закрыт."""
+    secret = request.headers.get("x-admin-secret", "")
+    return bool(AUTH_SECRET) and hmac.compare_digest(secret, AUTH_SECRET)
+
+
+async def queries_handler(request: Request):
+    """
+    Отчёт профилировщика: GET - запросы по суммарному времени и N+1, DELETE - сброс.
+    Доступ по заголовку X-Admin-Secret, без заданного AUTH_SECRET закрыт.
+    """
+    if not is_admin_request(request):
+        return JSONResponse({"error": "Forbidden"}, status_code=403)
+    if request.method == "DELETE":
+        query_profiler.reset()
+        return JSONResponse({"ok": True})
+    try:
+        limit = int(request.query_params.get("limit", 50))
+    except ValueError:
+        limit = 50
+    return JSONResponse(query_profiler.report(limit))
@@ -0,0 +1,53 @@
+import time
+
+from services.redis import redis
+from utils.logger import root_logger as logger
+
+# Token bucket: пополняется со скоростью rate токенов в секунду, не больше burst
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return allowed
+"""
+
+
+class RateLimiter:
+    def __init__(self, name: str, rate: float, burst: int):
+        """
+        Ограничитель частоты действий на основе token bucket в Redis, общий для всех воркеров.
+
+        :param name: Префикс ключей.
+        :param rate: Токенов в секунду.
+        :param burst: Размер корзины.
+        """
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+
+    async def allow(self, subject) -> bool:
+        """
+        Списывает токен для subject.
+
+        :return: False если лимит исчерпан; без Redis действие разрешается.
+        """
+        if self.rate <= 0:
+            return True
+        key = f"ratelimit:{self.name}:{subject}"
+        result = await redis.execute("EVAL", TOKEN_BUCKET_SCRIPT, 1, key, self.rate, self.burst, time.time())
+        if result is None:
+            return True
+        if not int(result):
+            logger.warning(f"rate limit {self.name} exceeded by {subject}")
+        return bool(int(result))
@@ -40,6 +40,23 @@ class RedisService:
             except Exception as e:
                 logger.error(e)
 
+    async def pipeline(self, commands, transaction=False):
+        """
+        Выполняет команды одним запросом к Redis.
+
+        :param commands: Список кортежей (команда, *аргументы).
+        :param transaction: Обернуть команды в MULTI/EXEC.
+        :return: Список результатов или None без подключения.
+        """
+        if self._client:
+            try:
+                pipe = self._client.pipeline(transaction=transaction)
+                for command, *args in commands:
+                    pipe.execute_command(command, *args)
+                return await pipe.execute()
+            except Exception as e:
+                logger.error(e)
+
     async def subscribe(self, *channels):
         if self._client:
             async with self._client.pubsub() as pubsub:
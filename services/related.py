@@ -0,0 +1,244 @@
+import asyncio
+import heapq
+import math
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import aliased
+
+from orm.reaction import Reaction
+from orm.shout import Shout, ShoutAuthor, ShoutTopic
+from services.db import local_session
+from services.redis import redis
+from utils.logger import root_logger as logger
+
+RELATED_KEY = "related:shout:{}"
+RELATED_TOP_K = 30
+RELATED_TTL = 60 * 60 * 24 * 14  # 2 недели, полная перестройка обновляет все ключи
+RELATED_CHUNK_SIZE = 200
+RELATED_EMPTY_TTL = 60 * 60  # публикации без соседей пересчитываются не чаще раза в час
+RELATED_PENDING_TTL = 60  # один фоновый пересчёт промаха на все воркеры
+
+# Добавление публикации в набор соседа, только если набор уже есть:
+# иначе получился бы набор из одного элемента без TTL
+ADD_NEIGHBOUR_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[1], ARGV[2])
+redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -(tonumber(ARGV[3]) + 1))
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+# Веса сигналов близости
+TOPIC_WEIGHT = 1.0
+AUTHOR_WEIGHT = 0.5
+COREADER_WEIGHT = 0.3
+EMBEDDING_WEIGHT = 2.0
+
+other_topic = aliased(ShoutTopic)
+other_author = aliased(ShoutAuthor)
+other_reaction = aliased(Reaction)
+
+
+def published_ids(session, shout_ids) -> set:
+    return set(
+        session.execute(
+            select(Shout.id).where(Shout.id.in_(shout_ids), Shout.published_at.is_not(None), Shout.deleted_at.is_(None))
+        ).scalars()
+    )
+
+
+def topic_neighbours(session, shout_ids) -> Dict[int, Dict[int, float]]:
+    """Общие темы, вклад темы тем меньше, чем больше в ней публикаций."""
+    topic_sizes = (
+        select(ShoutTopic.topic, func.count(ShoutTopic.shout).label("size")).group_by(ShoutTopic.topic).subquery()
+    )
+    rows = session.execute(
+        select(ShoutTopic.shout, other_topic.shout, topic_sizes.c.size)
+        .join(other_topic, and_(other_topic.topic == ShoutTopic.topic, other_topic.shout != ShoutTopic.shout))
+        .join(topic_sizes, topic_sizes.c.topic == ShoutTopic.topic)
+        .where(ShoutTopic.shout.in_(shout_ids))
+    )
+    scores = defaultdict(lambda: defaultdict(float))
+    for shout_id, neighbour_id, size in rows:
+        scores[shout_id][neighbour_id] += TOPIC_WEIGHT / math.log(2 + size)
+    return scores
+
+
+def author_neighbours(session, shout_ids) -> Dict[int, Dict[int, float]]:
+    """Общие авторы."""
+    rows = session.execute(
+        select(ShoutAuthor.shout, other_author.shout, func.count())
+        .join(other_author, and_(other_author.author == ShoutAuthor.author, other_author.shout != ShoutAuthor.shout))
+        .where(ShoutAuthor.shout.in_(shout_ids))
+        .group_by(ShoutAuthor.shout, other_author.shout)
+    )
+    scores = defaultdict(dict)
+    for shout_id, neighbour_id, shared in rows:
+        scores[shout_id][neighbour_id] = AUTHOR_WEIGHT * shared
+    return scores
+
+
+def coreader_neighbours(session, shout_ids) -> Dict[int, Dict[int, float]]:
+    """Общие читатели: авторы, оставившие реакции на обе публикации."""
+    rows = session.execute(
+        select(Reaction.shout, other_reaction.shout, func.count(func.distinct(Reaction.created_by)))
+        .join(
+            other_reaction,
+            and_(
+                other_reaction.created_by == Reaction.created_by,
+                other_reaction.shout != Reaction.shout,
+                other_reaction.deleted_at.is_(None),
+            ),
+        )
+        .where(Reaction.shout.in_(shout_ids), Reaction.deleted_at.is_(None))
+        .group_by(Reaction.shout, other_reaction.shout)
+    )
+    scores = defaultdict(dict)
+    for shout_id, neighbour_id, readers in rows:
+        scores[shout_id][neighbour_id] = COREADER_WEIGHT * math.log(1 + readers)
+    return scores
+
+
+def embedding_neighbours(classifier, shout_ids) -> Dict[int, Dict[int, float]]:
+    """Близость по векторным представлениям из TopicClassifier, если он готов."""
+    scores = defaultdict(dict)
+    if not classifier or not classifier.is_ready():
+        return scores
+    for shout_id in shout_ids:
+        publication = classifier.publications.get(str(shout_id))
+        if not publication:
+            continue
+        query = f"{publication['title']} {publication['text']}"
+        for found in classifier.search_similar(query, RELATED_TOP_K + 1):
+            if str(found["id"]) != str(shout_id):
+                scores[shout_id][int(found["id"])] = EMBEDDING_WEIGHT * found["relevance"]
+    return scores
+
+
+def compute_related(session, shout_ids, classifier=None) -> Dict[int, List[Tuple[int, float]]]:
+    """
+    Top-K соседей для каждой публикации из shout_ids.
+
+    :param session: Сессия БД.
+    :param shout_ids: Идентификаторы публикаций.
+    :param classifier: Необязательный TopicClassifier для учёта векторной близости.
+    :return: {id: [(id соседа, оценка), ...]} по убыванию оценки.
+    """
+    signals = [
+        topic_neighbours(session, shout_ids),
+        author_neighbours(session, shout_ids),
+        coreader_neighbours(session, shout_ids),
+        embedding_neighbours(classifier, shout_ids),
+    ]
+    totals = {shout_id: defaultdict(float) for shout_id in shout_ids}
+    for signal in signals:
+        for shout_id, neighbours in signal.items():
+            for neighbour_id, score in neighbours.items():
+                totals[shout_id][neighbour_id] += score
+    candidates = {neighbour_id for neighbours in totals.values() for neighbour_id in neighbours}
+    published = published_ids(session, candidates) if candidates else set()
+    return {
+        shout_id: heapq.nlargest(
+            RELATED_TOP_K,
+            ((neighbour_id, score) for neighbour_id, score in neighbours.items() if neighbour_id in published),
+            key=lambda item: item[1],
+        )
+        for shout_id, neighbours in totals.items()
+    }
+
+
+def load_related(shout_ids, classifier=None) -> Dict[int, List[Tuple[int, float]]]:
+    with local_session() as session:
+        return compute_related(session, shout_ids, classifier)
+
+
+async def store_related(related: Dict[int, List[Tuple[int, float]]]):
+    """Запись соседей в Redis: по sorted set на публикацию, для публикаций без соседей - метка."""
+    for shout_id, neighbours in related.items():
+        key = RELATED_KEY.format(shout_id)
+        await redis.execute("DEL", key)
+        if neighbours:
+            await redis.execute("ZADD", key, *[value for n, score in neighbours for value in (round(score, 4), n)])
+            await redis.execute("EXPIRE", key, RELATED_TTL)
+        else:
+            await redis.execute("SET", f"{key}:none", 1, "EX", RELATED_EMPTY_TTL)
+
+
+async def update_related(shout_id: int, classifier=None):
+    """
+    Инкрементальное обновление при публикации: соседи новой публикации
+    и её добавление в уже существующие наборы соседей с обрезкой до RELATED_TOP_K.
+    Отсутствующие наборы соседей будут вычислены целиком при первом обращении.
+    """
+    try:
+        related = await asyncio.to_thread(load_related, [shout_id], classifier)
+        await store_related(related)
+        for neighbour_id, score in related.get(shout_id, []):
+            key = RELATED_KEY.format(neighbour_id)
+            await redis.execute(
+                "EVAL", ADD_NEIGHBOUR_SCRIPT, 1, key, round(score, 4), shout_id, RELATED_TOP_K, RELATED_TTL
+            )
+    except Exception as e:
+        logger.error(f"Related shouts update failed for shout {shout_id}: {e}")
+
+
+async def get_related_ids(shout_id: int, limit: int) -> List[Tuple[int, float]]:
+    """
+    Соседи публикации из Redis одним ZREVRANGE. Если набора ещё нет, он вычисляется
+    в фоне, а запрос получает пустой список, не дожидаясь self-join по реакциям.
+    """
+    key = RELATED_KEY.format(shout_id)
+    result = await redis.execute("ZREVRANGE", key, 0, limit - 1, "WITHSCORES", withscores=True)
+    if result:
+        return [(int(member), float(score)) for member, score in result]
+    if await redis.execute("EXISTS", f"{key}:none"):
+        return []
+    if await redis.execute("SET", f"{key}:pending", 1, "NX", "EX", RELATED_PENDING_TTL):
+        asyncio.create_task(refresh_related(shout_id))
+    return []
+
+
+async def refresh_related(shout_id: int):
+    """Фоновое вычисление соседей публикации после промаха в get_related_ids."""
+    try:
+        await store_related(await asyncio.to_thread(load_related, [shout_id]))
+    except Exception as e:
+        logger.error(f"Related shouts refresh failed for shout {shout_id}: {e}")
+    finally:
+        await redis.execute("DEL", f"{RELATED_KEY.format(shout_id)}:pending")
+
+
+async def rebuild_related(chunk_size: int = RELATED_CHUNK_SIZE, classifier=None) -> int:
+    """Полная перестройка соседей всех опубликованных публикаций порциями."""
+    with local_session() as session:
+        shout_ids = (
+            session.execute(
+                select(Shout.id).where(Shout.published_at.is_not(None), Shout.deleted_at.is_(None)).order_by(Shout.id)
+            )
+            .scalars()
+            .all()
+        )
+    for i in range(0, len(shout_ids), chunk_size):
+        chunk = shout_ids[i : i + chunk_size]
+        await store_related(await asyncio.to_thread(load_related, chunk, classifier))
+        logger.info(f"related shouts: {min(i + chunk_size, len(shout_ids))}/{len(shout_ids)}")
+    return len(shout_ids)
+
+
+async def rebuild():
+    await redis.connect()
+    logger.info(f"related shouts rebuilt for {await rebuild_related()} shouts")
+    await redis.disconnect()
+
+
+if __name__ == "__main__":
+    # python -m services.related rebuild
+    if sys.argv[1:] == ["rebuild"]:
+        asyncio.run(rebuild())
+    else:
+        print("usage: python -m services.related rebuild")
@@ -0,0 +1,131 @@
+import asyncio
+import time
+
+from sqlalchemy import delete, insert, select
+
+from orm.notification import Notification, NotificationArchive, NotificationSeen
+from services.db import local_session
+from settings import (
+    NOTIFICATION_ARCHIVE_DAYS,
+    NOTIFICATION_COMPACTION_INTERVAL,
+    NOTIFICATION_RETENTION_DAYS,
+)
+from utils.logger import root_logger as logger
+
+DAY = 60 * 60 * 24
+BATCH_SIZE = 5000
+
+ARCHIVED_COLUMNS = ("id", "created_at", "entity", "action", "payload", "author", "thread")
+
+
+def archive_notifications(session, before: int, batch_size: int = BATCH_SIZE) -> int:
+    """
+    Переносит уведомления, созданные раньше before, в notification_archive.
+
+    Работает пачками по batch_size строк, каждая пачка коммитится отдельно,
+    чтобы не держать долгую транзакцию на большой таблице.
+
+    :param session: Сессия базы данных.
+    :param before: Граница unix time.
+    :param batch_size: Размер пачки.
+    :return: Количество перенесённых уведомлений.
+    """
+    moved = 0
+    while True:
+        ids = (
+            session.execute(
+                select(Notification.id)
+                .where(Notification.created_at < before)
+                .order_by(Notification.id)
+                .limit(batch_size)
+            )
+            .scalars()
+            .all()
+        )
+        if not ids:
+            break
+        source = select(*(getattr(Notification, c) for c in ARCHIVED_COLUMNS)).where(Notification.id.in_(ids))
+        session.execute(
+            insert(NotificationArchive).from_select([getattr(NotificationArchive, c) for c in ARCHIVED_COLUMNS], source)
+        )
+        session.execute(delete(NotificationSeen).where(NotificationSeen.notification.in_(ids)))
+        session.execute(delete(Notification).where(Notification.id.in_(ids)))
+        session.commit()
+        moved += len(ids)
+        if len(ids) < batch_size:
+            break
+    return moved
+
+
+def prune_archive(session, before: int) -> int:
+    """
+    Удаляет из архива уведомления, созданные раньше before.
+
+    :param session: Сессия базы данных.
+    :param before: Граница unix time.
+    :return: Количество удалённых строк.
+    """
+    result = session.execute(delete(NotificationArchive).where(NotificationArchive.created_at < before))
+    session.commit()
+    return result.rowcount or 0
+
+
+def compact_notifications(session, now: int | None = None) -> tuple[int, int]:
+    """
+    Одна итерация обслуживания таблицы уведомлений.
+
+    :return: (перенесено в архив, удалено из архива)
+    """
+    now = now or int(time.time())
+    moved = archive_notifications(session, now - NOTIFICATION_RETENTION_DAYS * DAY)
+    pruned = 0
+    if NOTIFICATION_ARCHIVE_DAYS:
+        pruned = prune_archive(session, now - (NOTIFICATION_RETENTION_DAYS + NOTIFICATION_ARCHIVE_DAYS) * DAY)
+    return moved, pruned
+
+
+class NotificationRetentionManager:
+    def __init__(self, interval=NOTIFICATION_COMPACTION_INTERVAL):
+        """Инициализация менеджера с заданным интервалом компактизации (в секундах)."""
+        self.interval = interval
+        self.running = True
+
+    async def start(self):
+        """Запуск фонового воркера компактизации уведомлений."""
+        self.task = asyncio.create_task(self.worker())
+
+    async def worker(self):
+        """Циклическая компактизация каждые self.interval секунд."""
+        try:
+            while self.running:
+                await self.compact()
+                await asyncio.sleep(self.interval)
+        except asyncio.CancelledError:
+            logger.info("Notification retention worker was stopped.")
+
+    async def compact(self):
+        """Перенос старых уведомлений в архив в отдельном потоке."""
+        try:
+            moved, pruned = await asyncio.to_thread(self._compact)
+            if moved or pruned:
+                logger.info(f"notifications archived: {moved}, pruned from archive: {pruned}")
+        except Exception as e:
+            logger.error(f"Notification compaction error: {e}")
+
+    @staticmethod
+    def _compact():
+        with local_session() as session:
+            return compact_notifications(session)
+
+    async def stop(self):
+        """Остановка фонового воркера."""
+        self.running = False
+        if hasattr(self, "task"):
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+
+notification_retention = NotificationRetentionManager()
@@ -1,9 +1,9 @@
 from asyncio.log import logger
 
-import httpx
 from ariadne import MutationType, QueryType
 
 from services.db import create_table_if_not_exists, local_session
+from services.http import CircuitOpenError, http_client
 from settings import AUTH_URL
 
 query = QueryType()
@@ -13,7 +13,7 @@ resolvers = [query, mutation]
 
 async def request_graphql_data(gql, url=AUTH_URL, headers=None):
     """
-    Выполняет GraphQL запрос к указанному URL
+    Выполняет GraphQL запрос к указанному URL через общий HTTP-клиент
 
     :param gql: GraphQL запрос
     :param url: URL для запроса, по умолчанию AUTH_URL
@@ -25,17 +25,18 @@ async def request_graphql_data(gql, url=AUTH_URL, headers=None):
     if headers is None:
         headers = {"Content-Type": "application/json"}
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=gql, headers=headers)
-            if response.status_code == 200:
-                data = response.json()
-                errors = data.get("errors")
-                if errors:
-                    logger.error(f"{url} response: {data}")
-                else:
-                    return data
+        response = await http_client.post(url, json=gql, headers=headers)
+        if response.status_code == 200:
+            data = response.json()
+            errors = data.get("errors")
+            if errors:
+                logger.error(f"{url} response: {data}")
             else:
-                logger.error(f"{url}: {response.status_code} {response.text}")
+                return data
+        else:
+            logger.error(f"{url}: {response.status_code} {response.text}")
+    except CircuitOpenError as e:
+        logger.error(f"request_graphql_data: {e}")
     except Exception as _e:
         import traceback
 
@@ -45,7 +46,7 @@ async def request_graphql_data(gql, url=AUTH_URL, headers=None):
 
 def create_all_tables():
     """Create all database tables in the correct order."""
-    from orm import author, community, draft, notification, reaction, shout, topic
+    from orm import author, community, draft, notification, outbox, reaction, shout, topic
 
     # Порядок важен - сначала таблицы без внешних ключей, затем зависимые таблицы
     models_in_order = [
@@ -70,8 +71,11 @@ def create_all_tables():
         shout.ShoutReactionsFollower,  # Зависит от Shout и Reaction
         # Дополнительные таблицы
         author.AuthorRating,  # Зависит от Author
+        author.AuthorKarma,  # Зависит от Author
         notification.Notification,  # Зависит от Author
         notification.NotificationSeen,  # Зависит от Notification
+        notification.NotificationArchive,  # Архив уведомлений, без внешних ключей
+        outbox.Outbox,  # Отложенные побочные эффекты, без внешних ключей
         # collection.Collection,
         # collection.ShoutCollection,
         # invite.Invite
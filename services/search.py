@@ -1,10 +1,22 @@
 import asyncio
+import hashlib
 import json
 import logging
 import os
-
-from opensearchpy import OpenSearch
-
+import random
+import re
+import sys
+import time
+from typing import List
+
+import snowballstemmer
+from opensearchpy import AsyncOpenSearch
+from opensearchpy.exceptions import ConnectionError as SearchConnectionError
+from opensearchpy.exceptions import ConnectionTimeout, TransportError
+from sqlalchemy import inspect, text
+
+from orm.shout import Shout
+from services.db import engine, local_session
 from services.redis import redis
 from utils.encoders import CustomJSONEncoder
 
@@ -51,15 +63,78 @@ index_settings = {
 
 expected_mapping = index_settings["mappings"]
 
-# Создание цикла событий
-search_loop = asyncio.get_event_loop()
-
 # В начале файла добавим флаг
 SEARCH_ENABLED = bool(os.environ.get("ELASTIC_HOST", ""))
 
-
-def get_indices_stats():
-    indices_stats = search_service.client.cat.indices(format="json")
+# Пул соединений и очередь индексации
+SEARCH_POOL_SIZE = int(os.environ.get("SEARCH_POOL_SIZE") or 10)
+SEARCH_TIMEOUT = float(os.environ.get("SEARCH_TIMEOUT") or 5.0)
+SEARCH_QUEUE_SIZE = int(os.environ.get("SEARCH_QUEUE_SIZE") or 1000)
+SEARCH_BULK_SIZE = int(os.environ.get("SEARCH_BULK_SIZE") or 100)
+SEARCH_BULK_INTERVAL = float(os.environ.get("SEARCH_BULK_INTERVAL") or 2.0)
+SEARCH_BULK_RETRIES = 4
+SEARCH_ENQUEUE_TIMEOUT = 5.0
+REINDEX_CHUNK_SIZE = 500
+
+# Кэш результатов: одно окно результатов на запрос, страницы режутся из него.
+# Новые публикации попадают в закэшированные запросы по истечении SEARCH_CACHE_TTL,
+# изменённые и удалённые сбрасывают только запросы, в окне которых они есть
+SEARCH_CACHE_WINDOW = int(os.environ.get("SEARCH_CACHE_WINDOW") or 100)
+SEARCH_CACHE_TTL = int(os.environ.get("SEARCH_CACHE_TTL") or 60 * 10)
+SEARCH_CACHE_KEYS = "search:keys"
+SEARCH_CACHE_DOC_KEYS = "search:doc:{}"  # id публикации -> ключи кэша, в окне которых она есть
+
+
+def query_stems(text_query: str) -> List[str]:
+    """
+    Основы слов запроса: стеммер Snowball russian, тот же, что у анализатора ru индекса
+    и словаря russian в Postgres. Минус перед словом (исключение в websearch_to_tsquery) сохраняется.
+    """
+    words = re.findall(r"(-?)(\w+)", text_query.lower().replace("ё", "е"))
+    # экземпляр стеммера хранит состояние разбора, поэтому свой на каждый вызов из пула потоков
+    stems = snowballstemmer.stemmer("russian").stemWords([word for _, word in words])
+    return [sign + stem for (sign, _), stem in zip(words, stems)]
+
+
+def normalize_query(text_query: str) -> str:
+    """
+    Нормализованный вид запроса для ключа кэша, вычисляется без обращения к бэкенду.
+    Регистр, пунктуация, порядок слов и словоформы одной основы не влияют на результат поиска,
+    повторы слов сохраняются: они меняют вес слова в оценке.
+    """
+    return " ".join(sorted(query_stems(text_query)))
+
+
+def search_cache_key(text_query: str) -> str:
+    digest = hashlib.sha1(normalize_query(text_query).encode()).hexdigest()
+    return f"search:{digest}"
+
+
+def index_body(shout) -> dict:
+    """Документ поискового индекса для публикации или строки из БД."""
+    return {
+        "body": shout.body,
+        "title": shout.title,
+        "subtitle": shout.subtitle,
+        "lead": shout.lead,
+        "media": shout.media,
+    }
+
+
+def load_shouts_chunk(after_id: int, limit: int):
+    """Порция опубликованных публикаций с id больше after_id."""
+    with local_session() as session:
+        return (
+            session.query(Shout.id, Shout.body, Shout.title, Shout.subtitle, Shout.lead, Shout.media)
+            .filter(Shout.id > after_id, Shout.published_at.is_not(None), Shout.deleted_at.is_(None))
+            .order_by(Shout.id)
+            .limit(limit)
+            .all()
+        )
+
+
+async def get_indices_stats(client):
+    indices_stats = await client.cat.indices(format="json")
     for index_info in indices_stats:
         index_name = index_info["index"]
         if not index_name.startswith("."):
@@ -81,6 +156,7 @@ def get_indices_stats():
             logger.info(f"Deleted Documents: {docs_deleted}")
             logger.info(f"Store Size: {store_size}")
             logger.info(f"Primary Store Size: {pri_store_size}")
+    return indices_stats
 
 
 class SearchService:
@@ -89,11 +165,14 @@ class SearchService:
         self.index_name = index_name
         self.client = None
         self.lock = asyncio.Lock()
+        # (id, документ), ограниченная очередь даёт обратное давление на индексацию
+        self.queue = asyncio.Queue(maxsize=SEARCH_QUEUE_SIZE)
+        self.task = None
 
         # Инициализация клиента OpenSearch только если поиск включен
         if SEARCH_ENABLED:
             try:
-                self.client = OpenSearch(
+                self.client = AsyncOpenSearch(
                     hosts=[{"host": ELASTIC_HOST, "port": ELASTIC_PORT}],
                     http_compress=True,
                     http_auth=(ELASTIC_USER, ELASTIC_PASSWORD),
@@ -101,46 +180,74 @@ class SearchService:
                     verify_certs=False,
                     ssl_assert_hostname=False,
                     ssl_show_warn=False,
+                    pool_maxsize=SEARCH_POOL_SIZE,
+                    timeout=SEARCH_TIMEOUT,
                 )
                 logger.info("Клиент OpenSearch.org подключен")
-                search_loop.create_task(self.check_index())
             except Exception as exc:
                 logger.warning(f"Поиск отключен из-за ошибки подключения: {exc}")
                 self.client = None
         else:
             logger.info("Поиск отключен (ELASTIC_HOST не установлен)")
 
+    @property
+    def enabled(self):
+        return self.client is not None
+
+    async def start(self):
+        """Проверка индекса и запуск фоновой пакетной индексации."""
+        if not self.client:
+            return
+        try:
+            await self.check_index()
+        except Exception as e:
+            logger.error(f"Failed to check search index: {e}")
+        if not self.task:
+            self.task = asyncio.create_task(self.bulk_worker())
+
+    async def stop(self):
+        """Досылаем очередь и закрываем соединения."""
+        if self.task:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout=SEARCH_BULK_INTERVAL + SEARCH_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(f"Indexing queue was not drained before shutdown, {self.queue.qsize()} documents left")
+            self.task.cancel()
+            self.task = None
+        if self.client:
+            await self.client.close()
+
     async def info(self):
         if not SEARCH_ENABLED:
             return {"status": "disabled"}
 
         try:
-            return get_indices_stats()
+            return await get_indices_stats(self.client)
         except Exception as e:
             logger.error(f"Failed to get search info: {e}")
             return {"status": "error", "message": str(e)}
 
-    def delete_index(self):
+    async def delete_index(self):
         if self.client:
             logger.warning(f"[!!!] Удаляем индекс {self.index_name}")
-            self.client.indices.delete(index=self.index_name, ignore_unavailable=True)
+            await self.client.indices.delete(index=self.index_name, ignore_unavailable=True)
 
-    def create_index(self):
+    async def create_index(self):
         if self.client:
             logger.info(f"Создается индекс: {self.index_name}")
-            self.client.indices.create(index=self.index_name, body=index_settings)
+            await self.client.indices.create(index=self.index_name, body=index_settings)
             logger.info(f"Индекс {self.index_name} создан")
 
     async def check_index(self):
         if self.client:
             logger.info(f"Проверяем индекс {self.index_name}...")
-            if not self.client.indices.exists(index=self.index_name):
-                self.create_index()
-                self.client.indices.put_mapping(index=self.index_name, body=expected_mapping)
+            if not await self.client.indices.exists(index=self.index_name):
+                await self.create_index()
+                await self.client.indices.put_mapping(index=self.index_name, body=expected_mapping)
             else:
                 logger.info(f"Найден существующий индекс {self.index_name}")
                 # Проверка и обновление структуры индекса, если необходимо
-                result = self.client.indices.get_mapping(index=self.index_name)
+                result = await self.client.indices.get_mapping(index=self.index_name)
                 if isinstance(result, str):
                     result = json.loads(result)
                 if isinstance(result, dict):
@@ -149,37 +256,117 @@ class SearchService:
                     expected_keys = expected_mapping["properties"].keys()
                     if mapping and mapping["properties"].keys() != expected_keys:
                         logger.info(f"Ожидаемая структура индексации: {expected_mapping}")
-                        logger.warning("[!!!] Требуется переиндексация всех данных")
-                        self.delete_index()
-                        self.client = None
+                        logger.warning("[!!!] Требуется переиндексация всех данных: python -m services.search reindex")
+                        await self.delete_index()
+                        await self.create_index()
         else:
             logger.error("клиент не инициализован, невозможно проверить индекс")
 
-    def index(self, shout):
+    async def index(self, shout):
+        """
+        Поставить публикацию в очередь индексации.
+
+        Если очередь переполнена дольше SEARCH_ENQUEUE_TIMEOUT, документ пропускается,
+        медленный кластер не должен задерживать публикацию.
+        """
         if not SEARCH_ENABLED:
             return
 
         if self.client:
             logger.info(f"Индексируем пост {shout.id}")
-            index_body = {
-                "body": shout.body,
-                "title": shout.title,
-                "subtitle": shout.subtitle,
-                "lead": shout.lead,
-                "media": shout.media,
-            }
-            asyncio.create_task(self.perform_index(shout, index_body))
-
-    async def perform_index(self, shout, index_body):
-        if self.client:
             try:
                 await asyncio.wait_for(
-                    self.client.index(index=self.index_name, id=str(shout.id), body=index_body), timeout=40.0
+                    self.queue.put((str(shout.id), index_body(shout))), timeout=SEARCH_ENQUEUE_TIMEOUT
                 )
             except asyncio.TimeoutError:
-                logger.error(f"Indexing timeout for shout {shout.id}")
+                logger.error(f"Indexing queue is full, shout {shout.id} skipped")
+
+    async def bulk_worker(self):
+        """Сброс очереди через _bulk по размеру пачки или по таймеру."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + SEARCH_BULK_INTERVAL
+            while len(batch) < SEARCH_BULK_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout=timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self.bulk_index(dict(batch))
             except Exception as e:
-                logger.error(f"Indexing error for shout {shout.id}: {e}")
+                logger.error(f"Bulk indexing failed for {len(batch)} documents: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def bulk_index(self, documents: dict):
+        """
+        Индексация пачки документов {id: документ} с повторами.
+
+        Повторяются только документы с ответом 429/5xx и сетевые ошибки,
+        задержка растёт экспоненциально со случайной добавкой.
+        """
+        for attempt in range(SEARCH_BULK_RETRIES):
+            if attempt:
+                await asyncio.sleep(0.5 * 2**attempt + random.random())
+            actions = []
+            for doc_id, doc in documents.items():
+                actions.append({"index": {"_index": self.index_name, "_id": doc_id}})
+                actions.append(doc)
+            try:
+                response = await self.client.bulk(body=actions, refresh="wait_for")
+            except (SearchConnectionError, ConnectionTimeout) as e:
+                logger.warning(f"Bulk indexing attempt {attempt + 1} failed: {e}")
+                continue
+            except TransportError as e:
+                if isinstance(e.status_code, int) and (e.status_code == 429 or e.status_code >= 500):
+                    logger.warning(f"Bulk indexing attempt {attempt + 1} failed: {e}")
+                    continue
+                raise
+            if not response.get("errors"):
+                await invalidate_search_cache(documents)
+                return
+            retry = {}
+            for item in response.get("items", []):
+                result = item.get("index", {})
+                status = result.get("status", 200)
+                doc_id = result.get("_id")
+                if status == 429 or status >= 500:
+                    retry[doc_id] = documents[doc_id]
+                elif status >= 300:
+                    logger.error(f"Indexing error for shout {doc_id}: {result.get('error')}")
+            await invalidate_search_cache(documents)
+            if not retry:
+                return
+            documents = retry
+        logger.error(f"Documents were not indexed after {SEARCH_BULK_RETRIES} attempts: {list(documents)}")
+
+    async def reindex_all(self, chunk_size: int = REINDEX_CHUNK_SIZE) -> int:
+        """
+        Переиндексация всех опубликованных публикаций порциями по id.
+
+        :return: Количество поставленных в очередь документов.
+        """
+        if not self.client:
+            return 0
+        total = 0
+        last_id = 0
+        while True:
+            rows = await asyncio.to_thread(load_shouts_chunk, last_id, chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                await self.queue.put((str(row.id), index_body(row)))
+            total += len(rows)
+            last_id = rows[-1].id
+            logger.info(f"Reindex: {total} shouts queued")
+        await self.queue.join()
+        await invalidate_search_cache()
+        return total
 
     async def search(self, text, limit, offset):
         if not SEARCH_ENABLED:
@@ -191,7 +378,7 @@ class SearchService:
         }
 
         if self.client:
-            search_response = self.client.search(
+            search_response = await self.client.search(
                 index=self.index_name,
                 body=search_body,
                 size=limit,
@@ -200,32 +387,265 @@ class SearchService:
                 _source_excludes=["title", "body", "subtitle", "media", "lead", "_index"],
             )
             hits = search_response["hits"]["hits"]
-            results = [{"id": hit["_id"], "score": hit["_score"]} for hit in hits]
-
-            # если результаты не пустые
-            if results:
-                # Кэширование в Redis с TTL
-                redis_key = f"search:{text}:{offset}+{limit}"
-                await redis.execute(
-                    "SETEX",
-                    redis_key,
-                    REDIS_TTL,
-                    json.dumps(results, cls=CustomJSONEncoder),
-                )
-            return results
+            return [{"id": hit["_id"], "score": hit["_score"]} for hit in hits]
         return []
 
 
-search_service = SearchService()
+# Встроенный полнотекстовый поиск: tsvector в Postgres, FTS5 в SQLite
+SEARCH_TEXT_FIELDS = ("title", "subtitle", "lead", "body", "media")
+
+PG_SEARCH_VECTOR = """
+    setweight(to_tsvector('russian', coalesce(title, '')), 'A')
+    || setweight(to_tsvector('russian', coalesce(subtitle, '') || ' ' || coalesce(lead, '')), 'B')
+    || setweight(to_tsvector('russian', coalesce(body, '') || ' ' || coalesce(media::text, '')), 'C')
+"""
+
+PG_SEARCH_QUERY = """
+    SELECT shout.id AS id, ts_rank(shout.search_vector, query) AS score
+    FROM shout, websearch_to_tsquery('russian', :text) query
+    WHERE shout.search_vector @@ query AND shout.published_at IS NOT NULL AND shout.deleted_at IS NULL
+    ORDER BY score DESC, shout.id DESC
+    LIMIT :limit OFFSET :offset
+"""
+
+SQLITE_SEARCH_QUERY = """
+    SELECT shout_fts.rowid AS id, -bm25(shout_fts, 10.0, 5.0, 5.0, 1.0, 1.0) AS score
+    FROM shout_fts JOIN shout ON shout.id = shout_fts.rowid
+    WHERE shout_fts MATCH :text AND shout.published_at IS NOT NULL AND shout.deleted_at IS NULL
+    ORDER BY score DESC, shout.id DESC
+    LIMIT :limit OFFSET :offset
+"""
+
+
+def fts_match_query(text_query: str) -> str:
+    """
+    Запрос FTS5: каждое слово как префикс своей основы, без операторов из пользовательского ввода.
+    Основы слов дают query_stems.
+    """
+    return " ".join(f'"{stem.lstrip("-")}"*' for stem in query_stems(text_query))
+
+
+def create_search_schema(connection) -> bool:
+    """
+    Создаёт столбец shout.search_vector с GIN индексом или таблицу shout_fts.
+
+    :return: True если структура создана впервые и индекс надо заполнить.
+    """
+    if connection.dialect.name == "postgresql":
+        columns = {column["name"] for column in inspect(connection).get_columns("shout")}
+        if "search_vector" in columns:
+            return False
+        connection.execute(text("ALTER TABLE shout ADD COLUMN IF NOT EXISTS search_vector tsvector"))
+        connection.execute(
+            text("CREATE INDEX IF NOT EXISTS idx_shout_search_vector ON shout USING GIN (search_vector)")
+        )
+        return True
+    if inspect(connection).has_table("shout_fts"):
+        return False
+    connection.execute(
+        text(
+            "CREATE VIRTUAL TABLE shout_fts USING fts5("
+            f"{', '.join(SEARCH_TEXT_FIELDS)}, tokenize='unicode61 remove_diacritics 2')"
+        )
+    )
+    return True
+
+
+def update_search_document(connection, shout_id: int):
+    """Пересчёт поискового документа публикации из её текущей строки."""
+    if connection.dialect.name == "postgresql":
+        connection.execute(
+            text(f"UPDATE shout SET search_vector = {PG_SEARCH_VECTOR} WHERE id = :id"), {"id": shout_id}
+        )
+        return
+    fields = ", ".join(SEARCH_TEXT_FIELDS)
+    connection.execute(text("DELETE FROM shout_fts WHERE rowid = :id"), {"id": shout_id})
+    connection.execute(
+        text(f"INSERT INTO shout_fts (rowid, {fields}) SELECT id, {fields} FROM shout WHERE id = :id"),
+        {"id": shout_id},
+    )
+
+
+def rebuild_search_documents(connection) -> int:
+    """Полная переиндексация всех публикаций одним запросом."""
+    if connection.dialect.name == "postgresql":
+        return connection.execute(text(f"UPDATE shout SET search_vector = {PG_SEARCH_VECTOR}")).rowcount
+    fields = ", ".join(SEARCH_TEXT_FIELDS)
+    connection.execute(text("DELETE FROM shout_fts"))
+    return connection.execute(text(f"INSERT INTO shout_fts (rowid, {fields}) SELECT id, {fields} FROM shout")).rowcount
+
+
+def search_documents(connection, text_query: str, limit: int, offset: int):
+    """Поиск опубликованных публикаций, результаты в формате OpenSearch: [{id, score}]."""
+    if connection.dialect.name == "postgresql":
+        q, params = PG_SEARCH_QUERY, {"text": text_query}
+    else:
+        match = fts_match_query(text_query)
+        if not match:
+            return []
+        q, params = SQLITE_SEARCH_QUERY, {"text": match}
+    rows = connection.execute(text(q), {**params, "limit": limit, "offset": offset})
+    return [{"id": str(row.id), "score": float(row.score)} for row in rows]
+
+
+class LocalSearchService:
+    """
+    Поиск без внешнего кластера с тем же интерфейсом, что и SearchService.
+
+    Документы обновляются триггерами на Shout (см. after_shout_search_handler),
+    index() только сбрасывает кэш результатов.
+    """
+
+    def __init__(self):
+        self.ready = False
+
+    @property
+    def enabled(self):
+        return self.ready
+
+    def check_index(self):
+        with engine.begin() as connection:
+            if create_search_schema(connection):
+                logger.warning(f"Local search index built for {rebuild_search_documents(connection)} shouts")
+        self.ready = True
+
+    async def start(self):
+        try:
+            await asyncio.to_thread(self.check_index)
+            logger.info(f"Встроенный поиск ({engine.dialect.name}) включен")
+        except Exception as e:
+            logger.error(f"Local search is unavailable: {e}")
+
+    async def stop(self):
+        pass
+
+    async def info(self):
+        return {"status": "local", "dialect": engine.dialect.name}
+
+    async def index(self, shout):
+        if self.ready:
+            await invalidate_search_cache([shout.id])
+
+    async def reindex_all(self, chunk_size: int = REINDEX_CHUNK_SIZE) -> int:
+        def rebuild():
+            with engine.begin() as connection:
+                return rebuild_search_documents(connection)
+
+        total = await asyncio.to_thread(rebuild)
+        await invalidate_search_cache()
+        return total
+
+    async def search(self, text_query, limit, offset):
+        def run():
+            with engine.connect() as connection:
+                return search_documents(connection, text_query, limit, offset)
+
+        return await asyncio.to_thread(run)
+
+
+def after_shout_search_handler(mapper, connection, target, is_insert=False):
+    """Инкрементальное обновление встроенного поискового индекса при изменении текста публикации."""
+    if SEARCH_ENABLED or not search_service.enabled:
+        return
+    state = inspect(target)
+    if is_insert or any(state.attrs[field].history.has_changes() for field in SEARCH_TEXT_FIELDS):
+        try:
+            update_search_document(connection, target.id)
+        except Exception as e:
+            logger.error(f"Local search update failed for shout {target.id}: {e}")
+
+
+search_service = SearchService() if SEARCH_ENABLED else LocalSearchService()
+
+
+async def invalidate_search_cache(doc_ids=None):
+    """
+    Сброс закэшированных результатов поиска после изменения индекса.
+
+    :param doc_ids: Изменённые публикации: сбрасываются запросы, в окне результатов которых они есть.
+        Без них, после полной переиндексации, сбрасывается весь кэш.
+    """
+    if doc_ids is None:
+        keys = await redis.execute("SMEMBERS", SEARCH_CACHE_KEYS)
+        if keys:
+            await redis.execute("DEL", SEARCH_CACHE_KEYS, *keys)
+        return
+    doc_keys = [SEARCH_CACHE_DOC_KEYS.format(doc_id) for doc_id in doc_ids]
+    if not doc_keys:
+        return
+    keys = await redis.execute("SUNION", *doc_keys)
+    await redis.execute("DEL", *doc_keys, *(keys or []))
 
 
 async def search_text(text: str, limit: int = 50, offset: int = 0):
+    """
+    Поиск с кэшем: первые SEARCH_CACHE_WINDOW результатов запроса кэшируются одним ключом,
+    все страницы внутри окна отдаются из него.
+    """
     payload = []
-    if search_service.client:
-        # Использование метода search_post из OpenSearchService
-        payload = await search_service.search(text, limit, offset)
+    if search_service.enabled:
+        try:
+            if offset + limit > SEARCH_CACHE_WINDOW:
+                return await search_service.search(text, limit, offset)
+            redis_key = search_cache_key(text)
+            cached = await redis.execute("GET", redis_key)
+            if cached is not None:
+                payload = json.loads(cached)
+            else:
+                # Использование метода search_post из OpenSearchService
+                payload = await search_service.search(text, SEARCH_CACHE_WINDOW, 0)
+                # Кэширование в Redis с TTL, пустые результаты тоже; публикации окна ссылаются на ключ
+                commands = [
+                    ("SET", redis_key, json.dumps(payload, cls=CustomJSONEncoder), "EX", SEARCH_CACHE_TTL),
+                    ("SADD", SEARCH_CACHE_KEYS, redis_key),
+                    ("EXPIRE", SEARCH_CACHE_KEYS, SEARCH_CACHE_TTL),
+                ]
+                for hit in payload:
+                    doc_key = SEARCH_CACHE_DOC_KEYS.format(hit["id"])
+                    commands += [("SADD", doc_key, redis_key), ("EXPIRE", doc_key, SEARCH_CACHE_TTL)]
+                await redis.pipeline(commands)
+            payload = payload[offset : offset + limit]
+        except Exception as e:
+            logger.error(f"Search failed for {text}: {e}")
     return payload
 
 
 # Проверить что URL корректный
 OPENSEARCH_URL = os.getenv("OPENSEARCH_URL", "rc1a-3n5pi3bhuj9gieel.mdb.yandexcloud.net")
+
+
+async def reindex():
+    await search_service.start()
+    logger.warning(f"Reindexed {await search_service.reindex_all()} shouts")
+    await search_service.stop()
+
+
+async def bench(queries, rounds=20):
+    """Сравнение задержек встроенного поиска и OpenSearch на одних и тех же запросах."""
+    backends = {"local": search_service if isinstance(search_service, LocalSearchService) else LocalSearchService()}
+    if SEARCH_ENABLED:
+        backends["opensearch"] = search_service
+    for name, backend in backends.items():
+        await backend.start()
+        for q in queries:
+            timings = []
+            for _ in range(rounds):
+                started = time.perf_counter()
+                hits = await backend.search(q, 10, 0)
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            p50 = timings[len(timings) // 2]
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            print(f"{name:<10} {q!r:<30} hits={len(hits):<3} p50={p50:.1f}ms p95={p95:.1f}ms")
+        await backend.stop()
+
+
+if __name__ == "__main__":
+    # python -m services.search reindex
+    # python -m services.search bench "первый запрос" "второй запрос"
+    if sys.argv[1:] == ["reindex"]:
+        asyncio.run(reindex())
+    elif sys.argv[1:2] == ["bench"] and sys.argv[2:]:
+        asyncio.run(bench(sys.argv[2:]))
+    else:
+        print("usage: python -m services.search reindex | bench QUERY [QUERY ...]")
@@ -0,0 +1,119 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List
+
+from sqlalchemy import select
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+from orm.shout import Shout
+from services.coalescer import WriteCoalescer
+from services.db import local_session
+from services.ratelimit import RateLimiter
+from services.redis import redis
+from services.viewed import VIEWS_TRACKED_CHANGED_KEY, VIEWS_TRACKED_CHANGED_TTL, VIEWS_TRACKED_KEY, ViewedStorage
+from utils.logger import root_logger as logger
+
+TRACK_WINDOW = int(os.environ.get("TRACK_WINDOW") or 60 * 30)  # повторный просмотр засчитывается через 30 минут
+TRACK_FLUSH_INTERVAL = float(os.environ.get("TRACK_FLUSH_INTERVAL") or 2)
+TRACK_SEEN_KEY = "views:seen:{}:{}"  # HyperLogLog посетителей публикации в окне
+TRACK_MAX_BODY = 1024
+# маяков в секунду и размер корзины на адрес, 0 отключает ограничение
+TRACK_RATE = float(os.environ.get("TRACK_RATE") or 1)
+TRACK_BURST = int(os.environ.get("TRACK_BURST") or 30)
+
+track_limiter = RateLimiter("track", TRACK_RATE, TRACK_BURST)
+
+
+def published_slugs(slugs: List[str]) -> List[str]:
+    """Отсев маяков на несуществующие и неопубликованные публикации."""
+    with local_session() as session:
+        return list(
+            session.execute(
+                select(Shout.slug).where(
+                    Shout.slug.in_(slugs), Shout.published_at.is_not(None), Shout.deleted_at.is_(None)
+                )
+            ).scalars()
+        )
+
+
+async def flush_views(batch: Dict[str, List[str]]):
+    """
+    Запись накопленных просмотров: посетители дедуплицируются в HyperLogLog окна,
+    прирост уникальных посетителей добавляется к счётчику публикации.
+
+    :param batch: {slug: [visitor, ...]} за окно склейки.
+    """
+    slugs = await asyncio.to_thread(published_slugs, list(batch))
+    if not slugs:
+        return
+    if not redis._client:
+        # без Redis дедупликация только в пределах пачки и счётчики локальны для процесса
+        for slug in slugs:
+            ViewedStorage.tracked_by_shout[slug] = ViewedStorage.tracked_by_shout.get(slug, 0) + len(set(batch[slug]))
+        return
+
+    window = int(time.time() // TRACK_WINDOW)
+    commands = []
+    for slug in slugs:
+        key = TRACK_SEEN_KEY.format(slug, window)
+        commands += [("PFCOUNT", key), ("PFADD", key, *set(batch[slug])), ("PFCOUNT", key)]
+        commands.append(("EXPIRE", key, TRACK_WINDOW))
+    result = await redis.pipeline(commands, transaction=True)
+    if not result:
+        return
+    increments = {slug: max(0, result[i * 4 + 2] - result[i * 4]) for i, slug in enumerate(slugs)}
+    increments = {slug: views for slug, views in increments.items() if views}
+    if not increments:
+        return
+    now = time.time()
+    commands = [("HINCRBY", VIEWS_TRACKED_KEY, slug, views) for slug, views in increments.items()]
+    # метки изменений, по которым другие воркеры дочитывают только новые счётчики
+    commands.append(("ZADD", VIEWS_TRACKED_CHANGED_KEY, *[v for slug in increments for v in (now, slug)]))
+    commands.append(("ZREMRANGEBYSCORE", VIEWS_TRACKED_CHANGED_KEY, "-inf", now - VIEWS_TRACKED_CHANGED_TTL))
+    totals = await redis.pipeline(commands)
+    if totals:
+        ViewedStorage.tracked_by_shout.update(zip(increments, map(int, totals[: len(increments)])))
+
+
+view_tracker = WriteCoalescer(flush_views, window=TRACK_FLUSH_INTERVAL)
+
+
+def client_ip(request: Request) -> str:
+    """
+    Адрес клиента: последний адрес X-Forwarded-For добавлен нашим прокси,
+    предыдущие присылает сам клиент и им нельзя доверять.
+    """
+    forwarded = request.headers.get("x-forwarded-for", "")
+    return forwarded.split(",")[-1].strip() or (request.client.host if request.client else "")
+
+
+def visitor_id(request: Request) -> str:
+    """Идентификатор посетителя вычисляется на сервере: отпечаток адреса и браузера."""
+    return hashlib.sha1(f"{client_ip(request)}:{request.headers.get('user-agent', '')}".encode()).hexdigest()
+
+
+async def track_handler(request: Request):
+    """
+    Приём маяка просмотра: POST {"slug": "..."}.
+    Тело принимается в любом content-type, чтобы работал navigator.sendBeacon.
+    Присланный клиентом visitor игнорируется, посетитель определяется по адресу и браузеру.
+    """
+    if not await track_limiter.allow(client_ip(request)):
+        return JSONResponse({"error": "Too Many Requests"}, status_code=429)
+    body = await request.body()
+    if len(body) > TRACK_MAX_BODY:
+        return JSONResponse({"error": "Payload Too Large"}, status_code=413)
+    try:
+        data = json.loads(body)
+    except ValueError:
+        data = None
+    slug = data.get("slug") if isinstance(data, dict) else None
+    if not isinstance(slug, str) or not slug:
+        return JSONResponse({"error": "slug is required"}, status_code=400)
+    view_tracker.add(slug, visitor_id(request))
+    logger.debug(f"view tracked: {slug}")
+    return Response(status_code=204)
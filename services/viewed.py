@@ -2,6 +2,7 @@ import asyncio
 import json
 import os
 import time
+from collections import defaultdict
 from datetime import datetime, timedelta, timezone
 from typing import Dict
 
@@ -14,17 +15,36 @@ from google.analytics.data_v1beta.types import (
     RunReportRequest,
 )
 from google.analytics.data_v1beta.types import Filter as GAFilter
+from sqlalchemy import select
 
 from orm.author import Author
 from orm.shout import Shout, ShoutAuthor, ShoutTopic
 from orm.topic import Topic
 from services.db import local_session
+from services.redis import redis
 from utils.logger import root_logger as logger
 
 GOOGLE_KEYFILE_PATH = os.environ.get("GOOGLE_KEYFILE_PATH", "/dump/google-service.json")
 GOOGLE_PROPERTY_ID = os.environ.get("GOOGLE_PROPERTY_ID", "")
 VIEWS_FILEPATH = "/dump/views.json"
 
+# Общие для всех воркеров счётчики в Redis
+VIEWS_SHOUTS_KEY = "views:shouts"  # slug публикации -> просмотры из GA
+VIEWS_TOPICS_KEY = "views:topics"  # slug темы -> сумма просмотров
+VIEWS_AUTHORS_KEY = "views:authors"  # slug автора -> сумма просмотров
+VIEWS_IDS_KEY = "views:ids"  # id публикации -> slug
+VIEWS_TRACKED_KEY = "views:tracked"  # slug публикации -> просмотры из собственного трекинга /track
+VIEWS_TRACKED_CHANGED_KEY = "views:tracked:changed"  # slug публикации -> время последнего прироста в /track
+VIEWS_TRACKED_CHANGED_TTL = 60 * 60  # дольше без загрузки - перечитывается весь VIEWS_TRACKED_KEY
+VIEWS_TRACKED_OVERLAP = 10  # запас на расхождение часов воркеров
+VIEWS_VERSION_KEY = "views:version"  # увеличивается после каждой записи
+VIEWS_LEASE_KEY = "views:refresher"  # аренда обновления из GA одним воркером
+VIEWS_REFRESHED_KEY = "views:refreshed"  # есть, пока данные GA свежие
+VIEWS_LEASE_TTL = 60 * 10
+VIEWS_WRITER_KEY = "views:writer"  # блокировка записи счётчиков: снимок и дельты под ней
+VIEWS_WRITER_TTL = 30
+VIEWS_SYNC_INTERVAL = int(os.environ.get("VIEWS_SYNC_INTERVAL") or 30)  # проверка версии снимка
+
 
 class ViewedStorage:
     lock = asyncio.Lock()
@@ -32,12 +52,22 @@ class ViewedStorage:
     views_by_shout = {}
     shouts_by_topic = {}
     shouts_by_author = {}
+    topics_by_shout = {}
+    authors_by_shout = {}
+    views_by_topic = {}
+    views_by_author = {}
+    slug_by_id = {}
+    tracked_by_shout = {}
     views = None
     period = 60 * 60  # каждый час
     analytics_client: BetaAnalyticsDataClient | None = None
     auth_result = None
     running = False
     start_date = datetime.now().strftime("%Y-%m-%d")
+    version = None  # версия локального снимка счётчиков из Redis
+    lease_token = None
+    refreshed_at = 0
+    tracked_loaded_at = 0
 
     @staticmethod
     async def init():
@@ -53,12 +83,12 @@ class ViewedStorage:
                 # specified in GOOGLE_APPLICATION_CREDENTIALS environment variable.
                 self.analytics_client = BetaAnalyticsDataClient()
                 logger.info(" * Google Analytics credentials accepted")
-
-                # Запуск фоновой задачи
-                _task = asyncio.create_task(self.worker())
             else:
                 logger.warning(" * please, add Google Analytics credentials file")
-                self.running = False
+
+            # Запуск фоновой задачи: синхронизация снимка и, при наличии GA, обновление по очереди с другими воркерами
+            self.running = True
+            _task = asyncio.create_task(self.worker())
 
     @staticmethod
     def load_precounted_views():
@@ -91,58 +121,263 @@ class ViewedStorage:
         except Exception as e:
             logger.error(f"precounted views loading error: {e}")
 
+    @staticmethod
+    def fetch_pages() -> Dict[str, int]:
+        """Блокирующий запрос к Google Analytics: просмотры страниц с self.start_date"""
+        self = ViewedStorage
+        request = RunReportRequest(
+            property=f"properties/{GOOGLE_PROPERTY_ID}",
+            dimensions=[Dimension(name="pagePath")],
+            metrics=[Metric(name="screenPageViews")],
+            date_ranges=[DateRange(start_date=self.start_date, end_date="today")],
+        )
+        response = self.analytics_client.run_report(request)
+        views = {}
+        if response and isinstance(response.rows, list):
+            for row in response.rows:
+                # Извлечение путей страниц из ответа Google Analytics
+                if isinstance(row.dimension_values, list):
+                    page_path = row.dimension_values[0].value
+                    slug = page_path.split("discours.io/")[-1]
+                    views[slug] = views.get(slug, 0) + int(row.metric_values[0].value)
+        return views
+
+    @staticmethod
+    def load_mappings():
+        """Связи публикаций с темами и авторами одним проходом по БД"""
+        with local_session() as session:
+            topics = session.execute(
+                select(Shout.slug, Topic.slug).select_from(ShoutTopic).join(Shout).join(Topic)
+            ).all()
+            authors = session.execute(
+                select(Shout.slug, Author.slug).select_from(ShoutAuthor).join(Shout).join(Author)
+            ).all()
+            slugs = session.execute(select(Shout.id, Shout.slug)).all()
+        topics_by_shout = defaultdict(set)
+        for shout_slug, topic_slug in topics:
+            topics_by_shout[shout_slug].add(topic_slug)
+        authors_by_shout = defaultdict(set)
+        for shout_slug, author_slug in authors:
+            authors_by_shout[shout_slug].add(author_slug)
+        return dict(topics_by_shout), dict(authors_by_shout), dict(slugs)
+
+    @staticmethod
+    def apply_mappings(topics_by_shout, authors_by_shout, slug_by_id):
+        """Замена связей и пересчёт сумм просмотров по темам и авторам"""
+        self = ViewedStorage
+        shouts_by_topic = defaultdict(set)
+        views_by_topic = defaultdict(int)
+        for shout_slug, topic_slugs in topics_by_shout.items():
+            for topic_slug in topic_slugs:
+                shouts_by_topic[topic_slug].add(shout_slug)
+                views_by_topic[topic_slug] += self.views_by_shout.get(shout_slug, 0)
+        shouts_by_author = defaultdict(set)
+        views_by_author = defaultdict(int)
+        for shout_slug, author_slugs in authors_by_shout.items():
+            for author_slug in author_slugs:
+                shouts_by_author[author_slug].add(shout_slug)
+                views_by_author[author_slug] += self.views_by_shout.get(shout_slug, 0)
+        self.topics_by_shout, self.authors_by_shout, self.slug_by_id = topics_by_shout, authors_by_shout, slug_by_id
+        self.shouts_by_topic, self.shouts_by_author = dict(shouts_by_topic), dict(shouts_by_author)
+        self.views_by_topic, self.views_by_author = dict(views_by_topic), dict(views_by_author)
+
+    @staticmethod
+    def set_shout_views(shout_slug: str, views: int):
+        """Новое значение просмотров публикации с обновлением сумм её тем и авторов за O(1) на связь"""
+        self = ViewedStorage
+        delta = views - self.views_by_shout.get(shout_slug, 0)
+        if not delta:
+            return
+        self.views_by_shout[shout_slug] = views
+        for topic_slug in self.topics_by_shout.get(shout_slug, ()):
+            self.views_by_topic[topic_slug] = self.views_by_topic.get(topic_slug, 0) + delta
+        for author_slug in self.authors_by_shout.get(shout_slug, ()):
+            self.views_by_author[author_slug] = self.views_by_author.get(author_slug, 0) + delta
+
+    @staticmethod
+    async def load_snapshot(force=False):
+        """Загрузка счётчиков из Redis в локальный снимок, если версия изменилась"""
+        self = ViewedStorage
+        version = await redis.execute("GET", VIEWS_VERSION_KEY)
+        if version is None or (version == self.version and not force):
+            return
+        result = await redis.pipeline(
+            [
+                ("HGETALL", VIEWS_SHOUTS_KEY),
+                ("HGETALL", VIEWS_TOPICS_KEY),
+                ("HGETALL", VIEWS_AUTHORS_KEY),
+                ("HGETALL", VIEWS_IDS_KEY),
+            ]
+        )
+        if not result:
+            return
+        shouts, topics, authors, ids = result
+        self.views_by_shout = {slug: int(views) for slug, views in shouts.items()}
+        self.views_by_topic = {slug: int(views) for slug, views in topics.items()}
+        self.views_by_author = {slug: int(views) for slug, views in authors.items()}
+        self.slug_by_id = {int(shout_id): slug for shout_id, slug in ids.items()}
+        self.version = version
+        logger.debug(f" * views snapshot v{version}: {len(self.views_by_shout)} shouts")
+
+    @staticmethod
+    async def load_tracked():
+        """
+        Загрузка просмотров из /track, накопленных всеми воркерами: целиком при первой загрузке,
+        затем только публикации, просмотры которых изменились с прошлой загрузки.
+        """
+        self = ViewedStorage
+        now = time.time()
+        since = self.tracked_loaded_at - VIEWS_TRACKED_OVERLAP
+        if now - since >= VIEWS_TRACKED_CHANGED_TTL:
+            tracked = await redis.execute("HGETALL", VIEWS_TRACKED_KEY)
+            if tracked is None:
+                return
+            self.tracked_by_shout = {slug: int(views) for slug, views in tracked.items()}
+        else:
+            slugs = await redis.execute("ZRANGEBYSCORE", VIEWS_TRACKED_CHANGED_KEY, since, "+inf")
+            if slugs is None:
+                return
+            if slugs:
+                views = await redis.execute("HMGET", VIEWS_TRACKED_KEY, *slugs)
+                if views is None:
+                    return
+                self.tracked_by_shout.update({slug: int(v) for slug, v in zip(slugs, views) if v is not None})
+        self.tracked_loaded_at = now
+
+    @staticmethod
+    async def publish_views(old_shouts: dict, old_topics: dict, old_authors: dict, old_ids: dict | None = None):
+        """
+        Запись изменений локальных счётчиков в Redis одной транзакцией HINCRBY.
+        Из связей id -> slug записываются только изменившиеся.
+        """
+        self = ViewedStorage
+        old_ids = old_ids or {}
+        commands = []
+        for key, old, new in (
+            (VIEWS_SHOUTS_KEY, old_shouts, self.views_by_shout),
+            (VIEWS_TOPICS_KEY, old_topics, self.views_by_topic),
+            (VIEWS_AUTHORS_KEY, old_authors, self.views_by_author),
+        ):
+            for slug, views in new.items():
+                delta = views - old.get(slug, 0)
+                if delta:
+                    commands.append(("HINCRBY", key, slug, delta))
+        changed_ids = [v for item in self.slug_by_id.items() if old_ids.get(item[0]) != item[1] for v in item]
+        if changed_ids:
+            commands.append(("HSET", VIEWS_IDS_KEY, *changed_ids))
+        removed_ids = [shout_id for shout_id in old_ids if shout_id not in self.slug_by_id]
+        if removed_ids:
+            commands.append(("HDEL", VIEWS_IDS_KEY, *removed_ids))
+        commands.append(("INCR", VIEWS_VERSION_KEY))
+        result = await redis.pipeline(commands, transaction=True)
+        if result:
+            self.version = str(result[-1])
+
+    @staticmethod
+    async def acquire_writer() -> str | None:
+        """
+        Блокировка записи счётчиков в Redis, общая для обновления из GA и update_slug_views.
+
+        :return: Токен блокировки, пустая строка без Redis, None если блокировку не удалось получить.
+        """
+        if not redis._client:
+            return ""
+        token = os.urandom(8).hex()
+        for _ in range(VIEWS_WRITER_TTL * 10):
+            if await redis.execute("SET", VIEWS_WRITER_KEY, token, "NX", "EX", VIEWS_WRITER_TTL):
+                return token
+            await asyncio.sleep(0.1)
+        return None
+
+    @staticmethod
+    async def write_views(change):
+        """
+        Изменение счётчиков под блокировкой записи: снимок из Redis берётся после её получения,
+        поэтому дельты считаются от последних записанных значений и не складываются дважды.
+
+        :param change: Функция, изменяющая локальные счётчики.
+        """
+        self = ViewedStorage
+        token = await self.acquire_writer()
+        if token is None:
+            logger.warning("views writer lock is busy, update skipped")
+            return
+        try:
+            await self.load_snapshot(force=True)
+            old = (
+                dict(self.views_by_shout),
+                dict(self.views_by_topic),
+                dict(self.views_by_author),
+                dict(self.slug_by_id),
+            )
+            change()
+            await self.publish_views(*old)
+        finally:
+            if token and await redis.execute("GET", VIEWS_WRITER_KEY) == token:
+                await redis.execute("DEL", VIEWS_WRITER_KEY)
+
+    @staticmethod
+    async def acquire_refresh() -> bool:
+        """
+        Выбор воркера для обновления из GA: аренда в Redis, пока данные не устарели.
+        Без Redis каждый процесс обновляет свои счётчики сам.
+        """
+        self = ViewedStorage
+        if not redis._client:
+            return time.time() - self.refreshed_at >= self.period
+        if await redis.execute("EXISTS", VIEWS_REFRESHED_KEY):
+            return False
+        token = os.urandom(8).hex()
+        if await redis.execute("SET", VIEWS_LEASE_KEY, token, "NX", "EX", VIEWS_LEASE_TTL):
+            self.lease_token = token
+            return True
+        return False
+
+    @staticmethod
+    async def release_refresh(refreshed: bool):
+        self = ViewedStorage
+        self.refreshed_at = time.time() if refreshed else self.refreshed_at
+        if self.lease_token:
+            if refreshed:
+                await redis.execute("SET", VIEWS_REFRESHED_KEY, 1, "EX", self.period)
+            if await redis.execute("GET", VIEWS_LEASE_KEY) == self.lease_token:
+                await redis.execute("DEL", VIEWS_LEASE_KEY)
+            self.lease_token = None
+
     # noinspection PyTypeChecker
     @staticmethod
     async def update_pages():
         """Запрос всех страниц от Google Analytics, отсортрованных по количеству просмотров"""
         self = ViewedStorage
         logger.info(" ⎧ views update from Google Analytics ---")
-        if self.running:
-            try:
-                start = time.time()
-                async with self.lock:
-                    if self.analytics_client:
-                        request = RunReportRequest(
-                            property=f"properties/{GOOGLE_PROPERTY_ID}",
-                            dimensions=[Dimension(name="pagePath")],
-                            metrics=[Metric(name="screenPageViews")],
-                            date_ranges=[DateRange(start_date=self.start_date, end_date="today")],
-                        )
-                        response = self.analytics_client.run_report(request)
-                        if response and isinstance(response.rows, list):
-                            slugs = set()
-                            for row in response.rows:
-                                print(
-                                    row.dimension_values[0].value,
-                                    row.metric_values[0].value,
-                                )
-                                # Извлечение путей страниц из ответа Google Analytics
-                                if isinstance(row.dimension_values, list):
-                                    page_path = row.dimension_values[0].value
-                                    slug = page_path.split("discours.io/")[-1]
-                                    fresh_views = int(row.metric_values[0].value)
-
-                                    # Обновление данных в хранилище
-                                    self.views_by_shout[slug] = self.views_by_shout.get(slug, 0)
-                                    self.views_by_shout[slug] += fresh_views
-                                    self.update_topics(slug)
-
-                                    # Запись путей страниц для логирования
-                                    slugs.add(slug)
-
-                                logger.info(f" ⎪ collected pages: {len(slugs)} ")
-
-                        end = time.time()
-                        logger.info(" ⎪ views update time: %fs " % (end - start))
-            except Exception as error:
-                logger.error(error)
-                self.running = False
+        start = time.time()
+        async with self.lock:
+            if self.analytics_client:
+                # запросы к GA и БД в пуле потоков, цикл событий не блокируется
+                pages, mappings = await asyncio.gather(
+                    asyncio.to_thread(self.fetch_pages), asyncio.to_thread(self.load_mappings)
+                )
+
+                def change():
+                    self.apply_mappings(*mappings)
+                    # GA возвращает накопленные значения с self.start_date
+                    for slug, views in pages.items():
+                        self.set_shout_views(slug, views)
+
+                await self.write_views(change)
+                logger.info(f" ⎪ collected pages: {len(pages)} ")
+
+                end = time.time()
+                logger.info(" ⎪ views update time: %fs " % (end - start))
 
     @staticmethod
     def get_shout(shout_slug="", shout_id=0) -> int:
         """Получение метрики просмотров shout по slug или id."""
         self = ViewedStorage
-        fresh_views = self.views_by_shout.get(shout_slug, 0)
+        if not shout_slug and shout_id:
+            shout_slug = self.slug_by_id.get(shout_id, "")
+        # GA и /track считают одни и те же просмотры: трекинг виден сразу, GA догоняет с задержкой
+        fresh_views = max(self.views_by_shout.get(shout_slug, 0), self.tracked_by_shout.get(shout_slug, 0))
         precounted_views = self.precounted_by_slug.get(shout_slug, 0)
         return fresh_views + precounted_views
 
@@ -158,34 +393,12 @@ class ViewedStorage:
     @staticmethod
     def get_topic(topic_slug) -> int:
         """Получение суммарного значения просмотров темы."""
-        self = ViewedStorage
-        return sum(self.views_by_shout.get(shout_slug, 0) for shout_slug in self.shouts_by_topic.get(topic_slug, []))
+        return ViewedStorage.views_by_topic.get(topic_slug, 0)
 
     @staticmethod
     def get_author(author_slug) -> int:
         """Получение суммарного значения просмотров автора."""
-        self = ViewedStorage
-        return sum(self.views_by_shout.get(shout_slug, 0) for shout_slug in self.shouts_by_author.get(author_slug, []))
-
-    @staticmethod
-    def update_topics(shout_slug):
-        """Обновление счетчиков темы по slug shout"""
-        self = ViewedStorage
-        with local_session() as session:
-            # Определение вспомогательной функции для избежа��ия повторения кода
-            def update_groups(dictionary, key, value):
-                dictionary[key] = list(set(dictionary.get(key, []) + [value]))
-
-            # Обновление тем и авторов с использованием вспомогательной функции
-            for [_st, topic] in (
-                session.query(ShoutTopic, Topic).join(Topic).join(Shout).where(Shout.slug == shout_slug).all()
-            ):
-                update_groups(self.shouts_by_topic, topic.slug, shout_slug)
-
-            for [_st, author] in (
-                session.query(ShoutAuthor, Author).join(Author).join(Shout).where(Shout.slug == shout_slug).all()
-            ):
-                update_groups(self.shouts_by_author, author.slug, shout_slug)
+        return ViewedStorage.views_by_author.get(author_slug, 0)
 
     @staticmethod
     async def stop():
@@ -197,30 +410,37 @@ class ViewedStorage:
 
     @staticmethod
     async def worker():
-        """Асинхронная задача обновления"""
+        """Асинхронная задача синхронизации снимка и обновления из GA"""
         failed = 0
         self = ViewedStorage
 
+        # Redis подключается параллельно в lifespan
+        await asyncio.sleep(1)
         while self.running:
             try:
-                await self.update_pages()
-                failed = 0
+                await self.load_snapshot()
+                await self.load_tracked()
             except Exception as exc:
-                failed += 1
-                logger.debug(exc)
-                logger.info(" - update failed #%d, wait 10 secs" % failed)
-                if failed > 3:
-                    logger.info(" - views update failed, not trying anymore")
-                    self.running = False
-                    break
-            if failed == 0:
-                when = datetime.now(timezone.utc) + timedelta(seconds=self.period)
-                t = format(when.astimezone().isoformat())
-                logger.info("       ⎩ next update: %s" % (t.split("T")[0] + " " + t.split("T")[1].split(".")[0]))
-                await asyncio.sleep(self.period)
-            else:
-                await asyncio.sleep(10)
-                logger.info(" - try to update views again")
+                logger.error(f"views snapshot loading failed: {exc}")
+            if self.analytics_client and await self.acquire_refresh():
+                refreshed = False
+                try:
+                    await self.update_pages()
+                    refreshed = True
+                    failed = 0
+                    when = datetime.now(timezone.utc) + timedelta(seconds=self.period)
+                    t = format(when.astimezone().isoformat())
+                    logger.info("       ⎩ next update: %s" % (t.split("T")[0] + " " + t.split("T")[1].split(".")[0]))
+                except Exception as exc:
+                    failed += 1
+                    logger.error(exc)
+                    logger.info(" - update failed #%d" % failed)
+                    if failed > 3:
+                        logger.info(" - views update failed, not trying anymore")
+                        self.analytics_client = None
+                finally:
+                    await self.release_refresh(refreshed)
+            await asyncio.sleep(VIEWS_SYNC_INTERVAL if failed == 0 else 10)
 
     @staticmethod
     async def update_slug_views(slug: str) -> int:
@@ -255,14 +475,14 @@ class ViewedStorage:
                 metrics=[Metric(name="screenPageViews")],
             )
 
-            response = self.analytics_client.run_report(request)
+            response = await asyncio.to_thread(self.analytics_client.run_report, request)
 
             if not response.rows:
                 return 0
 
             views = int(response.rows[0].metric_values[0].value)
             # Кэшируем результат
-            self.views_by_shout[slug] = views
+            await self.write_views(lambda: self.set_shout_views(slug, views))
             return views
 
         except Exception as e:
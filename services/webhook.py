@@ -12,14 +12,15 @@ from starlette.responses import JSONResponse
 from cache.cache import cache_author
 from orm.author import Author
 from resolvers.stat import get_with_stat
-from services.db import local_session
+from services.auth import REVOKE_EVENTS, revoke_user
+from services.db import local_session, primary_only
 from services.schema import request_graphql_data
 from settings import ADMIN_SECRET, WEBHOOK_SECRET
 
 
-async def check_webhook_existence():
+async def check_webhook_existence(event_name: str = "user.login"):
     """
-    Проверяет существование вебхука для user.login события
+    Проверяет существование вебхука для события event_name
 
     Returns:
         tuple: (bool, str, str) - существует ли вебхук, его id и endpoint если существует
@@ -48,21 +49,29 @@ async def check_webhook_existence():
         webhooks = result.get("data", {}).get(query_name, {}).get("webhooks", [])
         logger.info(webhooks)
         for webhook in webhooks:
-            if webhook["event_name"].startswith("user.login"):
+            if webhook["event_name"].startswith(event_name):
                 return True, webhook["id"], webhook["endpoint"]
     return False, None, None
 
 
 async def create_webhook_endpoint():
     """
-    Создает вебхук для user.login события.
+    Создает вебхуки для user.login и событий отзыва доступа (REVOKE_EVENTS).
+    """
+    for event_name in ("user.login", *REVOKE_EVENTS):
+        await create_event_webhook(event_name)
+
+
+async def create_event_webhook(event_name: str):
+    """
+    Создает вебхук для события event_name.
     Если существует старый вебхук - удаляет его и создает новый.
     """
-    logger.info("create_webhook_endpoint called")
+    logger.info(f"create_event_webhook called for {event_name}")
 
     headers = {"Content-Type": "application/json", "X-Authorizer-Admin-Secret": ADMIN_SECRET}
 
-    exists, webhook_id, current_endpoint = await check_webhook_existence()
+    exists, webhook_id, current_endpoint = await check_webhook_existence(event_name)
 
     # Определяем endpoint в зависимости от окружения
     host = os.environ.get("HOST", "core.dscrs.site")
@@ -100,7 +109,7 @@ async def create_webhook_endpoint():
         query_name = "_add_webhook"
         variables = {
             "params": {
-                "event_name": "user.login",
+                "event_name": event_name,
                 "endpoint": endpoint,
                 "enabled": True,
                 "headers": {"Authorization": WEBHOOK_SECRET},
@@ -134,6 +143,9 @@ class WebhookEndpoint(HTTPEndpoint):
             user = data.get("user")
             if not isinstance(user, dict):
                 raise HTTPException(status_code=400, detail="User data is not a dictionary")
+            if data.get("event_name") in REVOKE_EVENTS:
+                await revoke_user(user.get("id", ""))
+                return JSONResponse({"status": "success"})
             #
             name: str = (
                 f"{user.get('given_name', user.get('slug'))} {user.get('middle_name', '')}"
@@ -158,7 +170,12 @@ class WebhookEndpoint(HTTPEndpoint):
                         session.add(author)
                         session.commit()
                         author_query = select(Author).filter(Author.user == user_id)
-                        result = get_with_stat(author_query)
+                        # только что созданного автора на реплике может ещё не быть
+                        token = primary_only.set(True)
+                        try:
+                            result = get_with_stat(author_query)
+                        finally:
+                            primary_only.reset(token)
                         if result:
                             author_with_stat = result[0]
                             author_dict = author_with_stat.dict()
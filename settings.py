@@ -7,15 +7,87 @@ DB_URL = (
     or environ.get("DB_URL", "").replace("postgres://", "postgresql://")
     or "sqlite:///discoursio.db"
 )
+WORKERS = int(environ.get("WORKERS") or 1)  # granian worker processes
+# sqlalchemy pool per worker process, the db thread pool is sized to match it;
+# the async read path has its own engine and pool (asyncpg)
+DB_POOL_SIZE = int(environ.get("DB_POOL_SIZE") or 10)
+DB_MAX_OVERFLOW = int(environ.get("DB_MAX_OVERFLOW") or 20)
+DB_ASYNC_POOL_SIZE = int(environ.get("DB_ASYNC_POOL_SIZE") or 5)
+DB_ASYNC_MAX_OVERFLOW = int(environ.get("DB_ASYNC_MAX_OVERFLOW") or 5)
+# DB_MAX_CONNECTIONS splits a connection budget (e.g. max_connections or pgbouncer pool) between workers instead,
+# each worker's share is divided between the sync and async engines in proportion to their configured limits
+DB_MAX_CONNECTIONS = int(environ.get("DB_MAX_CONNECTIONS") or 0)
+if DB_MAX_CONNECTIONS:
+    _budget = max(2, DB_MAX_CONNECTIONS // WORKERS)
+    _sync_limit, _async_limit = DB_POOL_SIZE + DB_MAX_OVERFLOW, DB_ASYNC_POOL_SIZE + DB_ASYNC_MAX_OVERFLOW
+    _sync_budget = min(_budget - 1, max(1, _budget * _sync_limit // (_sync_limit + _async_limit)))
+    DB_POOL_SIZE = min(DB_POOL_SIZE, _sync_budget)
+    DB_MAX_OVERFLOW = _sync_budget - DB_POOL_SIZE
+    DB_ASYNC_POOL_SIZE = min(DB_ASYNC_POOL_SIZE, _budget - _sync_budget)
+    DB_ASYNC_MAX_OVERFLOW = _budget - _sync_budget - DB_ASYNC_POOL_SIZE
+DB_POOL_TIMEOUT = float(environ.get("DB_POOL_TIMEOUT") or 30)  # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(environ.get("DB_POOL_RECYCLE") or 1800)
+# transaction pooling behind pgbouncer: no pre-ping round trip per checkout, broken connections
+# are replaced after the error, no server-side prepared statements
+DB_PGBOUNCER = environ.get("DB_PGBOUNCER", "0") == "1"
+DB_CALL_TIMEOUT = float(environ.get("DB_CALL_TIMEOUT") or 30)  # seconds, including time in queue
+# compiled statements cached per engine; asyncpg server-side prepared statements per connection, 0 disables them
+DB_QUERY_CACHE_SIZE = int(environ.get("DB_QUERY_CACHE_SIZE") or 1000)
+DB_PREPARED_STATEMENTS = 0 if DB_PGBOUNCER else int(environ.get("DB_PREPARED_STATEMENTS") or 500)
+# read replicas, comma separated; reads fall back to the primary when a replica lags or is down
+DB_REPLICA_URLS = [
+    url.strip().replace("postgres://", "postgresql://")
+    for url in environ.get("DB_REPLICA_URLS", "").split(",")
+    if url.strip()
+]
+DB_REPLICA_MAX_LAG = float(environ.get("DB_REPLICA_MAX_LAG") or 10)  # seconds
+DB_REPLICA_CHECK_INTERVAL = float(environ.get("DB_REPLICA_CHECK_INTERVAL") or 5)
+DB_STICKY_WINDOW = int(environ.get("DB_STICKY_WINDOW") or 10)  # reads of an author go to primary after a mutation
+# query profiler: per fingerprint stats, slow queries and N+1 (same query more than threshold times per request),
+# off unless QUERY_PROFILER=1
+QUERY_PROFILER = environ.get("QUERY_PROFILER") == "1"
+SLOW_QUERY_THRESHOLD = float(environ.get("SLOW_QUERY_THRESHOLD") or 1)  # seconds
+NPLUSONE_THRESHOLD = int(environ.get("NPLUSONE_THRESHOLD") or 10)
 REDIS_URL = environ.get("REDIS_URL") or "redis://127.0.0.1"
 AUTH_URL = environ.get("AUTH_URL") or ""
+# local access token verification: authorizer JWKS or its shared HS secret, revocations in redis
+AUTH_JWKS_URL = environ.get("AUTH_JWKS_URL") or ""
+AUTH_JWT_SECRET = environ.get("AUTH_JWT_SECRET") or ""
+AUTH_CLIENT_ID = environ.get("AUTH_CLIENT_ID") or ""  # проверка aud, если задан
+# seconds a confirmed authorizer session is trusted, capped so logout takes effect quickly
+AUTH_TOKEN_CACHE_TTL = min(int(environ.get("AUTH_TOKEN_CACHE_TTL") or 60), 300)
 GLITCHTIP_DSN = environ.get("GLITCHTIP_DSN")
 DEV_SERVER_PID_FILE_NAME = "dev-server.pid"
 MODE = "development" if "dev" in sys.argv else "production"
 
-ADMIN_SECRET = environ.get("AUTH_SECRET") or "nothing"
+AUTH_SECRET = environ.get("AUTH_SECRET") or ""  # пустой закрывает /admin/* эндпоинты
+ADMIN_SECRET = AUTH_SECRET or "nothing"
 WEBHOOK_SECRET = environ.get("WEBHOOK_SECRET") or "nothing-else"
 
+# shared outgoing http client: timeouts in seconds, retries on network errors and 502/503/504
+HTTP_TIMEOUT = float(environ.get("HTTP_TIMEOUT") or 10)
+HTTP_CONNECT_TIMEOUT = float(environ.get("HTTP_CONNECT_TIMEOUT") or 3)
+HTTP_MAX_CONNECTIONS = int(environ.get("HTTP_MAX_CONNECTIONS") or 50)
+HTTP_RETRIES = int(environ.get("HTTP_RETRIES") or 2)
+HTTP_BREAKER_THRESHOLD = int(environ.get("HTTP_BREAKER_THRESHOLD") or 5)  # неудач подряд до размыкания
+HTTP_BREAKER_RESET = float(environ.get("HTTP_BREAKER_RESET") or 30)  # секунд до пробного запроса
+
+# notifications storage
+NOTIFICATION_RETENTION_DAYS = int(environ.get("NOTIFICATION_RETENTION_DAYS") or 90)
+NOTIFICATION_ARCHIVE_DAYS = int(environ.get("NOTIFICATION_ARCHIVE_DAYS") or 0)  # 0 - хранить архив бессрочно
+NOTIFICATION_COMPACTION_INTERVAL = int(environ.get("NOTIFICATION_COMPACTION_INTERVAL") or 60 * 60 * 6)
+
+# rating reactions (likes, dislikes) rate limit per author: tokens per second and burst size, 0 disables
+REACTION_RATE = float(environ.get("REACTION_RATE") or 0.5)
+REACTION_BURST = int(environ.get("REACTION_BURST") or 20)
+
+# topic classifier: local model copy and on-disk embeddings index
+PRETOPIC_MODEL_NAME = (
+    environ.get("PRETOPIC_MODEL_NAME") or "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
+)
+PRETOPIC_MODEL_PATH = environ.get("PRETOPIC_MODEL_PATH") or "./data/models/paraphrase-multilingual-mpnet-base-v2"
+PRETOPIC_INDEX_PATH = environ.get("PRETOPIC_INDEX_PATH") or "./data/pretopic"
+
 # own auth
 ONETIME_TOKEN_LIFE_SPAN = 60 * 60 * 24 * 3  # 3 days
 SESSION_TOKEN_LIFE_SPAN = 60 * 60 * 24 * 30  # 30 days
@@ -0,0 +1,168 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from authlib.jose import JsonWebKey
+from fakeredis.aioredis import FakeRedis
+from graphql import OperationType
+from starlette.applications import Starlette
+from starlette.routing import Route
+
+from services import auth
+from services.redis import redis
+from services.webhook import WebhookEndpoint
+
+AUTH_URL = "https://auth.example/graphql"
+
+
+def make_token(key, **claims):
+    payload = {"sub": "user-1", "allowed_roles": ["reader"], "exp": int(time.time()) + 60, **claims}
+    return auth.jwt_asymmetric.encode({"alg": "RS256", "kid": "k1"}, payload, key).decode()
+
+
+@pytest.fixture
+def key(monkeypatch):
+    key = JsonWebKey.generate_key("RSA", 2048, is_private=True, options={"kid": "k1"})
+    keys = JsonWebKey.import_key_set({"keys": [key.as_dict(is_private=False)]})
+    monkeypatch.setitem(auth.jwks_cache, auth.jwks_url(AUTH_URL), (keys, {"k1"}, time.time()))
+    monkeypatch.setattr(redis, "_client", FakeRedis(decode_responses=True))
+    return key
+
+
+@pytest.mark.asyncio
+async def test_jwt_is_verified_locally(key, monkeypatch):
+    calls = []
+
+    async def remote(token, auth_url):
+        calls.append(token)
+        return {"sub": "user-1"}
+
+    monkeypatch.setattr(auth, "validate_token_remotely", remote)
+    token = make_token(key)
+    for _ in range(3):
+        assert (await auth.get_token_claims(token, AUTH_URL))["sub"] == "user-1"
+    assert calls == [token]  # сессия подтверждается один раз за AUTH_TOKEN_CACHE_TTL
+    assert await auth.get_token_claims(make_token(key, exp=int(time.time()) - 60), AUTH_URL) == {}
+    assert await auth.get_token_claims(make_token(key, token_type="refresh_token"), AUTH_URL) == {}
+    assert calls == [token]
+
+
+@pytest.mark.asyncio
+async def test_jwt_is_accepted_when_authorizer_is_down(key, monkeypatch):
+    async def remote(token, auth_url):
+        return None
+
+    monkeypatch.setattr(auth, "validate_token_remotely", remote)
+    assert (await auth.get_token_claims(make_token(key), AUTH_URL))["sub"] == "user-1"
+
+
+@pytest.mark.asyncio
+async def test_token_signed_with_rotated_key_is_checked_remotely(key, monkeypatch):
+    calls = []
+
+    async def remote(token, auth_url):
+        calls.append(token)
+        return {"sub": "user-1"}
+
+    monkeypatch.setattr(auth, "validate_token_remotely", remote)
+    # авторизатор перешёл на новый ключ, а набор ключей загружен только что
+    rotated = JsonWebKey.generate_key("RSA", 2048, is_private=True, options={"kid": "k2"})
+    payload = {"sub": "user-1", "allowed_roles": ["reader"], "exp": int(time.time()) + 60}
+    token = auth.jwt_asymmetric.encode({"alg": "RS256", "kid": "k2"}, payload, rotated).decode()
+
+    assert await auth.verify_token(token, AUTH_URL) is None
+    assert (await auth.get_token_claims(token, AUTH_URL))["sub"] == "user-1"
+    assert calls == [token]
+
+
+def test_session_check_ttl_is_below_token_lifetime():
+    now = int(time.time())
+    assert auth.session_check_ttl({"iat": now, "exp": now + 3600}) == min(auth.AUTH_TOKEN_CACHE_TTL, 360)
+    assert auth.session_check_ttl({"iat": now, "exp": now + 300}) == 30
+
+
+@pytest.mark.asyncio
+async def test_opaque_token_claims_are_cached(key, monkeypatch):
+    calls = []
+
+    async def remote(token, auth_url):
+        calls.append(token)
+        return {"sub": "user-2", "allowed_roles": ["reader"]}
+
+    monkeypatch.setattr(auth, "validate_token_remotely", remote)
+    for _ in range(3):
+        assert (await auth.get_token_claims("opaque", AUTH_URL))["sub"] == "user-2"
+    assert calls == ["opaque"]
+
+
+@pytest.mark.asyncio
+async def test_revoked_token(key):
+    token = make_token(key, jti="t1")
+    claims = await auth.get_token_claims(token, AUTH_URL)
+    assert not await auth.is_revoked(token, claims)
+    await auth.revoke_token(token, claims)
+    assert await auth.is_revoked(token, claims)
+
+
+@pytest.mark.asyncio
+async def test_revocation_end_to_end(key, monkeypatch):
+    sessions = {"user-1": True}
+
+    async def remote(token, auth_url):
+        return {"sub": "user-1"} if sessions["user-1"] else {}
+
+    monkeypatch.setattr(auth, "validate_token_remotely", remote)
+    monkeypatch.setattr(auth, "AUTH_URL", AUTH_URL)
+    monkeypatch.setenv("WEBHOOK_SECRET", "hook")
+    token = make_token(key, iat=int(time.time()) - 1)
+    request = SimpleNamespace(headers={"Authorization": f"Bearer {token}", "host": "core.example"})
+    assert await auth.check_auth(request) == ("user-1", ["reader"])
+
+    # выход у авторизатора: после истечения кэша подтверждения сессии токен отклоняется
+    sessions["user-1"] = False
+    await redis.execute("DEL", auth.TOKEN_CLAIMS_KEY.format(auth.token_hash(token)))
+    assert await auth.check_auth(request) == ("", [])
+
+    # отзыв доступа вебхуком действует сразу, даже при подтверждённой сессии
+    sessions["user-1"] = True
+    assert await auth.check_auth(request) == ("user-1", ["reader"])
+    app = Starlette(routes=[Route("/new-author", WebhookEndpoint)])
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://core") as client:
+        response = await client.post(
+            "/new-author",
+            json={"event_name": "user.access_revoked", "user": {"id": "user-1"}},
+            headers={"Authorization": "hook"},
+        )
+    assert response.status_code == 200
+    assert await auth.check_auth(request) == ("", [])
+
+    # токены, выданные после отзыва, снова действуют
+    fresh = make_token(key, iat=int(time.time()) + 1)
+    request = SimpleNamespace(headers={"Authorization": f"Bearer {fresh}", "host": "core.example"})
+    assert await auth.check_auth(request) == ("user-1", ["reader"])
+
+
+@pytest.mark.asyncio
+async def test_auth_is_resolved_once_per_request(monkeypatch):
+    calls = []
+
+    async def check_auth(req):
+        calls.append(req)
+        await asyncio.sleep(0)
+        return "user-1", ["reader"]
+
+    async def get_author(user_id, get_with_stat):
+        return {"id": 1, "user": user_id}
+
+    monkeypatch.setattr(auth, "check_auth", check_auth)
+    monkeypatch.setattr(auth, "get_cached_author_by_user_id", get_author)
+
+    @auth.login_required
+    async def resolver(_, info):
+        return info.context["author"]["id"]
+
+    info = SimpleNamespace(context={"request": object()}, operation=SimpleNamespace(operation=OperationType.QUERY))
+    assert await asyncio.gather(*(resolver(None, info) for _ in range(5))) == [1] * 5
+    assert len(calls) == 1
@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+
+from services.coalescer import WriteCoalescer
+
+
+@pytest.mark.asyncio
+async def test_coalescer_merges_keys_within_window():
+    batches = []
+
+    async def flush(batch):
+        batches.append(batch)
+
+    coalescer = WriteCoalescer(flush, window=0.05)
+    for author_id in range(10):
+        coalescer.add(("shout", 1), (author_id, "LIKE"))
+    coalescer.add(("author", 2))
+    await asyncio.sleep(0.15)
+    await coalescer.stop()
+
+    assert len(batches) == 1
+    assert len(batches[0][("shout", 1)]) == 10
+    assert batches[0][("author", 2)] == []
+
+
+@pytest.mark.asyncio
+async def test_coalescer_drains_on_stop():
+    batches = []
+
+    async def flush(batch):
+        batches.append(batch)
+
+    coalescer = WriteCoalescer(flush, window=60)
+    coalescer.add(("shout", 1), (1, "DISLIKE"))
+    await coalescer.stop()
+
+    assert batches == [{("shout", 1): [(1, "DISLIKE")]}]
@@ -0,0 +1,59 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from services import db
+
+
+@pytest.mark.asyncio
+async def test_run_in_db_pool_records_queue_time_and_times_out():
+    calls = db.db_pool_calls.count
+    assert await db.run_in_db_pool(sum, [1, 2, 3]) == 6
+    assert db.db_pool_calls.count == calls + 1
+
+    timeouts = db.db_pool_queue.errors
+    with pytest.raises(asyncio.TimeoutError):
+        await db.run_in_db_pool(time.sleep, 0.2, timeout=0.01)
+    assert db.db_pool_queue.errors == timeouts + 1
+    assert "db_pool_timeouts_total" in db.export_db_pool_metrics()
+
+
+def test_connection_pool_checkout_metrics(tmp_path, monkeypatch):
+    engine = db.create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=db.InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+    )
+    monkeypatch.setitem(db.db_engines, "test", engine)
+    pool = engine.pool
+    with engine.connect():
+        with pytest.raises(db.exc.TimeoutError):
+            engine.connect()
+        metrics = db.export_db_pool_metrics()
+        assert 'db_connections_in_use{pool="test"} 1' in metrics
+        assert 'db_connections_limit{pool="test"} 1' in metrics
+    assert pool.metrics.count == 2
+    assert pool.metrics.errors == 1
+    assert 'db_connection_timeouts_total{pool="test"} 1' in db.export_db_pool_metrics()
+
+    engine.dispose()
+    assert engine.pool is not pool
+    assert engine.pool.metrics is pool.metrics
+
+
+@pytest.mark.parametrize("workers, budget", [(1, 40), (4, 40), (8, 10)])
+def test_connection_budget_is_split_between_sync_and_async_engines(workers, budget):
+    env = {**os.environ, "WORKERS": str(workers), "DB_MAX_CONNECTIONS": str(budget)}
+    code = (
+        "import settings as s; print(s.DB_POOL_SIZE, s.DB_MAX_OVERFLOW, s.DB_ASYNC_POOL_SIZE, s.DB_ASYNC_MAX_OVERFLOW)"
+    )
+    output = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True).stdout
+    pool_size, max_overflow, async_pool_size, async_max_overflow = map(int, output.split())
+    assert pool_size >= 1 and async_pool_size >= 1
+    assert pool_size + max_overflow + async_pool_size + async_max_overflow == max(2, budget // workers)
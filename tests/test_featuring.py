@@ -0,0 +1,66 @@
+from datetime import datetime
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+
+from orm.author import Author
+from orm.reaction import Reaction, ReactionKind
+from orm.shout import Shout, ShoutAuthor
+from resolvers import reaction
+from resolvers.reaction import check_to_feature
+from services.ratelimit import RateLimiter
+from services.redis import redis
+
+
+def make_shout(db_session, author, slug, featured_at=None):
+    now = int(datetime.now().timestamp())
+    shout = Shout(
+        title=slug,
+        slug=slug,
+        created_by=author.id,
+        body="Test body",
+        layout="article",
+        lang="ru",
+        community=1,
+        created_at=now,
+        published_at=now,
+        featured_at=featured_at,
+    )
+    db_session.add(shout)
+    db_session.flush()
+    db_session.add(ShoutAuthor(shout=shout.id, author=author.id))
+    db_session.flush()
+    return shout
+
+
+def test_ordinary_likes_in_one_window_do_not_feature(db_session):
+    """Only the voting author and featured authors among reactors are counted, as before coalescing."""
+    author = Author(name="Feature Author", slug="feature-author", user="feature-author-id")
+    readers = [Author(name=f"Reader {i}", slug=f"feature-reader-{i}", user=f"feature-reader-{i}") for i in range(5)]
+    db_session.add_all([author, *readers])
+    db_session.flush()
+    shout = make_shout(db_session, author, "feature-shout")
+    for reader in readers:
+        db_session.add(Reaction(shout=shout.id, created_by=reader.id, kind=ReactionKind.LIKE.value))
+    db_session.flush()
+
+    approvers = {reader.id for reader in readers}
+    assert not check_to_feature(db_session, shout.id, approvers)
+
+    # четыре читателя - авторы избранных публикаций, пятый голос от обычного читателя
+    for i, reader in enumerate(readers[:4]):
+        make_shout(db_session, reader, f"featured-by-reader-{i}", featured_at=int(datetime.now().timestamp()))
+    assert check_to_feature(db_session, shout.id, {readers[4].id})
+    assert not check_to_feature(db_session, shout.id, {readers[0].id})
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_applies_to_ratings_only(monkeypatch):
+    monkeypatch.setattr(reaction, "reaction_limiter", RateLimiter("reaction-test", 0.001, 1))
+    monkeypatch.setattr(redis, "_client", FakeRedis(decode_responses=True))
+
+    assert await reaction.rating_allowed(1, ReactionKind.LIKE.value)
+    assert not await reaction.rating_allowed(1, ReactionKind.DISLIKE.value)
+    # комментарии и цитаты не расходуют и не ждут токенов
+    assert await reaction.rating_allowed(1, ReactionKind.COMMENT.value)
+    assert await reaction.rating_allowed(1, ReactionKind.QUOTE.value)
@@ -0,0 +1,35 @@
+import httpx
+import pytest
+
+from services import http
+from services.http import CircuitBreaker, CircuitOpenError, HTTPClientService
+
+
+@pytest.mark.asyncio
+async def test_retries_then_opens_circuit(monkeypatch):
+    monkeypatch.setattr(http, "RETRY_BACKOFF", 0)
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(503 if len(calls) < 2 else 200, json={})
+
+    service = HTTPClientService()
+    service.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    response = await service.post("https://auth.example/graphql", json={})
+    assert response.status_code == 200
+    assert len(calls) == 2
+
+    def down(request):
+        raise httpx.ConnectError("down")
+
+    service.client = httpx.AsyncClient(transport=httpx.MockTransport(down))
+    service.breakers["auth.example"] = CircuitBreaker(threshold=2, reset_timeout=60)
+    with pytest.raises(httpx.ConnectError):
+        await service.post("https://auth.example/graphql", json={}, retries=1)
+    with pytest.raises(CircuitOpenError):
+        await service.post("https://auth.example/graphql", json={})
+
+    metrics = service.export_metrics()
+    assert 'http_client_rejected_total{endpoint="auth.example/graphql"} 1' in metrics
+    await service.stop()
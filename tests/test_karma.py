@@ -0,0 +1,49 @@
+from datetime import datetime
+
+from orm.author import Author, AuthorKarma, AuthorRating
+from orm.reaction import Reaction, ReactionKind
+from orm.shout import Shout, ShoutAuthor
+from services.karma import rebuild_author_karma
+
+
+def test_author_karma_projection(db_session):
+    """Test author karma is updated incrementally and can be rebuilt."""
+    now = int(datetime.now().timestamp())
+    author = Author(name="Karma Author", slug="karma-author", user="karma-user-id")
+    reader = Author(name="Karma Reader", slug="karma-reader", user="karma-reader-id")
+    db_session.add_all([author, reader])
+    db_session.flush()
+
+    shout = Shout(
+        title="Karma Shout",
+        slug="karma-shout",
+        created_by=author.id,
+        body="Test body",
+        layout="article",
+        lang="ru",
+        community=1,
+        created_at=now,
+        published_at=now,
+    )
+    db_session.add(shout)
+    db_session.flush()
+    db_session.add(ShoutAuthor(shout=shout.id, author=author.id))
+    db_session.flush()
+
+    like = Reaction(shout=shout.id, created_by=reader.id, kind=ReactionKind.LIKE.value)
+    db_session.add(like)
+    db_session.add(AuthorRating(rater=reader.id, author=author.id, plus=False))
+    db_session.commit()
+
+    karma = db_session.query(AuthorKarma).filter(AuthorKarma.author == author.id).one()
+    assert (karma.rating_shouts, karma.rating_comments, karma.rating_direct) == (1, 0, -1)
+    assert karma.rating == 0
+
+    like.deleted_at = now
+    db_session.commit()
+    db_session.refresh(karma)
+    assert (karma.rating_shouts, karma.rating) == (0, -1)
+
+    rebuild_author_karma(db_session)
+    karma = db_session.query(AuthorKarma).filter(AuthorKarma.author == author.id).one()
+    assert (karma.rating_shouts, karma.rating_direct, karma.rating) == (0, -1, -1)
@@ -0,0 +1,93 @@
+import pytest
+from ariadne import graphql
+from sqlalchemy.orm import Session
+
+from cache import triggers
+from main import schema
+from orm.author import Author
+from orm.reaction import Reaction, ReactionKind
+from orm.shout import Shout, ShoutAuthor
+from resolvers import reaction, reader
+
+
+@pytest.fixture
+def listing(db_session, monkeypatch):
+    """Публикации и комментарий в тестовой БД, асинхронное чтение идёт через ту же сессию."""
+
+    async def fetch_all(q):
+        return list(db_session.execute(q).all())
+
+    monkeypatch.setattr(reader, "fetch_all", fetch_all)
+    monkeypatch.setattr(reaction, "fetch_all", fetch_all)
+    monkeypatch.setattr(triggers, "local_session", lambda: Session(bind=db_session.connection()))
+    author = Author(name="Listing Author", slug="listing-author", user="listing-user")
+    db_session.add(author)
+    db_session.flush()
+    shouts = [
+        Shout(
+            slug=f"listing-{i}",
+            title=f"Listing {i}",
+            body="",
+            layout="article",
+            created_by=author.id,
+            community=1,
+            created_at=i,
+            published_at=i,
+        )
+        for i in (1, 2)
+    ]
+    db_session.add_all(shouts)
+    db_session.flush()
+    db_session.add_all([ShoutAuthor(shout=shout.id, author=author.id) for shout in shouts])
+    db_session.add(Reaction(kind=ReactionKind.COMMENT.value, body="hi", shout=shouts[0].id, created_by=author.id))
+    db_session.flush()
+    return author, shouts
+
+
+@pytest.mark.asyncio
+async def test_shout_listing_reads_rows_without_orm(listing):
+    author, shouts = listing
+    query = """
+        query {
+            load_shouts_by(options: {limit: 10}) {
+                id slug created_by { id name slug } authors { slug } stat { viewed commented }
+            }
+        }
+    """
+    success, result = await graphql(schema, {"query": query})
+
+    assert success, result
+    loaded = {shout["slug"]: shout for shout in result["data"]["load_shouts_by"] if shout}
+    assert loaded["listing-1"]["created_by"] == {"id": author.id, "name": "Listing Author", "slug": "listing-author"}
+    assert loaded["listing-1"]["authors"] == [{"slug": "listing-author"}]
+    assert loaded["listing-1"]["stat"]["commented"] == 1
+
+
+@pytest.mark.asyncio
+async def test_shout_listing_tolerates_missing_creator(listing, db_session, monkeypatch):
+    author, shouts = listing
+
+    async def fetch_all(q):
+        # запрос создателей ушёл на реплику, которая ещё не получила строку автора
+        if q.column_descriptions[0]["entity"] is Author and len(q.column_descriptions) == 4:
+            return []
+        return list(db_session.execute(q).all())
+
+    monkeypatch.setattr(reader, "fetch_all", fetch_all)
+    query = "query { load_shouts_by(options: {limit: 10}) { slug created_by { id slug } } }"
+    success, result = await graphql(schema, {"query": query})
+
+    assert success, result
+    assert [shout["created_by"] for shout in result["data"]["load_shouts_by"]] == [{"id": author.id, "slug": ""}] * 2
+
+
+@pytest.mark.asyncio
+async def test_comment_listing_is_loaded_asynchronously(listing):
+    author, shouts = listing
+    query = "query($shout: Int!) { load_shout_comments(shout: $shout) { body created_by { slug } shout { slug } } }"
+    success, result = await graphql(schema, {"query": query, "variables": {"shout": shouts[0].id}})
+
+    assert success, result
+    assert result["data"]["load_shout_comments"] == [
+        {"body": "hi", "created_by": {"slug": "listing-author"}, "shout": {"slug": "listing-1"}}
+    ]
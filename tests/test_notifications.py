@@ -0,0 +1,48 @@
+import time
+
+from orm.notification import Notification, NotificationArchive, notification_author, notification_thread
+from services.retention import DAY, compact_notifications
+from settings import NOTIFICATION_RETENTION_DAYS
+
+
+def test_notification_keys_extracted_from_payload():
+    """Test thread and author extraction at write time."""
+    comment_reply = {"id": 3, "shout": 1, "reply_to": 2, "kind": "COMMENT", "created_by": 7}
+    assert notification_thread("reaction", comment_reply) == "shout-1::2"
+    assert notification_author("reaction", comment_reply) == 7
+    assert notification_thread("shout", {"id": 5, "created_by": 1}) == "shout-5"
+    assert notification_thread("follower:4", {"id": 9, "slug": "x"}) == "followers"
+    assert notification_author("follower:4", {"id": 9, "slug": "x"}) == 9
+    assert notification_thread("reaction", "not a dict") is None
+
+
+def test_reply_threads_do_not_collide():
+    """Shout 1 + reply 23 and shout 12 + reply 3 are different threads."""
+    first = notification_thread("reaction", {"shout": 1, "reply_to": 23, "kind": "COMMENT"})
+    second = notification_thread("reaction", {"shout": 12, "reply_to": 3, "kind": "COMMENT"})
+    assert first != second
+    assert notification_thread("reaction", {"shout": 123, "kind": "LIKE"}) not in (first, second)
+
+
+def test_compact_notifications(db_session):
+    """Test old notifications are moved to the archive."""
+    now = int(time.time())
+    old = Notification(
+        entity="reaction",
+        action="create",
+        payload={"id": 1, "shout": 1},
+        thread="shout-1",
+        created_at=now - (NOTIFICATION_RETENTION_DAYS + 1) * DAY,
+    )
+    fresh = Notification(entity="reaction", action="create", payload={"id": 2, "shout": 1}, created_at=now)
+    db_session.add_all([old, fresh])
+    db_session.commit()
+    old_id = old.id
+
+    moved, _pruned = compact_notifications(db_session, now)
+
+    assert moved == 1
+    assert db_session.query(Notification).filter(Notification.id == old_id).first() is None
+    archived = db_session.query(NotificationArchive).filter(NotificationArchive.id == old_id).one()
+    assert archived.thread == "shout-1"
+    assert db_session.query(Notification).filter(Notification.id == fresh.id).first() is not None
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from orm.outbox import Outbox, OutboxKind
+from services import outbox
+from services.db import Base
+
+
+@pytest.fixture
+def outbox_session(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'outbox.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine, tables=[Outbox.__table__])
+    monkeypatch.setattr(outbox, "local_session", lambda: Session(bind=engine, expire_on_commit=False))
+    with outbox.local_session() as session:
+        for user_id in range(20):
+            outbox.enqueue(session, OutboxKind.ADD_USER_ROLE, {"user_id": user_id})
+        session.commit()
+    return outbox.local_session
+
+
+def test_claimed_items_are_invisible_to_other_dispatchers(outbox_session):
+    first = outbox.OutboxDispatcher.claim_due(15)
+    second = outbox.OutboxDispatcher.claim_due(15)
+    assert len(first) == 15
+    assert len(second) == 5
+    assert not {item.id for item in first} & {item.id for item in second}
+    assert outbox.OutboxDispatcher.claim_due(15) == []
+
+
+@pytest.mark.asyncio
+async def test_two_dispatchers_deliver_each_item_once(outbox_session, monkeypatch):
+    delivered = []
+
+    async def handler(payloads):
+        await asyncio.sleep(0.01)
+        delivered.extend(p["user_id"] for p in payloads)
+        return [True] * len(payloads)
+
+    monkeypatch.setitem(outbox.OUTBOX_HANDLERS, OutboxKind.ADD_USER_ROLE.value, handler)
+    dispatchers = [outbox.OutboxDispatcher(batch_size=4), outbox.OutboxDispatcher(batch_size=4)]
+
+    async def drain(dispatcher):
+        while await dispatcher.process_batch():
+            pass
+
+    await asyncio.gather(*(drain(dispatcher) for dispatcher in dispatchers))
+    assert sorted(delivered) == list(range(20))
+    with outbox_session() as session:
+        assert all(session.execute(select(Outbox.processed_at)).scalars())
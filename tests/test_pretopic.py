@@ -0,0 +1,81 @@
+import pytest
+
+pytest.importorskip("txtai.embeddings")
+
+from services import pretopic  # noqa: E402
+from services.pretopic import TopicClassifier  # noqa: E402
+
+
+class WordEmbeddings:
+    """Индекс с оценкой по доле общих слов вместо модели."""
+
+    def __init__(self):
+        self.documents = {}
+
+    def exists(self, path):
+        return False
+
+    def count(self):
+        return len(self.documents)
+
+    def index(self, batch):
+        self.documents = {}
+        self.upsert(batch)
+
+    def upsert(self, batch):
+        self.documents.update({doc_id: set(text.lower().split()) for doc_id, text, _ in batch})
+
+    def delete(self, ids):
+        for doc_id in ids:
+            self.documents.pop(doc_id, None)
+
+    def search(self, query, limit):
+        words = set(query.lower().split())
+        scores = [(doc_id, len(words & doc) / len(words | doc)) for doc_id, doc in self.documents.items()]
+        return sorted([item for item in scores if item[1]], key=lambda item: -item[1])[:limit]
+
+    def batchsearch(self, queries, limit):
+        return [self.search(query, limit) for query in queries]
+
+    def save(self, path):
+        pass
+
+
+class WordClassifier(TopicClassifier):
+    def _new_embeddings(self, model_path):
+        return WordEmbeddings()
+
+
+@pytest.fixture
+def classifier(tmp_path, monkeypatch):
+    monkeypatch.setattr(pretopic, "local_model_path", lambda: str(tmp_path / "model"))
+    topics = {"Спорт": "футбол матч гол команда", "Технологии": "процессор видеокарта компьютер"}
+    publications = [{"id": 1, "title": "Футбольный матч", "text": "гол в финале"}]
+    return WordClassifier(topics, publications, index_path=str(tmp_path / "index"))
+
+
+def test_drafts_are_classified_by_topic(classifier):
+    classifier.initialize()
+    classifier.wait_until_ready()
+
+    suggestions = classifier.classify_drafts(
+        [{"id": 10, "title": "Новый процессор", "body": "компьютер"}, {"id": 11, "title": "матч", "body": "гол"}]
+    )
+
+    assert suggestions["10"][1] == "Технологии"
+    assert suggestions["11"][1] == "Спорт"
+
+
+def test_publications_added_before_and_after_ready_are_indexed(classifier):
+    # добавлена до готовности индекса: запоминается и доиндексируется подготовкой
+    classifier.add_publications([{"id": 2, "title": "Видеокарта", "text": "процессор и видеокарта"}])
+    classifier.initialize()
+    classifier.wait_until_ready()
+    assert [pub["id"] for pub in classifier.search_similar("видеокарта", 5)] == [2]
+
+    classifier.add_publications([{"id": 3, "title": "Компьютер", "text": "видеокарта процессор компьютер"}])
+    assert {pub["id"] for pub in classifier.search_similar("видеокарта процессор", 5)} == {2, 3}
+
+    classifier.remove_publications([2])
+    assert [pub["id"] for pub in classifier.search_similar("видеокарта", 5)] == [3]
+    assert set(classifier.hashes["shouts"]) == {"1", "3"}
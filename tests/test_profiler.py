@@ -0,0 +1,70 @@
+import httpx
+import pytest
+from sqlalchemy import create_engine, text
+from starlette.applications import Starlette
+from starlette.routing import Route
+
+from main import metrics_handler
+from services import db, profiler
+from services.profiler import (
+    QueryProfiler,
+    RequestProfile,
+    current_resolver,
+    fingerprint,
+    query_profiler,
+    request_profile,
+)
+
+
+def test_fingerprint_strips_literals_and_parameters():
+    assert fingerprint("SELECT * FROM shout WHERE id = 42 AND slug = 'it''s'") == (
+        "SELECT * FROM shout WHERE id = ? AND slug = ?"
+    )
+    assert fingerprint("SELECT id FROM author WHERE id IN (%(id_1)s, %(id_2)s)") == fingerprint(
+        "SELECT id FROM author WHERE id IN (?)"
+    )
+    assert (
+        fingerprint("SELECT x::text FROM t1\n  WHERE a = :a AND b = $2")
+        == "SELECT x::text FROM t1 WHERE a = ? AND b = ?"
+    )
+
+
+def test_nplusone_is_reported_per_resolver():
+    profiler = QueryProfiler()
+    profile = RequestProfile()
+    profile.operation = "LoadShouts"
+    token, resolver = request_profile.set(profile), current_resolver.set("Query.load_shouts_by")
+    try:
+        for author_id in range(12):
+            profiler.record(f"SELECT * FROM author WHERE id = {author_id}", None, 0.001)
+        profiler.record("SELECT * FROM shout", None, 0.002)
+    finally:
+        current_resolver.reset(resolver)
+        request_profile.reset(token)
+    profiler.finish_request(profile)
+
+    report = profiler.report()
+    assert report["queries"][0]["count"] == 12
+    assert report["queries"][0]["sources"] == {"LoadShouts:Query.load_shouts_by": 12}
+    assert [(r["resolver"], r["count"]) for r in report["nplusone"]] == [("Query.load_shouts_by", 12)]
+
+
+def test_engine_queries_are_profiled(monkeypatch):
+    monkeypatch.setattr(db, "QUERY_PROFILER", True)
+    query_profiler.reset()
+    with create_engine("sqlite://").connect() as connection:
+        connection.execute(text("SELECT 1"))
+    assert any(q["query"] == "SELECT ?" for q in query_profiler.report()["queries"])
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "auth_secret, header, status", [("", "", 403), ("", "nothing", 403), ("s3cret", "s3cret", 200)]
+)
+@pytest.mark.parametrize("path", ["/admin/queries", "/metrics"])
+async def test_admin_endpoints_require_auth_secret(monkeypatch, path, auth_secret, header, status):
+    monkeypatch.setattr(profiler, "AUTH_SECRET", auth_secret)
+    app = Starlette(routes=[Route("/admin/queries", profiler.queries_handler), Route("/metrics", metrics_handler)])
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.get(path, headers={"x-admin-secret": header})
+    assert response.status_code == status
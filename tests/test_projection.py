@@ -0,0 +1,27 @@
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from orm.author import Author
+from services.db import Base
+
+
+def test_row_dict_matches_orm_dict():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(Author(id=1, slug="a", name="A", links=["https://a.example"]))
+        session.commit()
+        author = session.get(Author, 1)
+        row = session.execute(select(*Author.columns())).one()
+        assert Author.row_dict(row) == author.dict()
+        assert Author.row_dict(row)["links"] == ["https://a.example"]
+
+        row = session.execute(select(Author.id, *Author.columns())).one()
+        assert Author.row_dict(row, 1) == author.dict()
+
+
+def test_json_strings_are_decoded():
+    author = Author(id=1, slug="a", links='["https://a.example"]')
+    assert author.dict()["links"] == ["https://a.example"]
+    author.links = "not json"
+    assert author.dict()["links"] == "not json"
@@ -0,0 +1,26 @@
+from sqlalchemy import select
+
+from orm.author import Author
+from orm.reaction import Reaction
+from resolvers.reaction import add_reaction_stat_columns, query_reactions
+from resolvers.reader import shouts_query
+from resolvers.stat import TOPIC_SHOUTS_STAT, add_author_stat_columns
+
+
+def test_shouts_query_is_reused():
+    assert shouts_query(True, False, True, True) is shouts_query(True, False, True, True)
+    assert shouts_query(True, False, True, True) is not shouts_query(True, True, True, True)
+
+
+def test_hot_queries_share_cache_key():
+    first = add_reaction_stat_columns(query_reactions()).where(Reaction.shout == 1)
+    second = add_reaction_stat_columns(query_reactions()).where(Reaction.shout == 2)
+    assert first._generate_cache_key().key == second._generate_cache_key().key
+
+    first = add_author_stat_columns(select(Author).where(Author.id == 1))
+    second = add_author_stat_columns(select(Author).where(Author.id == 2))
+    assert first._generate_cache_key().key == second._generate_cache_key().key
+
+
+def test_stat_counters_take_bound_parameters():
+    assert "topic_id" in TOPIC_SHOUTS_STAT.compile().params
@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+
+from orm.shout import Shout, ShoutAuthor, ShoutTopic
+from services import related as related_module
+from services.redis import redis
+from services.related import RELATED_KEY, RELATED_TTL, compute_related, get_related_ids, update_related
+
+
+def test_compute_related_ranks_by_shared_topics_and_authors(db_session):
+    for shout_id in (201, 202, 203, 204):
+        db_session.add(
+            Shout(
+                id=shout_id,
+                slug=f"related-{shout_id}",
+                title="",
+                body="",
+                created_by=1,
+                community=1,
+                published_at=None if shout_id == 204 else 1,
+            )
+        )
+    db_session.flush()
+    db_session.add_all(
+        [
+            ShoutTopic(shout=201, topic=1),
+            ShoutTopic(shout=201, topic=2),
+            ShoutTopic(shout=202, topic=1),
+            ShoutTopic(shout=202, topic=2),
+            ShoutTopic(shout=203, topic=2),
+            ShoutTopic(shout=204, topic=1),
+            ShoutAuthor(shout=201, author=7),
+            ShoutAuthor(shout=203, author=7),
+        ]
+    )
+    db_session.flush()
+
+    related = compute_related(db_session, [201])
+
+    assert [neighbour for neighbour, _ in related[201]] == [202, 203]
+    assert related[201][0][1] > related[201][1][1]
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    client = FakeRedis(decode_responses=True)
+    monkeypatch.setattr(redis, "_client", client)
+    return client
+
+
+@pytest.mark.asyncio
+async def test_update_related_touches_only_existing_neighbour_sets(fake_redis, monkeypatch):
+    monkeypatch.setattr(
+        related_module, "load_related", lambda shout_ids, classifier=None: {301: [(302, 1.0), (303, 0.5)]}
+    )
+    await fake_redis.zadd(RELATED_KEY.format(302), {"299": 0.7})
+
+    await update_related(301)
+
+    assert await fake_redis.zrange(RELATED_KEY.format(302), 0, -1) == ["299", "301"]
+    assert 0 < await fake_redis.ttl(RELATED_KEY.format(302)) <= RELATED_TTL
+    assert not await fake_redis.exists(RELATED_KEY.format(303))
+
+
+@pytest.mark.asyncio
+async def test_related_miss_is_computed_in_background(fake_redis, monkeypatch):
+    calls = []
+
+    def load_related(shout_ids, classifier=None):
+        calls.append(shout_ids)
+        return {401: [(402, 1.0)]}
+
+    monkeypatch.setattr(related_module, "load_related", load_related)
+
+    assert await get_related_ids(401, 10) == []
+    assert await get_related_ids(401, 10) == []
+    for _ in range(20):
+        await asyncio.sleep(0.01)
+        if await fake_redis.exists(RELATED_KEY.format(401)):
+            break
+
+    assert calls == [[401]]
+    assert await get_related_ids(401, 10) == [(402, 1.0)]
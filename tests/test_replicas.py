@@ -0,0 +1,47 @@
+import math
+
+import pytest
+
+from cache import revalidator
+from services import db
+from services.db import ReplicaRouter, primary_only
+
+
+def test_replica_router(tmp_path):
+    router = ReplicaRouter([f"sqlite:///{tmp_path}/r1.db", f"sqlite:///{tmp_path}/r2.db"])
+    router.check_lag()
+    assert {router.choose() for _ in range(4)} == {0, 1}
+
+    router.lag[0] = math.inf
+    assert {router.choose() for _ in range(4)} == {1}
+
+    token = primary_only.set(True)
+    try:
+        assert router.choose() is None
+        assert router.engine() is db.engine
+    finally:
+        primary_only.reset(token)
+
+    router.lag[1] = db.DB_REPLICA_MAX_LAG + 1
+    assert router.url() == db.DB_URL
+
+
+@pytest.mark.asyncio
+async def test_revalidation_reads_from_primary(monkeypatch):
+    reads = []
+
+    async def get_cached_author(author_id, get_with_stat):
+        reads.append(primary_only.get())
+
+    async def cache_author(author):
+        pass
+
+    monkeypatch.setattr(revalidator, "get_cached_author", get_cached_author)
+    monkeypatch.setattr(revalidator, "cache_author", cache_author)
+    manager = revalidator.CacheRevalidationManager()
+    manager.mark_for_revalidation(1, "authors")
+
+    await manager.process_revalidation()
+
+    assert reads == [True]
+    assert not primary_only.get()
@@ -0,0 +1,96 @@
+import json
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+
+from orm.shout import Shout
+from services import search
+from services.redis import redis
+from services.search import (
+    SEARCH_CACHE_KEYS,
+    create_search_schema,
+    invalidate_search_cache,
+    normalize_query,
+    rebuild_search_documents,
+    search_cache_key,
+    search_documents,
+    search_text,
+    update_search_document,
+)
+
+
+def test_normalize_query_ignores_case_spaces_order_and_word_forms():
+    assert normalize_query("  Новая   Музыка! ") == normalize_query("музыка новая")
+    assert normalize_query("новой музыки") == normalize_query("новая музыка")
+    assert normalize_query("кот и пёс") == "и кот пес"
+
+
+def test_normalize_query_does_not_merge_unrelated_words():
+    assert search_cache_key("радость") != search_cache_key("рад")
+    assert search_cache_key("news") != search_cache_key("new")
+    assert search_cache_key("кот -пес") != search_cache_key("кот пес")
+    assert search_cache_key("кот кот пес") != search_cache_key("кот пес")
+
+
+class FakeSearchService:
+    enabled = True
+
+    def __init__(self, hits):
+        self.hits = hits
+        self.calls = 0
+
+    async def search(self, text, limit, offset):
+        self.calls += 1
+        return self.hits[text]
+
+
+@pytest.mark.asyncio
+async def test_indexing_drops_only_queries_with_changed_shouts(monkeypatch):
+    client = FakeRedis(decode_responses=True)
+    monkeypatch.setattr(redis, "_client", client)
+    service = FakeSearchService({"кот": [{"id": "1", "score": 2.0}], "пес": [{"id": "2", "score": 1.0}]})
+    monkeypatch.setattr(search, "search_service", service)
+
+    assert await search_text("кот") == [{"id": "1", "score": 2.0}]
+    assert await search_text("пес") == [{"id": "2", "score": 1.0}]
+    assert await search_text("кот") == [{"id": "1", "score": 2.0}]
+    assert service.calls == 2
+    # словоформы того же запроса отдаются из кэша без обращения к бэкенду
+    assert await search_text("Коты!") == [{"id": "1", "score": 2.0}]
+    assert service.calls == 2
+
+    await invalidate_search_cache(["1"])
+
+    assert await client.get(search_cache_key("кот")) is None
+    assert json.loads(await client.get(search_cache_key("пес"))) == [{"id": "2", "score": 1.0}]
+
+    await invalidate_search_cache()
+    assert await client.get(search_cache_key("пес")) is None
+    assert not await client.exists(SEARCH_CACHE_KEYS)
+
+
+def test_local_search_fts(db_session):
+    connection = db_session.connection()
+    create_search_schema(connection)
+    db_session.add_all(
+        [
+            Shout(
+                id=101, slug="music", title="Новая музыка", body="о музыке", created_by=1, community=1, published_at=1
+            ),
+            Shout(
+                id=102, slug="notes", title="Заметки", body="новой музыкой", created_by=1, community=1, published_at=1
+            ),
+            Shout(id=103, slug="draft", title="Музыка", body="черновик", created_by=1, community=1),
+        ]
+    )
+    db_session.flush()
+    rebuild_search_documents(connection)
+
+    hits = search_documents(connection, "музыки", 10, 0)
+    assert [hit["id"] for hit in hits] == ["101", "102"]
+
+    db_session.get(Shout, 102).title = "Другое"
+    db_session.flush()
+    update_search_document(connection, 102)
+    assert [hit["id"] for hit in search_documents(connection, "заметки", 10, 0)] == []
+    assert search_documents(connection, "!!!", 10, 0) == []
@@ -0,0 +1,34 @@
+from cache.typeahead import TypeaheadIndex
+
+
+def author(author_id, name, slug, followers):
+    return {"id": author_id, "name": name, "slug": slug, "stat": {"followers": followers}}
+
+
+def test_typeahead_prefix_ranked_by_followers():
+    index = TypeaheadIndex(("name", "slug"))
+    index.rebuild(
+        [
+            author(1, "Анна Иванова", "anna", 5),
+            author(2, "Андрей Белый", "belyi", 50),
+            author(3, "Борис", "boris", 100),
+        ]
+    )
+
+    assert [a["id"] for a in index.search("ан")] == [2, 1]
+    assert [a["id"] for a in index.search("Бел")] == [2]
+    assert [a["id"] for a in index.search("ан", limit=1)] == [2]
+    assert index.search(" ") == []
+
+
+def test_typeahead_upsert_and_remove():
+    index = TypeaheadIndex(("name", "slug"))
+    index.rebuild([author(1, "Анна", "anna", 5)])
+
+    index.upsert(author(1, "Ольга", "olga", 5))
+    assert index.search("ан") == []
+    assert [a["id"] for a in index.search("ол")] == [1]
+
+    index.remove(1)
+    assert index.search("ол") == []
+    assert index.entries == []
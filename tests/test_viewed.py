@@ -0,0 +1,159 @@
+import httpx
+import pytest
+from fakeredis.aioredis import FakeRedis
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.routing import Route
+
+from services import tracking
+from services.redis import redis
+from services.viewed import (
+    VIEWS_IDS_KEY,
+    VIEWS_SHOUTS_KEY,
+    VIEWS_TOPICS_KEY,
+    VIEWS_TRACKED_KEY,
+    VIEWS_VERSION_KEY,
+    VIEWS_WRITER_KEY,
+    ViewedStorage,
+)
+
+
+def test_view_totals_are_maintained_incrementally(monkeypatch):
+    monkeypatch.setattr(ViewedStorage, "views_by_shout", {"a": 10})
+    monkeypatch.setattr(ViewedStorage, "precounted_by_slug", {"a": 1})
+    for name in ("topics_by_shout", "authors_by_shout", "shouts_by_topic", "shouts_by_author", "slug_by_id"):
+        monkeypatch.setattr(ViewedStorage, name, {})
+    monkeypatch.setattr(ViewedStorage, "views_by_topic", {})
+    monkeypatch.setattr(ViewedStorage, "views_by_author", {})
+    ViewedStorage.apply_mappings({"a": {"art"}, "b": {"art", "music"}}, {"a": {"ivan"}, "b": {"ivan"}}, {1: "a"})
+
+    assert ViewedStorage.get_topic("art") == 10
+    assert ViewedStorage.get_author("ivan") == 10
+
+    ViewedStorage.set_shout_views("b", 5)
+    ViewedStorage.set_shout_views("a", 12)
+
+    assert ViewedStorage.get_topic("art") == 17
+    assert ViewedStorage.get_topic("music") == 5
+    assert ViewedStorage.get_author("ivan") == 17
+    assert ViewedStorage.get_shout(shout_id=1) == 13
+
+
+@pytest.mark.asyncio
+async def test_views_are_shared_through_redis(monkeypatch):
+    monkeypatch.setattr(redis, "_client", FakeRedis(decode_responses=True))
+    for name in ("views_by_shout", "views_by_topic", "views_by_author", "slug_by_id"):
+        monkeypatch.setattr(ViewedStorage, name, {})
+    monkeypatch.setattr(ViewedStorage, "version", None)
+
+    # воркер-лидер записывает изменения
+    ViewedStorage.views_by_shout = {"a": 3}
+    ViewedStorage.views_by_topic = {"art": 3}
+    ViewedStorage.slug_by_id = {1: "a"}
+    await ViewedStorage.publish_views({}, {}, {})
+    ViewedStorage.views_by_shout = {"a": 5}
+    ViewedStorage.views_by_topic = {"art": 5}
+    await ViewedStorage.publish_views({"a": 3}, {"art": 3}, {})
+
+    # другой воркер подхватывает снимок по новой версии
+    ViewedStorage.views_by_shout, ViewedStorage.views_by_topic, ViewedStorage.slug_by_id = {}, {}, {}
+    ViewedStorage.version = None
+    await ViewedStorage.load_snapshot()
+
+    assert ViewedStorage.views_by_shout == {"a": 5}
+    assert ViewedStorage.get_topic("art") == 5
+    assert ViewedStorage.slug_by_id == {1: "a"}
+
+
+@pytest.mark.asyncio
+async def test_stale_worker_does_not_double_count(monkeypatch):
+    client = FakeRedis(decode_responses=True)
+    monkeypatch.setattr(redis, "_client", client)
+    for name in ("views_by_shout", "views_by_topic", "views_by_author", "slug_by_id"):
+        monkeypatch.setattr(ViewedStorage, name, {})
+    monkeypatch.setattr(ViewedStorage, "topics_by_shout", {"a": {"art"}})
+    monkeypatch.setattr(ViewedStorage, "authors_by_shout", {})
+    monkeypatch.setattr(ViewedStorage, "version", None)
+    await client.hset(VIEWS_SHOUTS_KEY, mapping={"a": 5})
+    await client.hset(VIEWS_TOPICS_KEY, mapping={"art": 5})
+    await client.hset(VIEWS_IDS_KEY, mapping={1: "a", 3: "c"})
+    await client.set(VIEWS_VERSION_KEY, 1)
+
+    # снимок воркера отстал от Redis: другой воркер уже записал 5 просмотров
+    ViewedStorage.views_by_shout = {"a": 3}
+    ViewedStorage.views_by_topic = {"art": 3}
+
+    def change():
+        ViewedStorage.set_shout_views("a", 7)
+        ViewedStorage.slug_by_id = {1: "a", 2: "b"}
+
+    await ViewedStorage.write_views(change)
+
+    assert await client.hgetall(VIEWS_SHOUTS_KEY) == {"a": "7"}
+    assert await client.hgetall(VIEWS_TOPICS_KEY) == {"art": "7"}
+    assert await client.hgetall(VIEWS_IDS_KEY) == {"1": "a", "2": "b"}
+    assert not await client.exists(VIEWS_WRITER_KEY)
+
+
+@pytest.mark.asyncio
+async def test_tracked_views_are_deduplicated(monkeypatch):
+    monkeypatch.setattr(redis, "_client", FakeRedis(decode_responses=True))
+    monkeypatch.setattr(tracking, "published_slugs", lambda slugs: [slug for slug in slugs if slug != "draft"])
+    monkeypatch.setattr(ViewedStorage, "tracked_by_shout", {})
+    monkeypatch.setattr(ViewedStorage, "views_by_shout", {"a": 1})
+    monkeypatch.setattr(ViewedStorage, "precounted_by_slug", {})
+
+    await tracking.flush_views({"a": ["v1", "v2", "v1"], "draft": ["v1"]})
+    await tracking.flush_views({"a": ["v2", "v3"]})
+
+    assert ViewedStorage.tracked_by_shout == {"a": 3}
+    assert ViewedStorage.get_shout("a") == 3
+
+
+def test_visitor_is_derived_on_server():
+    def request(headers):
+        scope = {"type": "http", "headers": [(k.encode(), v.encode()) for k, v in headers.items()], "client": None}
+        return Request(scope)
+
+    browser = {"user-agent": "Firefox", "x-forwarded-for": "10.0.0.1"}
+    assert tracking.visitor_id(request(browser)) == tracking.visitor_id(request({**browser}))
+    assert tracking.visitor_id(request(browser)) != tracking.visitor_id(request({**browser, "user-agent": "Chrome"}))
+    # клиент не может подменить адрес, дописав свой X-Forwarded-For перед прокси
+    spoofed = {**browser, "x-forwarded-for": "1.2.3.4, 10.0.0.1"}
+    assert tracking.client_ip(request(spoofed)) == "10.0.0.1"
+
+
+@pytest.mark.asyncio
+async def test_track_is_rate_limited_per_ip(monkeypatch):
+    monkeypatch.setattr(redis, "_client", FakeRedis(decode_responses=True))
+    monkeypatch.setattr(tracking, "track_limiter", tracking.RateLimiter("track", 0.001, 2))
+    monkeypatch.setattr(tracking.view_tracker, "add", lambda slug, visitor: None)
+    app = Starlette(routes=[Route("/track", tracking.track_handler, methods=["POST"])])
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+
+        async def track(ip):
+            return (await client.post("/track", json={"slug": "a"}, headers={"x-forwarded-for": ip})).status_code
+
+        assert [await track("10.0.0.1") for _ in range(3)] == [204, 204, 429]
+        assert await track("10.0.0.2") == 204
+
+
+@pytest.mark.asyncio
+async def test_tracked_views_are_loaded_incrementally(monkeypatch):
+    client = FakeRedis(decode_responses=True)
+    monkeypatch.setattr(redis, "_client", client)
+    monkeypatch.setattr(tracking, "published_slugs", lambda slugs: slugs)
+    monkeypatch.setattr(ViewedStorage, "tracked_by_shout", {})
+    monkeypatch.setattr(ViewedStorage, "tracked_loaded_at", 0)
+    await client.hset(VIEWS_TRACKED_KEY, mapping={"old": 7})
+
+    await ViewedStorage.load_tracked()
+    assert ViewedStorage.tracked_by_shout == {"old": 7}
+
+    # другой воркер записал просмотры, старые счётчики не перечитываются
+    await tracking.flush_views({"new": ["v1"]})
+    ViewedStorage.tracked_by_shout = {"old": 7}
+    await client.hset(VIEWS_TRACKED_KEY, "old", 100)
+    await ViewedStorage.load_tracked()
+
+    assert ViewedStorage.tracked_by_shout == {"old": 7, "new": 1}